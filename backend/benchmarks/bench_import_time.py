@@ -0,0 +1,88 @@
+"""
+Import time of the app and its services, measured with `python -X importtime`
+in fresh interpreters.
+
+Run from the backend directory:
+    python -m benchmarks.bench_import_time --max-ms 1500
+
+Exits non-zero when a module takes longer than --max-ms, so it can guard
+against heavy dependencies creeping back into import time.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+MODULES = [
+    "main",
+    "services.cache",
+    "services.embedding_service",
+    "services.llm_client",
+    "services.llm_service",
+    "services.model_output_comparison",
+    "services.prompt_trimmer",
+    "services.token_tracker",
+]
+
+LINE_PATTERN = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_profile(module: str):
+    """Cumulative import time of module and its slowest dependencies, in ms"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "WARM_UP": "0"},
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    # Children are printed before their parent, indented two more spaces
+    total = 0.0
+    dependencies = []
+    for line in result.stderr.splitlines():
+        match = LINE_PATTERN.match(line)
+        if not match:
+            continue
+        cumulative_ms = int(match.group(2)) / 1000
+        depth = len(match.group(3))
+        name = match.group(4)
+        if depth == 1 and name == module:
+            total = cumulative_ms
+            break
+        if depth == 1:
+            dependencies = []  # an unrelated top-level import, e.g. from interpreter startup
+        elif depth == 3:
+            dependencies.append((cumulative_ms, name))
+    return total, sorted(dependencies, reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per module, the median is reported")
+    parser.add_argument("--top", type=int, default=3, help="slowest dependencies shown per module")
+    parser.add_argument("--max-ms", type=float, default=None, help="fail if a module takes longer")
+    args = parser.parse_args()
+
+    failed = []
+    for module in args.modules:
+        runs = [import_profile(module) for _ in range(args.repeat)]
+        total = statistics.median(total for total, _ in runs)
+        slowest = ", ".join(f"{name} {ms:.0f}ms" for ms, name in runs[-1][1][:args.top])
+        print(f"{module:<36} {total:>8.1f} ms   ({slowest})")
+        if args.max_ms is not None and total > args.max_ms:
+            failed.append(module)
+
+    if failed:
+        print(f"Import time above {args.max_ms} ms: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
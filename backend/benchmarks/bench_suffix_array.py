@@ -0,0 +1,87 @@
+"""
+Scaling of repeated-chunk detection (suffix array + LCP) with prompt size.
+
+Run from the backend directory:
+    python -m benchmarks.bench_suffix_array --sizes 1000 10000 100000 1000000
+
+Time per KB stays flat and the fitted exponent stays close to 1 when the
+construction is linear.
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from services.prompt_trimmer import SuffixArray, TextProcessor
+
+WORDS = (
+    "the model token prompt answer energy cost cache user request response "
+    "context document section summary value result system data query output"
+).split()
+
+
+def natural_text(rng: random.Random, size: int) -> str:
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:size]
+
+
+def log_text(rng: random.Random, size: int) -> str:
+    lines = []
+    length = 0
+    while length < size:
+        line = (
+            f"2024-11-{rng.randint(1, 30):02d} INFO services.cache - "
+            f"Successfully cached response for query: request {rng.randint(0, 50)}\n"
+        )
+        lines.append(line)
+        length += len(line)
+    return "".join(lines)[:size]
+
+
+def naive_suffix_array(text: str):
+    """The previous implementation, for comparison on small inputs"""
+    return [pos for _, pos in sorted((text[i:], i) for i in range(len(text)))]
+
+
+def timed(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--naive-limit", type=int, default=20_000, help="largest size to time the old implementation on")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    processor = TextProcessor()
+
+    for kind, generate in (("natural", natural_text), ("logs", log_text)):
+        print(f"\n{kind} text")
+        print(f"{'size':>9} {'chunks s':>10} {'us/KB':>9} {'SA s':>9} {'naive SA s':>11}")
+        sizes, seconds = [], []
+        for size in args.sizes:
+            text = generate(rng, size)
+            elapsed = timed(processor.find_repeated_chunks, text, 15, 2)
+            sa_elapsed = timed(SuffixArray(text).build_suffix_array)
+            naive = f"{timed(naive_suffix_array, text):>11.3f}" if size <= args.naive_limit else f"{'-':>11}"
+            print(f"{size:>9} {elapsed:>10.3f} {elapsed / size * 1e9:>9.1f} {sa_elapsed:>9.3f} {naive}")
+            sizes.append(size)
+            seconds.append(elapsed)
+
+        if len(sizes) > 1:
+            exponent = np.polyfit(np.log(sizes), np.log(seconds), 1)[0]
+            print(f"fitted exponent (time ~ size^k): k = {exponent:.2f}")
+
+
+if __name__ == "__main__":
+    main()
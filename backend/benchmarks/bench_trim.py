@@ -0,0 +1,77 @@
+"""
+Trims per second of TextProcessor.trim against the previous NLTK pipeline
+(word_tokenize, list-based punctuation filter, fresh stemmer per call).
+
+Run from the backend directory:
+    python -m benchmarks.bench_trim --sizes 500 5000 50000 --stemmer porter
+
+The previous pipeline needs the NLTK punkt data.
+"""
+import argparse
+import random
+import time
+
+import nltk
+
+from services.prompt_trimmer import _create_stemmer, TextProcessor
+from benchmarks.bench_suffix_array import natural_text
+
+LEGACY_PUNCTUATION = [".", ",", "'", '"', "!", "?", ";", ":", "-"]
+
+
+def legacy_trim_words(processor: TextProcessor, text: str, stemmer: str = None) -> str:
+    """The word-level part of trim() before the fused pipeline"""
+    tokenized = nltk.word_tokenize(text)
+    tokenized = [word for word in tokenized if word not in LEGACY_PUNCTUATION]
+    tokenized = [word for word in tokenized if word.lower() not in processor.words_to_exclude]
+    words = tokenized
+    if stemmer:
+        stemmer_instance = _create_stemmer(stemmer, processor.language)
+        words = [stemmer_instance.stem(word) for word in tokenized]
+        restored = []
+        for stemmed, original in zip(words, tokenized):
+            if original.istitle():
+                stemmed = stemmed.title()
+            elif original.isupper():
+                stemmed = stemmed.upper()
+            restored.append(stemmed)
+        words = restored
+    return "".join(words)
+
+
+def rate(func, seconds: float) -> float:
+    """Calls per second of func, measured for roughly the given time"""
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        func()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return calls / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 5_000, 50_000])
+    parser.add_argument("--stemmer", choices=["porter", "snowball", "lancaster"], default=None)
+    parser.add_argument("--seconds", type=float, default=2.0, help="measuring time per case")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    processor = TextProcessor()
+
+    print(f"{'size':>7} {'legacy/s':>10} {'fused/s':>10} {'speedup':>8} {'full trim/s':>12}")
+    for size in args.sizes:
+        text = natural_text(rng, size)
+        legacy = rate(lambda: legacy_trim_words(processor, text, args.stemmer), args.seconds)
+        fused = rate(
+            lambda: processor.trim(text, stemmer=args.stemmer, remove_chunks=False), args.seconds
+        )
+        full = rate(lambda: processor.trim(text, stemmer=args.stemmer), args.seconds)
+        print(f"{size:>7} {legacy:>10.1f} {fused:>10.1f} {fused / legacy:>7.1f}x {full:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
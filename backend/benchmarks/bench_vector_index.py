@@ -0,0 +1,72 @@
+"""
+Lookup latency of the cache vector index backends as the cache grows.
+
+Run from the backend directory:
+    python -m benchmarks.bench_vector_index --sizes 1000 10000 100000 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from services.vector_index import create_index, normalize
+
+
+def random_vectors(rng: np.random.Generator, n: int, dim: int) -> np.ndarray:
+    return normalize(rng.standard_normal((n, dim), dtype=np.float32))
+
+
+def bench(backend: str, size: int, dim: int, queries: int, rng: np.random.Generator) -> dict:
+    index = create_index(backend, dim, capacity=size)
+    data = random_vectors(rng, size, dim)
+
+    start = time.perf_counter()
+    for vector in data:
+        index.add(vector)
+    build_seconds = time.perf_counter() - start
+
+    # Perturbed copies of stored vectors, so the true best match is known
+    targets = rng.integers(0, size, queries)
+    noisy = normalize(data[targets] + 0.1 * random_vectors(rng, queries, dim))
+
+    latencies = []
+    hits = 0
+    for target, query in zip(targets, noisy):
+        start = time.perf_counter()
+        matches = index.search(query, k=1)
+        latencies.append(time.perf_counter() - start)
+        hits += bool(matches) and matches[0][0] == target
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "backend": backend,
+        "size": size,
+        "build_s": build_seconds,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "recall@1": hits / queries,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--backends", nargs="+", default=["exact", "ivf"])
+    parser.add_argument("--dim", type=int, default=384)  # all-MiniLM-L6-v2
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'backend':<8} {'size':>9} {'build s':>9} {'p50 ms':>9} {'p99 ms':>9} {'recall@1':>9}")
+    for size in args.sizes:
+        for backend in args.backends:
+            r = bench(backend, size, args.dim, args.queries, rng)
+            print(
+                f"{r['backend']:<8} {r['size']:>9} {r['build_s']:>9.2f} "
+                f"{r['p50_ms']:>9.3f} {r['p99_ms']:>9.3f} {r['recall@1']:>9.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Minimal OpenAI-compatible chat completions server (plain and streamed) for
+local testing and benchmarks, with configurable latency and injected 429/500
+errors.
+
+Run from the backend directory:
+    python -m benchmarks.fake_openai --port 8001 --latency 0.2 --error-rate 0.05
+
+and point the app at it:
+    OPENAI_BASE_URL=http://localhost:8001/v1 OPENAI_API_KEY=fake uvicorn main:app
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def count_tokens(text: str) -> int:
+    """Rough token count, about four characters per token"""
+    return max(1, len(text) // 4)
+
+
+def fake_answer(prompt: str, max_tokens: int = None) -> str:
+    """Deterministic answer that echoes the start of the prompt"""
+    words = prompt.split()
+    answer = "Answer: " + " ".join(words[:40])
+    if max_tokens:
+        answer = answer[:max_tokens * 4]
+    pair_ids = re.findall(r'<pair id="(\d+)">', prompt)
+    if pair_ids:
+        # Batched similarity judge prompt, answered with JSON
+        pairs = prompt.split("<pair id=")[1:]
+        return json.dumps({"results": [
+            {"id": int(pair_id), "justification": "Fake judgement.", "score": 50 + len(pair) % 51}
+            for pair_id, pair in zip(pair_ids, pairs)
+        ]})
+    if "<score>" in prompt:
+        # Similarity judge prompt
+        answer = f"<justification>Fake judgement.</justification>\n<score>{50 + len(prompt) % 51}</score>"
+    return answer
+
+
+async def stream_chunks(completion_id: str, model: str, answer: str, usage: dict, token_latency: float, include_usage: bool):
+    """Server-sent events of a streamed completion, one word per chunk"""
+    def event(choices, **extra):
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": choices,
+            **extra,
+        }
+        return f"data: {json.dumps(chunk)}\n\n"
+
+    yield event([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+    for piece in re.findall(r"\s*\S+", answer):
+        await asyncio.sleep(token_latency)
+        yield event([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+    yield event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+    if include_usage:
+        yield event([], usage=usage)
+    yield "data: [DONE]\n\n"
+
+
+def create_app(
+    latency: float = 0.1,
+    jitter: float = 0.05,
+    error_rate: float = 0.0,
+    retry_after: float = 0.1,
+    token_latency: float = 0.01,
+):
+    app = FastAPI()
+    app.state.requests = 0
+    app.state.errors = 0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        await asyncio.sleep(max(0.0, random.gauss(latency, jitter)))
+
+        if random.random() < error_rate:
+            app.state.errors += 1
+            status = random.choice([429, 500])
+            return JSONResponse(
+                status_code=status,
+                content={"error": {"message": f"Injected error {status}", "type": "fake_error", "code": None}},
+                headers={"retry-after": str(retry_after)} if status == 429 else None,
+            )
+
+        prompt = "\n".join(message.get("content") or "" for message in body.get("messages", []))
+        answer = fake_answer(prompt, body.get("max_tokens"))
+        prompt_tokens = count_tokens(prompt)
+        completion_tokens = count_tokens(answer)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = body.get("model", "gpt-4o-mini")
+        if body.get("stream"):
+            include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+            return StreamingResponse(
+                stream_chunks(completion_id, model, answer, usage, token_latency, include_usage),
+                media_type="text/event-stream",
+            )
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": answer},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": usage,
+        }
+
+    @app.get("/stats")
+    async def stats():
+        return {"requests": app.state.requests, "errors": app.state.errors}
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.1, help="mean response time in seconds")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="delay between streamed chunks")
+    parser.add_argument("--jitter", type=float, default=0.05, help="standard deviation of the response time")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 429/500")
+    parser.add_argument("--retry-after", type=float, default=0.1, help="Retry-After sent with 429 responses")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    app = create_app(args.latency, args.jitter, args.error_rate, args.retry_after, args.token_latency)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+"""
+Load test of the API against the fake OpenAI server: requests per second,
+latency percentiles, event loop lag and memory of the API process for each
+scenario at fixed concurrency levels.
+
+Run from the backend directory:
+    python -m benchmarks.load_test --concurrency 1 8 32 --duration 10 --out results.json
+
+This starts benchmarks.fake_openai and the app (uvicorn main:app, pointed at
+the fake server, with its ledger and caches in a temporary directory) on free
+ports and stops them afterwards. To test an app that
+is already running, pass --app-url; it must use the fake server given with
+--llm-url (or one started by this script on --llm-port).
+
+Scenarios:
+    optimize         POST /optimize-prompt with a new prompt every request
+    optimize-repeat  POST /optimize-prompt with a small pool of repeated prompts
+                     (trim cache, request coalescing, semantic cache lookups)
+    analyze          POST /analyze
+    cache            POST /test: semantic cache lookup and save, no LLM call
+
+Prompts are drawn from a mix of short questions, medium and long documents.
+The results are written as JSON; with --baseline, the requests per second and
+p95 latency are compared with an earlier results file.
+"""
+from typing import Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+from benchmarks.bench_suffix_array import natural_text
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ["optimize", "optimize-repeat", "analyze", "cache"]
+# (prompt size in characters, share of requests)
+PROMPT_MIX = ((200, 0.6), (2_000, 0.3), (8_000, 0.1))
+REPEATED_PROMPTS = 20
+QUESTIONS = [
+    "Summarize the following text.",
+    "What are the main points of this text?",
+    "Translate the following text to German.",
+    "Answer briefly: what is this text about?",
+]
+
+SAMPLE_PATTERN = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+LABEL_PATTERN = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+class PromptMix:
+    """Prompts of random sizes according to PROMPT_MIX"""
+
+    def __init__(self, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.repeated = [self.prompt() for _ in range(REPEATED_PROMPTS)]
+
+    def prompt(self) -> str:
+        size = self.rng.choices([size for size, _ in PROMPT_MIX], [share for _, share in PROMPT_MIX])[0]
+        return f"{self.rng.choice(QUESTIONS)}\n\n{natural_text(self.rng, size)}"
+
+    def request(self, scenario: str) -> Tuple[str, dict]:
+        """Path and JSON body of the next request of a scenario"""
+        if scenario == "optimize":
+            return "/optimize-prompt", {"prompt": self.prompt()}
+        if scenario == "optimize-repeat":
+            return "/optimize-prompt", {"prompt": self.rng.choice(self.repeated)}
+        if scenario == "analyze":
+            prompt = self.prompt()
+            words = prompt.split()
+            return "/analyze", {
+                "originalPrompt": prompt,
+                "optimizedPrompt": " ".join(words[: max(1, len(words) * 2 // 3)]),
+                "originalAnswer": natural_text(self.rng, 600),
+                "optimizedAnswer": natural_text(self.rng, 600),
+            }
+        if scenario == "cache":
+            return "/test", {"prompt": self.rng.choice(self.repeated)}
+        raise ValueError(f"Unknown scenario: {scenario}")
+
+
+def parse_metrics(text: str) -> Dict[str, List[Tuple[Dict[str, str], float]]]:
+    """Samples of a Prometheus text exposition by metric name"""
+    samples: Dict[str, List[Tuple[Dict[str, str], float]]] = {}
+    for line in text.splitlines():
+        match = SAMPLE_PATTERN.match(line)
+        if match is None:
+            continue
+        name, labels, value = match.groups()
+        samples.setdefault(name, []).append((dict(LABEL_PATTERN.findall(labels or "")), float(value)))
+    return samples
+
+
+def lag_histogram(samples: dict) -> Tuple[List[float], List[float], float]:
+    """Bucket bounds, cumulative counts and sum of the event loop lag histogram"""
+    buckets = samples.get("tokenterminator_event_loop_lag_seconds_bucket", [])
+    bounds = [float(labels["le"]) for labels, _ in buckets]
+    counts = [value for _, value in buckets]
+    total = samples.get("tokenterminator_event_loop_lag_seconds_sum", [({}, 0.0)])[0][1]
+    return bounds, counts, total
+
+
+def lag_summary(before: dict, after: dict) -> Optional[Dict[str, float]]:
+    """Mean and upper bounds of p99 and max event loop lag between two scrapes, in milliseconds"""
+    bounds, counts_after, sum_after = lag_histogram(after)
+    _, counts_before, sum_before = lag_histogram(before)
+    if not bounds:
+        return None
+    counts = [a - b for a, b in zip(counts_after, counts_before or [0.0] * len(bounds))]
+    if not counts[-1]:
+        return None
+
+    def upper_bound(quantile: float) -> float:
+        for bound, count in zip(bounds, counts):
+            if count >= quantile * counts[-1]:
+                return bound * 1000
+        return float("inf")
+
+    return {
+        "mean": (sum_after - sum_before) / counts[-1] * 1000,
+        "p99_le": upper_bound(0.99),
+        "max_le": upper_bound(1.0),
+    }
+
+
+def resident_memory(samples: dict) -> Optional[float]:
+    values = samples.get("process_resident_memory_bytes")
+    return values[0][1] / 2**20 if values else None
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_process(args: List[str], env: Optional[dict] = None) -> subprocess.Popen:
+    # Log to a file rather than a pipe that nobody reads during the run
+    log = tempfile.TemporaryFile()
+    process = subprocess.Popen(
+        [sys.executable, *args], cwd=BACKEND_DIR, env={**os.environ, **(env or {})},
+        stdout=subprocess.DEVNULL, stderr=log,
+    )
+    process.log = log
+    return process
+
+
+def wait_until_ready(url: str, process: Optional[subprocess.Popen] = None, timeout: float = 300.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            process.log.seek(0)
+            raise RuntimeError(f"{url} exited on startup:\n{process.log.read().decode(errors='replace')}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not start within {timeout:.0f}s")
+
+
+async def scrape(client: httpx.AsyncClient) -> dict:
+    try:
+        response = await client.get("/metrics")
+        response.raise_for_status()
+    except httpx.HTTPError:
+        return {}
+    return parse_metrics(response.text)
+
+
+async def run_scenario(
+    client: httpx.AsyncClient, mix: PromptMix, scenario: str, concurrency: int, duration: float
+) -> dict:
+    """Keep concurrency requests of a scenario in flight for duration seconds"""
+    await client.delete("/cache")
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    peak_rss = []
+
+    async def worker(deadline: float):
+        while time.perf_counter() < deadline:
+            path, body = mix.request(scenario)
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, json=body)
+                error = None if response.status_code < 400 else str(response.status_code)
+            except httpx.HTTPError as e:
+                error = type(e).__name__
+            if error is None:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors[error] = errors.get(error, 0) + 1
+
+    async def sample_memory():
+        while True:
+            rss = resident_memory(await scrape(client))
+            if rss is not None:
+                peak_rss.append(rss)
+            await asyncio.sleep(1.0)
+
+    before = await scrape(client)
+    sampler = asyncio.create_task(sample_memory())
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(start + duration) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    sampler.cancel()
+    after = await scrape(client)
+
+    result = {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "latency_ms": None,
+        "event_loop_lag_ms": lag_summary(before, after),
+        "rss_mb": {"start": resident_memory(before), "end": resident_memory(after), "peak": max(peak_rss, default=None)},
+    }
+    if latencies:
+        milliseconds = np.array(latencies) * 1000
+        p50, p95, p99 = np.percentile(milliseconds, [50, 95, 99])
+        result["latency_ms"] = {
+            "mean": float(milliseconds.mean()), "p50": float(p50), "p95": float(p95), "p99": float(p99),
+            "max": float(milliseconds.max()),
+        }
+    return result
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(runs: List[dict], baseline: Optional[List[dict]] = None):
+    previous = {(run["scenario"], run["concurrency"]): run for run in baseline or []}
+    print(
+        f"{'scenario':<16} {'conc':>4} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+        f"{'errors':>6} {'lag p99':>8} {'rss MB':>7}" + (f" {'rps vs base':>11} {'p95 vs base':>11}" if baseline else "")
+    )
+    for run in runs:
+        latency = run["latency_ms"] or {"p50": float("nan"), "p95": float("nan"), "p99": float("nan")}
+        lag = run["event_loop_lag_ms"]
+        rss = run["rss_mb"]["peak"] or run["rss_mb"]["end"]
+        line = (
+            f"{run['scenario']:<16} {run['concurrency']:>4} {run['rps']:>8.1f} {latency['p50']:>8.1f} "
+            f"{latency['p95']:>8.1f} {latency['p99']:>8.1f} {sum(run['errors'].values()):>6} "
+            f"{'<=' + format(lag['p99_le'], 'g') if lag else '-':>8} {format(rss, '.0f') if rss else '-':>7}"
+        )
+        base = previous.get((run["scenario"], run["concurrency"]))
+        if base is not None:
+            rps_change = (run["rps"] / base["rps"] - 1) * 100 if base["rps"] else float("nan")
+            p95_change = (
+                (latency["p95"] / base["latency_ms"]["p95"] - 1) * 100
+                if base["latency_ms"] and run["latency_ms"] else float("nan")
+            )
+            line += f" {rps_change:>+10.1f}% {p95_change:>+10.1f}%"
+        print(line)
+
+
+async def run(args) -> dict:
+    mix = PromptMix(args.seed)
+    runs = []
+    async with httpx.AsyncClient(base_url=args.app_url, timeout=args.timeout, limits=httpx.Limits(max_connections=None)) as client:
+        for scenario in args.scenarios:
+            for concurrency in args.concurrency:
+                result = await run_scenario(client, mix, scenario, concurrency, args.duration)
+                print(f"{scenario} x{concurrency}: {result['rps']:.1f} req/s", file=sys.stderr)
+                runs.append(result)
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "settings": {
+            "duration": args.duration,
+            "llm_latency": args.llm_latency,
+            "token_latency": args.token_latency,
+            "prompt_mix": PROMPT_MIX,
+            "seed": args.seed,
+            "app_url": args.app_url if args.external_app else None,
+        },
+        "runs": runs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="requests in flight")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario and concurrency")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="response time of the fake LLM")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="delay between streamed chunks of the fake LLM")
+    parser.add_argument("--llm-port", type=int, default=None, help="port of the fake LLM started here, free by default")
+    parser.add_argument("--llm-url", default=None, help="use a running fake LLM instead of starting one")
+    parser.add_argument("--app-url", default=None, help="test a running app instead of starting one")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per request, in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="load_test.json", help="JSON results file")
+    parser.add_argument("--baseline", default=None, help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    processes = []
+    # The app's ledger, judge cache and cache store must not touch the real data files
+    data_dir = tempfile.TemporaryDirectory(prefix="load_test-")
+    try:
+        if args.llm_url is None:
+            port = args.llm_port or free_port()
+            args.llm_url = f"http://127.0.0.1:{port}/v1"
+            processes.append(start_process([
+                "-m", "benchmarks.fake_openai", "--port", str(port), "--latency", str(args.llm_latency),
+                "--token-latency", str(args.token_latency), "--seed", str(args.seed),
+            ]))
+            wait_until_ready(f"http://127.0.0.1:{port}/stats", processes[-1])
+
+        args.external_app = args.app_url is not None
+        if not args.external_app:
+            port = free_port()
+            args.app_url = f"http://127.0.0.1:{port}"
+            env = {
+                "OPENAI_BASE_URL": args.llm_url,
+                "OPENAI_API_KEY": "fake",
+                "LEDGER_PATH": os.path.join(data_dir.name, "savings_ledger.sqlite3"),
+                "JUDGE_CACHE_PATH": os.path.join(data_dir.name, "judge_cache.sqlite3"),
+                "BASELINE_LOG_PATH": os.path.join(data_dir.name, "baseline_pairs.jsonl"),
+            }
+            # The semantic cache stays in memory unless a persistent store was asked for
+            if os.getenv("CACHE_STORE_PATH"):
+                env["CACHE_STORE_PATH"] = os.path.join(data_dir.name, "cache_store")
+            processes.append(start_process(
+                ["-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"], env=env,
+            ))
+            wait_until_ready(f"{args.app_url}/cache", processes[-1])
+
+        results = asyncio.run(run(args))
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+        data_dir.cleanup()
+
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["runs"]
+    print_results(results["runs"], baseline)
+    print(f"Results written to {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
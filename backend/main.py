@@ -1,44 +1,97 @@
 import asyncio
-import os
+import json
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from typing import List, Literal, Optional, Tuple
 from dotenv import load_dotenv
-from fastapi import FastAPI, Depends
-from pydantic import BaseModel
+from fastapi import BackgroundTasks, FastAPI, Depends, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
 from fastapi.middleware.cors import CORSMiddleware
+from services.llm_client import close_llm_client, get_llm_client
+from services.metrics import CACHE_ENTRIES, REQUEST_SECONDS, monitor_event_loop, render_metrics
+from services.profiler import ALLOW_PROFILING, SamplingProfiler, get_profile, store_profile
 from services.llm_service import LLMInteractionService
 from services.model_output_comparison import ModelOutputComparison
-from services.prompt_trimmer import TextProcessor
+from services.judge_cache import get_judge_cache
+from services.prompt_trimmer2 import CompressionQueueFull, PromptCompressionService
+from services.prompt_trimmer import get_text_processor, get_trim_cache, shutdown_trim_pool
 from services.token_tracker import TokenTracker
 from services.energy_calculator import EnergyCalculator
+from services.model_profiles import DEFAULT_MODEL, MODEL_PROFILES
 from services.cache import CacheService
+from services.request_coalescer import RequestCoalescer
+from services.trim_planner import plan_trim
+from services.savings_ledger import LEDGER_WINDOW_SECONDS, LedgerEntry, SavingsLedger
+from services.serving import SERVING_MODE, SPECULATIVE_CACHE_THRESHOLD, TRIM_BACKEND, BaselineRecorder
+from services.startup import WARM_UP, ensure_nltk_resources, warm_up
 
-# load OpenAI API key from .env
+# load OpenAI API key (and optionally OPENAI_BASE_URL) from .env
 load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
 
 
 # Inject Services
 def get_llm_service():
-    return LLMInteractionService(api_key=api_key)
+    return LLMInteractionService(get_llm_client())
 
 
 def get_comparison_service():
     return ModelOutputComparison()
 
 
-def get_token_tracker():
-    return TokenTracker()
+def get_token_tracker(model: str = DEFAULT_MODEL):
+    return TokenTracker(model)
 
 
-def get_energy_calculator():
-    return EnergyCalculator()
+@lru_cache(maxsize=None)
+def get_energy_calculator(model: str = DEFAULT_MODEL):
+    return EnergyCalculator(model)
 
 
 def get_cache_service():
     return CacheService()
 
 
+def get_baseline_recorder():
+    return BaselineRecorder()
+
+
+def get_savings_ledger():
+    return SavingsLedger()
+
+
+def get_request_coalescer():
+    return RequestCoalescer()
+
+
+def get_compression_service():
+    return PromptCompressionService()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Fail fast on missing NLTK data instead of on the first request
+    ensure_nltk_resources()
+    # Load models and start the trim worker processes before accepting traffic
+    if WARM_UP:
+        await warm_up()
+    get_llm_client()
+    lag_monitor = asyncio.create_task(monitor_event_loop())
+    SavingsLedger().start()
+    yield
+    lag_monitor.cancel()
+    await SavingsLedger().close()
+    if CacheService._instance is not None:
+        CacheService().flush()
+    shutdown_trim_pool()
+    await close_llm_client()
+
+
 # Initialize the FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -53,17 +106,62 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """Time every request, and profile it when asked to with the X-Profile header"""
+    profiler = None
+    if ALLOW_PROFILING and request.headers.get("x-profile") == "1":
+        profiler = SamplingProfiler().start()
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - start,
+        method=request.method,
+        path=route.path if route is not None else "unmatched",
+        status=str(response.status_code),
+    )
+    if profiler is not None:
+        response.headers["X-Profile-Id"] = store_profile(profiler.stop())
+    return response
+
+
+class TrimPassReport(BaseModel):
+    name: str
+    latencyMs: float
+    tokens: int  # token count after the pass
+
+
+class TrimReport(BaseModel):
+    backend: str
+    latencyMs: float
+    compressionRatio: float  # original size per optimized size, in tokens unless the backend is "rules"
+    originalTokens: Optional[int] = None
+    compressedTokens: Optional[int] = None
+    fallback: bool = False  # llmlingua was needed but its queue was full
+    # adaptive only: the passes that ran, in order, and whether the budget was met
+    passes: Optional[List[TrimPassReport]] = None
+    budgetMet: Optional[bool] = None
+
+
 # Define response model
 class GreenGPTResponse(BaseModel):
     optimizedPrompt: str
     optimizedAnswer: str
     originalAnswer: str
     isCached: bool = False
+    trimReport: Optional[TrimReport] = None
+
+
+class BatchOptimizeResponse(BaseModel):
+    optimizedPrompts: List[str]
 
 
 class AnalysisResponse(BaseModel):
-    similarityScoreCosine: float  # Assume a similarity score (0 to 1)
-    similarityScoreGPT: float
+    # Similarity scores (0 to 1); None when there was no original answer to compare,
+    # and the GPT score also when the judge gave no score
+    similarityScoreCosine: Optional[float]
+    similarityScoreGPT: Optional[float]
     originalTokens: int
     optimizedTokens: int
     tokenSavings: int
@@ -72,9 +170,24 @@ class AnalysisResponse(BaseModel):
     costSavedDollars: float
 
 
+# Models with a profile (tokenizer, prompt token price, energy use)
+ModelName = Literal[tuple(MODEL_PROFILES)]
+
+
 # Define request model
 class PromptRequest(BaseModel):
     prompt: str = "Example prompt"
+    backend: Optional[Literal["rules", "llmlingua", "adaptive"]] = None  # defaults to TRIM_BACKEND
+    # llmlingua only: share of tokens to keep
+    rate: Optional[float] = Field(default=None, gt=0, le=1)
+    # llmlingua and adaptive: token budget; adaptive without a budget runs every rule based pass
+    targetTokens: Optional[int] = Field(default=None, gt=0)
+    model: ModelName = DEFAULT_MODEL  # answers both prompts; adaptive budgets are counted with its tokenizer
+
+
+# Define request model
+class BatchPromptRequest(BaseModel):
+    prompts: List[str] = ["Example prompt"]
 
 
 # Define request model
@@ -83,15 +196,76 @@ class AnalyzePromptRequest(BaseModel):
     optimizedPrompt: str = "Optimzed prompt"
     originalAnswer: str = "Original Answer"
     optimizedAnswer: str = "Optimized Answer"
+    model: ModelName = DEFAULT_MODEL  # tokenizer, prompt token price and energy use of this model
+
+
+async def trim_prompt(request: PromptRequest) -> Tuple[str, TrimReport]:
+    """Trim the prompt with the requested backend and report how long it took and how much it shrank"""
+    backend = request.backend or TRIM_BACKEND
+    start = time.perf_counter()
+    if backend == "adaptive":
+        plan = await plan_trim(request.prompt, request.targetTokens, model_name=request.model)
+        return plan.text, TrimReport(
+            backend=backend,
+            latencyMs=(time.perf_counter() - start) * 1000,
+            compressionRatio=plan.original_tokens / plan.tokens if plan.tokens else 0.0,
+            originalTokens=plan.original_tokens,
+            compressedTokens=plan.tokens,
+            fallback=plan.fallback,
+            passes=[
+                TrimPassReport(name=report.name, latencyMs=report.seconds * 1000, tokens=report.tokens)
+                for report in plan.passes
+            ],
+            budgetMet=plan.budget_met,
+        )
+    if backend == "llmlingua":
+        try:
+            result = await get_compression_service().compress(
+                request.prompt, rate=request.rate, target_tokens=request.targetTokens
+            )
+            return result.prompt, TrimReport(
+                backend=backend,
+                latencyMs=result.latency_seconds * 1000,
+                compressionRatio=result.compression_ratio,
+                originalTokens=result.original_tokens,
+                compressedTokens=result.compressed_tokens,
+            )
+        except CompressionQueueFull:
+            # Do not queue up behind the model; the rule based trimmer is fast
+            fallback = True
+    else:
+        fallback = False
+
+    processor = get_text_processor()
+    trimmed_prompt = await processor.trim_async(request.prompt)
+    return trimmed_prompt, TrimReport(
+        backend="rules",
+        latencyMs=(time.perf_counter() - start) * 1000,
+        compressionRatio=len(request.prompt) / len(trimmed_prompt) if trimmed_prompt else 0.0,
+        fallback=fallback,
+    )
+
+
+def trim_variant(request: PromptRequest) -> str:
+    """Requests only share an answer when their prompts are trimmed the same way and sent to the same model"""
+    return f"{request.model}:{request.backend or TRIM_BACKEND}:{request.rate}:{request.targetTokens}"
 
 
 # Sample endpoint that returns the JSON
 @app.post("/optimize-prompt", response_model=GreenGPTResponse)
 async def optimize_prompt(
     request: PromptRequest,
+    background_tasks: BackgroundTasks,
     llm_service: LLMInteractionService = Depends(get_llm_service),
     cache_service: CacheService = Depends(get_cache_service),
+    baseline_recorder: BaselineRecorder = Depends(get_baseline_recorder),
+    request_coalescer: RequestCoalescer = Depends(get_request_coalescer),
 ):
+    if SERVING_MODE == "speculative":
+        return await optimize_prompt_speculative(
+            request, background_tasks, llm_service, cache_service, baseline_recorder, request_coalescer
+        )
+
     result = await cache_service.check_cache(request.prompt)
     if result.cached and False:  # disable caching for now.
         response = GreenGPTResponse(
@@ -102,63 +276,228 @@ async def optimize_prompt(
         )
         return response
 
-    AI_COMPRESS = False
-    if AI_COMPRESS:
-        from services.prompt_trimmer2 import trim
+    async def answer():
+        trimmed_prompt, trim_report = await trim_prompt(request)
 
-        trimmed_prompt = trim(request.prompt)
-    else:
-        processor = TextProcessor()
-        trimmed_prompt = processor.trim(request.prompt)
+        original_answer, optimized_answer = await asyncio.gather(
+            llm_service.get_answer(request.prompt, request.model),
+            llm_service.get_answer(trimmed_prompt, request.model),
+        )
 
-    original_answer, optimized_answer = await asyncio.gather(
-        llm_service.get_answer(request.prompt), llm_service.get_answer(trimmed_prompt)
-    )
+        # The semantic cache is keyed by prompt only, so it holds answers of the default model
+        if request.model == DEFAULT_MODEL:
+            await cache_service.save_cache(request.prompt, optimized_answer)
+
+        response = GreenGPTResponse(
+            optimizedPrompt=trimmed_prompt,
+            optimizedAnswer=optimized_answer,
+            originalAnswer=original_answer,
+            isCached=False,
+            trimReport=trim_report,
+        )
+        return response
+
+    # Concurrent requests for the same prompt share one answer. Similar prompts
+    # do not: both of their answers are returned for comparison.
+    return await request_coalescer.run(request.prompt, answer, variant=trim_variant(request), exact=True)
+
+
+async def merge_answer_streams(**streams):
+    """
+    Interleave several answer streams, yielding (name, delta) as deltas arrive.
+    The first error of any stream is raised right away and the other streams
+    are cancelled.
+    """
+    queue = asyncio.Queue()
+    done = object()
+
+    async def pump(name, stream):
+        try:
+            async for delta in stream:
+                await queue.put((name, delta))
+        except Exception as e:
+            await queue.put((name, e))
+        else:
+            await queue.put((name, done))
+
+    tasks = [asyncio.create_task(pump(name, stream)) for name, stream in streams.items()]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            name, delta = await queue.get()
+            if delta is done:
+                remaining -= 1
+            elif isinstance(delta, Exception):
+                raise delta
+            else:
+                yield name, delta
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@app.post("/optimize-prompt/stream")
+async def optimize_prompt_stream(
+    request: PromptRequest,
+    llm_service: LLMInteractionService = Depends(get_llm_service),
+    cache_service: CacheService = Depends(get_cache_service),
+):
+    """
+    Streaming /optimize-prompt as newline-delimited JSON. The trimmed prompt is
+    sent first, then the deltas of the original and optimized answers as they
+    arrive, and finally the token usage of both completions:
+
+        {"type": "prompt", "optimizedPrompt": "...", "trimReport": {...}}
+        {"type": "delta", "answer": "original" | "optimized", "content": "..."}
+        {"type": "usage", "original": {...}, "optimized": {...}}
+    """
+    trimmed_prompt, trim_report = await trim_prompt(request)
+
+    async def events():
+        yield json.dumps(
+            {"type": "prompt", "optimizedPrompt": trimmed_prompt, "trimReport": trim_report.model_dump()}
+        ) + "\n"
+
+        answers = {"original": [], "optimized": []}
+        usage = {"original": None, "optimized": None}
+        try:
+            async for name, delta in merge_answer_streams(
+                original=llm_service.stream_answer(request.prompt, request.model),
+                optimized=llm_service.stream_answer(trimmed_prompt, request.model),
+            ):
+                if delta.usage is not None:
+                    usage[name] = delta.usage
+                if delta.content:
+                    answers[name].append(delta.content)
+                    yield json.dumps({"type": "delta", "answer": name, "content": delta.content}) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "message": str(e)}) + "\n"
+            return
+
+        yield json.dumps({"type": "usage", **usage}) + "\n"
+        if request.model == DEFAULT_MODEL:
+            await cache_service.save_cache(request.prompt, "".join(answers["optimized"]))
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+async def optimize_prompt_speculative(
+    request: PromptRequest,
+    background_tasks: BackgroundTasks,
+    llm_service: LLMInteractionService,
+    cache_service: CacheService,
+    baseline_recorder: BaselineRecorder,
+    request_coalescer: RequestCoalescer,
+) -> GreenGPTResponse:
+    """
+    Cache first, then the optimized prompt only. The original prompt is only
+    answered for a sample of the requests, whose answer pairs are recorded
+    after the response is sent. Unanswered fields are "None", like for cache hits.
+    """
+    result = await cache_service.check_cache(request.prompt, threshold=SPECULATIVE_CACHE_THRESHOLD)
+    if result.cached and request.model == DEFAULT_MODEL:
+        return GreenGPTResponse(
+            optimizedPrompt="None",
+            optimizedAnswer=result.answer,
+            originalAnswer="None",
+            isCached=True,
+        )
 
-    cache_service.save_cache(request.prompt, optimized_answer)
+    async def answer():
+        trimmed_prompt, trim_report = await trim_prompt(request)
+
+        if baseline_recorder.should_sample():
+            original_answer, optimized_answer = await asyncio.gather(
+                llm_service.get_answer(request.prompt, request.model),
+                llm_service.get_answer(trimmed_prompt, request.model),
+            )
+            background_tasks.add_task(
+                baseline_recorder.record, request.prompt, trimmed_prompt, original_answer, optimized_answer
+            )
+        else:
+            original_answer = "None"
+            optimized_answer = await llm_service.get_answer(trimmed_prompt, request.model)
+
+        # The semantic cache is keyed by prompt only, so it holds answers of the default model
+        if request.model == DEFAULT_MODEL:
+            await cache_service.save_cache(request.prompt, optimized_answer)
+
+        return GreenGPTResponse(
+            optimizedPrompt=trimmed_prompt,
+            optimizedAnswer=optimized_answer,
+            originalAnswer=original_answer,
+            isCached=False,
+            trimReport=trim_report,
+        )
 
-    response = GreenGPTResponse(
-        optimizedPrompt=trimmed_prompt,
-        optimizedAnswer=optimized_answer,
-        originalAnswer=original_answer,
-        isCached=False,
+    # Concurrent requests for the same or a similar prompt share one answer
+    return await request_coalescer.run(
+        request.prompt, answer, threshold=SPECULATIVE_CACHE_THRESHOLD, variant=trim_variant(request)
     )
-    return response
+
+
+@app.post("/optimize-prompts/batch", response_model=BatchOptimizeResponse)
+async def optimize_prompts_batch(request: BatchPromptRequest):
+    """Trim many prompts in parallel on the trim process pool"""
+    processor = get_text_processor()
+    trimmed_prompts = await processor.trim_many_async(request.prompts)
+    return BatchOptimizeResponse(optimizedPrompts=trimmed_prompts)
 
 
 @app.post("/analyze", response_model=AnalysisResponse)
 async def analyze(
     req: AnalyzePromptRequest,
     comparison_service: ModelOutputComparison = Depends(get_comparison_service),
-    token_tracker: TokenTracker = Depends(get_token_tracker),
-    energy_calculator: EnergyCalculator = Depends(get_energy_calculator),
+    savings_ledger: SavingsLedger = Depends(get_savings_ledger),
 ):
+    # Tokens, energy and cost are those of the model the prompts are sent to
+    token_tracker = get_token_tracker(req.model)
+    energy_calculator = get_energy_calculator(req.model)
+
+    # A cached answer has no optimized prompt and nothing to compare
+    is_cached = req.optimizedPrompt == "None"
+    # Speculative serving answers the original prompt only for a sample of the requests
+    has_original_answer = req.originalAnswer != "None"
+
+    async def similarity_scores():
+        if is_cached:
+            return 0.0, 0.0
+        if not has_original_answer:
+            return None, None
+        return await comparison_service.compare(
+            req.originalPrompt, req.originalAnswer, req.optimizedAnswer
+        )
 
-    # Calculate similarity
-    similarity_score_cosine = comparison_service.calculate_similarity(
-        req.originalAnswer, req.optimizedAnswer
-    )
-    similarity_score_gpt = comparison_service.gpt_similarity(
-        req.originalPrompt, req.originalAnswer, req.optimizedAnswer
-    )
-    # Calculate token counts and savings
-    original_tokens = token_tracker.count_tokens(req.originalPrompt)
-    optimized_tokens = token_tracker.count_tokens(req.optimizedPrompt)
-    token_savings = token_tracker.optimized_tokens(
-        req.originalPrompt, req.optimizedPrompt
-    )
-    token_savings_percentage = token_tracker.calculate_token_savings_percentage(
-        req.originalPrompt, req.optimizedPrompt
+    # The GPT judge, the embeddings and the tokenizer run concurrently, so the
+    # latency is that of the slowest part. Tokenizing runs in a worker thread.
+    (similarity_score_cosine, similarity_score_gpt), savings = await asyncio.gather(
+        similarity_scores(),
+        asyncio.to_thread(token_tracker.savings_report, req.originalPrompt, req.optimizedPrompt),
     )
+    original_tokens = savings.original_tokens
+    optimized_tokens = savings.optimized_tokens
+    token_savings = savings.token_savings
+    token_savings_percentage = savings.token_savings_percentage
     # Calculate energy and cost savings
     energy_saved_watts = energy_calculator.calculate_energy_saving(token_savings)
     cost_saved_dollars = energy_calculator.calculate_cost_saving(token_savings)
 
-    if req.optimizedPrompt == "None":
+    if is_cached:
 
         energy_saved_watts = energy_calculator.calculate_energy_saving(original_tokens)
         cost_saved_dollars = energy_calculator.calculate_cost_saving(original_tokens)
 
+        savings_ledger.record(LedgerEntry(
+            timestamp=time.time(),
+            model=req.model,
+            original_tokens=original_tokens,
+            optimized_tokens=0,
+            token_savings=token_savings,
+            energy_saved_wh=energy_saved_watts,
+            cost_saved_dollars=cost_saved_dollars,
+            cached=True,
+        ))
         return AnalysisResponse(
             similarityScoreCosine=0,
             similarityScoreGPT=0,
@@ -180,22 +519,96 @@ async def analyze(
         energySavedWatts=energy_saved_watts,
         costSavedDollars=cost_saved_dollars,
     )
+    savings_ledger.record(LedgerEntry(
+        timestamp=time.time(),
+        model=req.model,
+        original_tokens=original_tokens,
+        optimized_tokens=optimized_tokens,
+        token_savings=token_savings,
+        energy_saved_wh=energy_saved_watts,
+        cost_saved_dollars=cost_saved_dollars,
+    ))
     return response
 
 
+@app.get("/savings")
+async def get_savings(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    model: Optional[str] = None,
+    groupBy: Optional[Literal["model", "window"]] = None,
+    savings_ledger: SavingsLedger = Depends(get_savings_ledger),
+):
+    """
+    Token, energy and cost savings recorded by /analyze, from the per window
+    aggregates of the ledger. since and until are widened to whole windows.
+    """
+    total, groups = await savings_ledger.totals(
+        since.timestamp() if since else None, until.timestamp() if until else None, model, groupBy
+    )
+    return {
+        "windowSeconds": LEDGER_WINDOW_SECONDS,
+        "totals": asdict(total),
+        "groups": [
+            {
+                **({"model": key[0]} if groupBy == "model" else
+                   {"windowStart": datetime.fromtimestamp(key[0], timezone.utc).isoformat()}),
+                **asdict(totals),
+            }
+            for key, totals in groups.items()
+        ],
+    }
+
+
 @app.post("/test")
 async def test_cache(
     request: PromptRequest, cache_service: CacheService = Depends(get_cache_service)
 ):
     result = await cache_service.check_cache(request.prompt)
     test_answer = f"This is a test answer for: {request.prompt}"
-    cache_service.save_cache(request.prompt, test_answer)
+    await cache_service.save_cache(request.prompt, test_answer)
 
     return {"querry": request.prompt, "answer": result.answer, "cached": result.cached}
 
 
+@app.get("/cache")
+async def get_cache_stats(cache_service: CacheService = Depends(get_cache_service)):
+    """Report cache size, memory footprint and hit/miss/eviction counters"""
+    return asdict(await asyncio.to_thread(cache_service.get_stats))
+
+
+@app.get("/trim-cache")
+async def get_trim_cache_stats():
+    """Report trim result cache size, hit rate and time saved"""
+    return asdict(get_trim_cache().get_stats())
+
+
+@app.get("/judge-cache")
+async def get_judge_cache_stats():
+    """Report the number of cached GPT judge scores and the hit rate"""
+    return asdict(await asyncio.to_thread(get_judge_cache().get_stats))
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics: stage and request latencies, LLM tokens, cache lookups, event loop lag, memory"""
+    CACHE_ENTRIES.set((await asyncio.to_thread(CacheService().get_stats)).entries, cache="semantic")
+    CACHE_ENTRIES.set(get_trim_cache().get_stats().entries, cache="trim")
+    CACHE_ENTRIES.set((await asyncio.to_thread(get_judge_cache().get_stats)).entries, cache="judge")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/metrics/profiles/{profile_id}", response_class=PlainTextResponse)
+async def profile(profile_id: str):
+    """Folded stacks of a request profiled with the X-Profile: 1 header"""
+    folded_stacks = get_profile(profile_id)
+    if folded_stacks is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return folded_stacks
+
+
 @app.delete("/cache")
 async def delete_cache(cache_service: CacheService = Depends(get_cache_service)):
     """Delete all entries from the cache"""
-    cache_service.clear_cache()
+    await asyncio.to_thread(cache_service.clear_cache)
     return {"message": "Cache cleared successfully"}
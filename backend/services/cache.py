@@ -1,8 +1,16 @@
-from dataclasses import dataclass
-from typing import Dict, List, Tuple
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+import asyncio
 import logging
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+import os
+import threading
+import time
+import numpy as np
+from services.cache_store import DiskCacheStore, MemoryCacheStore
+from services.embedding_service import EmbeddingService
+from services.metrics import CACHE_LOOKUPS, timed
+from services.vector_index import create_index
 
 # Configure logging
 logging.basicConfig(
@@ -15,71 +23,270 @@ logger = logging.getLogger(__name__)
 class CacheResult:
     answer: str
     cached: bool
+    similarity: float = 0.0
+
+@dataclass
+class CacheStats:
+    store: str
+    entries: int
+    capacity: int
+    eviction_policy: str
+    ttl_seconds: Optional[float]
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    embedding_bytes: int
+    metadata_bytes: int
+    payload_bytes: int  # live entries only
+    payload_log_bytes: int  # on disk, including records of overwritten and evicted entries
+    total_bytes: int
+    hit_similarity: Dict[str, float] = field(default_factory=dict)
 
 class CacheService:
+    """
+    Semantic cache of answers keyed by query embedding.
+
+    Embeddings are computed on the event loop; lookups and writes run in
+    worker threads, since they may wait for the store lock held by another
+    worker, append to the payload log or compact it. A process-local lock
+    keeps those threads from changing the index under each other.
+    """
     _instance = None
-    _cache: Dict[str, str] = {}
-    _embeddings: Dict[str, List[float]] = {}
     _similarity_threshold = 0.85  # ADJUST HERE!!!!!!
+    _index_backend = os.getenv("CACHE_INDEX_BACKEND", "exact")  # "exact" or "ivf" (approximate, for large caches)
+    _capacity = 10_000  # maximum number of cached queries
+    _eviction_policy = "lru"  # "lru" or "lfu"
+    _ttl_seconds: Optional[float] = 24 * 60 * 60  # None disables expiry
+    _embedding_dtype = np.float32  # np.float16 halves the embedding memory
+    _similarity_window = 1000  # number of recent hit similarities kept for stats
+    # Directory of a persistent store shared by all workers; None keeps the cache in memory
+    _store_path: Optional[str] = os.getenv("CACHE_STORE_PATH")
 
     # Singleton pattern
     def __new__(cls):
         if cls._instance is None:
+            if cls._eviction_policy not in ("lru", "lfu"):
+                raise ValueError("Eviction policy must be one of ('lru', 'lfu')")
             cls._instance = super().__new__(cls)
-            cls._instance.model = SentenceTransformer('all-MiniLM-L6-v2')
+            cls._instance.embedding_service = EmbeddingService()
+            cls._instance._init_storage()
         return cls._instance
 
-    def _compute_embedding(self, text: str) -> List[float]:
-        return self.model.encode(text).tolist()
-
-    def _find_similar_query(self, query: str) -> Tuple[str, float]:
-        query_embedding = self._compute_embedding(query)
-        
-        max_similarity = 0
-        most_similar_key = None
-
-        for cached_key, cached_embedding in self._embeddings.items():
-            # Use sklearn's cosine_similarity like in ModelOutputComparison
-            similarity = cosine_similarity([query_embedding], [cached_embedding])[0][0]
-            
-            if similarity > max_similarity:
-                max_similarity = similarity
-                most_similar_key = cached_key
-
-        return most_similar_key, max_similarity
-
-    async def check_cache(self, key: str) -> CacheResult:
-        # First, try to find a semantically similar query
-        similar_key, similarity = self._find_similar_query(key)
-        
-        if similar_key and similarity >= self._similarity_threshold:
-            logger.info(f"Found semantically similar cache entry. Similarity: {similarity:.2f}")
+    def _init_storage(self):
+        # All per-entry state is preallocated for the full capacity and indexed by slot
+        dim = self.embedding_service.dim
+        if self._store_path:
+            self.store = DiskCacheStore(self._store_path, self._capacity, dim, self._embedding_dtype)
+        else:
+            self.store = MemoryCacheStore(self._capacity, dim, self._embedding_dtype)
+        self.meta = self.store.meta
+        options = {}
+        if self._store_path and self._index_backend == "ivf":
+            # Share the centroids and cell assignment with the other workers instead of retraining
+            options["state_dir"] = self._store_path
+        with self.store.lock():
+            self.index = create_index(
+                self._index_backend,
+                dim,
+                matrix=self.store.embeddings,
+                valid=self.meta["valid"],
+                **options,
+            )
+        self._generation = self.store.generation
+        self._synced_at = time.time()
+        # Guards the index and counters; taken before the store lock
+        self._lock = threading.RLock()
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._hit_similarities = deque(maxlen=self._similarity_window)
+
+    @timed("compute_embedding")
+    async def _compute_embedding(self, text: str) -> np.ndarray:
+        return await self.embedding_service.encode(text)
+
+    def _sync(self):
+        """Pick up entries other worker processes wrote to a shared store"""
+        generation = self.store.generation
+        if generation == self._generation:
+            return
+        now = time.time()
+        # Writes and removals stamp last_access, so only the slots stamped since
+        # the last sync are refreshed. Allow for writers that stamped an entry
+        # just before our last sync.
+        changed = np.flatnonzero(self.meta["last_access"] >= self._synced_at - 1.0)
+        self.index.refresh(changed)
+        self._generation = generation
+        self._synced_at = now
+
+    def _is_expired(self, slot: int, now: float) -> bool:
+        return self._ttl_seconds is not None and now - self.meta["created_at"][slot] > self._ttl_seconds
+
+    def _remove_slot(self, slot: int):
+        self.index.remove(slot)
+        self.meta["last_access"][slot] = time.time()  # lets other workers see the removal
+        self.store.free_payload(slot)
+
+    def _purge_expired(self, now: float):
+        if self._ttl_seconds is None:
+            return
+        slots = self.index.slots()
+        for slot in slots[now - self.meta["created_at"][slots] > self._ttl_seconds]:
+            self._remove_slot(int(slot))
+            self._expirations += 1
+
+    def _evict(self):
+        """Free one slot, preferring expired entries over the eviction policy"""
+        self._purge_expired(time.time())
+        if len(self.index) < self._capacity:
+            return
+
+        slots = self.index.slots()
+        last_access = self.meta["last_access"][slots]
+        if self._eviction_policy == "lfu":
+            # Least frequently used, ties broken by least recently used
+            victim = slots[np.lexsort((last_access, self.meta["access_count"][slots]))[0]]
+        else:
+            victim = slots[np.argmin(last_access)]
+        self._remove_slot(int(victim))
+        self._evictions += 1
+
+    def _free_slot(self) -> int:
+        if len(self.index) >= self._capacity:
+            self._evict()
+        return self.index.free_slot()
+
+    def _find_similar_query(self, query_embedding: np.ndarray) -> Tuple[Optional[int], float]:
+        self._sync()
+        now = time.time()
+
+        while True:
+            matches = self.index.search(query_embedding, k=1)
+            if not matches:
+                return None, 0
+
+            slot, similarity = matches[0]
+            if not self._is_expired(slot, now):
+                return slot, similarity
+            # Drop the stale entry and look for the next best one
+            with self.store.lock():
+                self._remove_slot(slot)
+                self.store.commit()
+            self._expirations += 1
+
+    @timed("check_cache")
+    async def check_cache(self, key: str, threshold: Optional[float] = None) -> CacheResult:
+        """Look up a semantically similar query; threshold overrides the default similarity threshold"""
+        if threshold is None:
+            threshold = self._similarity_threshold
+        embedding = await self._compute_embedding(key)
+        return await asyncio.to_thread(self._lookup, embedding, threshold)
+
+    def _lookup(self, embedding: np.ndarray, threshold: float) -> CacheResult:
+        with self._lock:
+            # First, try to find a semantically similar query
+            slot, similarity = self._find_similar_query(embedding)
+
+            if slot is not None and similarity >= threshold:
+                logger.info(f"Found semantically similar cache entry. Similarity: {similarity:.2f}")
+                self._hits += 1
+                CACHE_LOOKUPS.inc(cache="semantic", result="hit")
+                self._hit_similarities.append(similarity)
+                self.meta["last_access"][slot] = time.time()
+                self.meta["access_count"][slot] += 1
+                _, answer = self.store.read_payload(slot)
+                return CacheResult(
+                    answer=answer,
+                    cached=True,
+                    similarity=similarity
+                )
+
+            self._misses += 1
+            CACHE_LOOKUPS.inc(cache="semantic", result="miss")
             return CacheResult(
-                answer=self._cache[similar_key],
-                cached=True
+                answer="None",
+                cached=False,
+                similarity=similarity
             )
-        
-        return CacheResult(
-            answer="None",
-            cached=False
-        )
 
-    def save_cache(self, query: str, answer: str) -> bool:
+    @timed("save_cache")
+    async def save_cache(self, query: str, answer: str) -> bool:
         try:
             # Compute embedding first to ensure it succeeds before saving
-            embedding = self._compute_embedding(query)  # Changed to query instead of answer
-            
-            # Save both cache and embedding if computation succeeds
-            self._cache[query] = answer
-            self._embeddings[query] = embedding
-            
+            embedding = await self._compute_embedding(query)  # Changed to query instead of answer
+            await asyncio.to_thread(self._save, query, answer, embedding)
             logger.info(f"Successfully cached response for query: {query[:50]}...")  # Truncate long queries in logs
             return True
         except Exception as e:
             logger.error(f"Failed to cache response: {str(e)}")
             return False
 
+    def _save(self, query: str, answer: str, embedding: np.ndarray):
+        with self._lock, self.store.lock():
+            self._sync()
+            # Overwrite the entry of an identical query instead of storing it twice
+            slot, similarity = self._find_similar_query(embedding)
+            if slot is None or similarity < 0.9999 or self.store.read_payload(slot)[0] != query:
+                slot = self._free_slot()
+            else:
+                self._remove_slot(slot)
+
+            # Write payload and metadata before the embedding marks the slot valid
+            now = time.time()
+            self.store.write_payload(slot, query, answer)
+            self.meta["created_at"][slot] = now
+            self.meta["last_access"][slot] = now
+            self.meta["access_count"][slot] = 0
+            self.index.set(slot, embedding)
+            self.store.commit()
+
+    def get_stats(self) -> CacheStats:
+        """Report size, memory footprint and hit/miss/eviction counters; may wait for the cache lock"""
+        with self._lock:
+            return self._get_stats()
+
+    def _get_stats(self) -> CacheStats:
+        self._sync()
+        hit_similarity = {}
+        if self._hit_similarities:
+            similarities = np.fromiter(self._hit_similarities, dtype=np.float64)
+            hit_similarity = {
+                "count": len(similarities),
+                "mean": float(similarities.mean()),
+                "min": float(similarities.min()),
+                "p50": float(np.percentile(similarities, 50)),
+                "max": float(similarities.max()),
+            }
+        payload_bytes = self.store.payload_bytes
+        return CacheStats(
+            store=self.store.name,
+            entries=len(self.index),
+            capacity=self._capacity,
+            eviction_policy=self._eviction_policy,
+            ttl_seconds=self._ttl_seconds,
+            hits=self._hits,
+            misses=self._misses,
+            evictions=self._evictions,
+            expirations=self._expirations,
+            embedding_bytes=self.index.nbytes,
+            metadata_bytes=self.meta.nbytes,
+            payload_bytes=payload_bytes,
+            payload_log_bytes=self.store.log_bytes,
+            total_bytes=self.index.nbytes + self.meta.nbytes + payload_bytes,
+            hit_similarity=hit_similarity,
+        )
+
+    def flush(self):
+        """Write a persistent store's memory-mapped state to disk"""
+        with self.store.lock():
+            self.store.flush()
+
     def clear_cache(self):
         """Clear all entries from the cache"""
-        self._cache = {}
-        self._embeddings = {}
+        with self._lock, self.store.lock():
+            self.store.clear()
+            self.index.clear()
+        self._generation = self.store.generation
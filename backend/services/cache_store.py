@@ -0,0 +1,229 @@
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+import fcntl
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Per-entry metadata, one record per cache slot
+META_DTYPE = np.dtype([
+    ("valid", "?"),
+    ("created_at", "f8"),
+    ("last_access", "f8"),  # also stamped when the slot is written or freed, see CacheService._sync
+    ("access_count", "i8"),
+    ("offset", "i8"),  # position of the payload record in the log (disk store only)
+    ("length", "i8"),
+])
+
+
+class MemoryCacheStore:
+    """Keeps embeddings, metadata and payloads of the semantic cache in process memory"""
+
+    name = "memory"
+
+    def __init__(self, capacity: int, dim: int, dtype=np.float32):
+        self.embeddings = np.zeros((capacity, dim), dtype=dtype)
+        self.meta = np.zeros(capacity, dtype=META_DTYPE)
+        self._payloads: List[Optional[Tuple[str, str]]] = [None] * capacity
+        self.payload_bytes = 0
+        self._lock = threading.RLock()
+
+    @property
+    def generation(self) -> int:
+        # Only this process writes to the store, so it never changes behind our back
+        return 0
+
+    @contextmanager
+    def lock(self):
+        with self._lock:
+            yield
+
+    def write_payload(self, slot: int, query: str, answer: str):
+        self.free_payload(slot)
+        self._payloads[slot] = (query, answer)
+        self.payload_bytes += sys.getsizeof(query) + sys.getsizeof(answer)
+
+    @property
+    def log_bytes(self) -> int:
+        # Nothing is kept for dead entries
+        return self.payload_bytes
+
+    def read_payload(self, slot: int) -> Tuple[str, str]:
+        return self._payloads[slot]
+
+    def free_payload(self, slot: int):
+        if self._payloads[slot] is not None:
+            query, answer = self._payloads[slot]
+            self.payload_bytes -= sys.getsizeof(query) + sys.getsizeof(answer)
+            self._payloads[slot] = None
+
+    def commit(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def clear(self):
+        self.meta[:] = 0
+        self._payloads = [None] * len(self._payloads)
+        self.payload_bytes = 0
+
+
+class DiskCacheStore:
+    """
+    Persistent cache store shared by all worker processes on a host.
+
+    Layout of the store directory:
+        embeddings.npy  memory-mapped (capacity, dim) embedding matrix
+        meta.npy        memory-mapped per-slot metadata (META_DTYPE)
+        header.npy      memory-mapped write generation, bumped on every change
+        payloads.log    append-only JSON lines holding the query and answer
+
+    Opening the store only maps the files, so even millions of entries reopen
+    in milliseconds, and all processes read the same pages from the page cache.
+    Payloads are read lazily with pread when an entry is hit. Readers and
+    writers serialize on an flock.
+
+    Overwritten and evicted entries leave dead records in the log. Once more
+    than _compact_dead_fraction of a log of at least _compact_min_bytes is dead,
+    commit() rewrites it with the live records only and atomically replaces it;
+    other processes notice the new file and reopen it.
+    """
+
+    name = "disk"
+    _compact_dead_fraction = 0.5
+    _compact_min_bytes = 1 << 20
+
+    def __init__(self, path: str, capacity: int, dim: int, dtype=np.float32):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._lock_depth = 0
+        self._lock_file = open(os.path.join(path, "lock"), "a+")
+
+        with self.lock():
+            self.embeddings = self._open_array("embeddings.npy", np.dtype(dtype), (capacity, dim))
+            self.meta = self._open_array("meta.npy", META_DTYPE, (capacity,))
+            self._header = self._open_array("header.npy", np.dtype("u8"), (1,))
+            self._log_path = os.path.join(path, "payloads.log")
+            if os.path.exists(self._log_path + ".compact"):
+                # Left behind by a compaction that did not finish; the log itself is intact
+                os.remove(self._log_path + ".compact")
+            self._log = open(self._log_path, "ab+")
+
+        logger.info(f"Opened disk cache store at {path} with {int(self.meta['valid'].sum())} entries")
+
+    def _open_array(self, name: str, dtype: np.dtype, shape: Tuple[int, ...]) -> np.memmap:
+        file_path = os.path.join(self.path, name)
+        if not os.path.exists(file_path):
+            return np.lib.format.open_memmap(file_path, mode="w+", dtype=dtype, shape=shape)
+
+        array = np.lib.format.open_memmap(file_path, mode="r+")
+        if array.dtype != dtype or array.shape != shape:
+            raise ValueError(
+                f"Cache store {file_path} has shape {array.shape} and dtype {array.dtype}, "
+                f"expected {shape} and {dtype}"
+            )
+        return array
+
+    @property
+    def generation(self) -> int:
+        return int(self._header[0])
+
+    @property
+    def payload_bytes(self) -> int:
+        """Size of the live payload records"""
+        return int(self.meta["length"][self.meta["valid"]].sum())
+
+    @property
+    def log_bytes(self) -> int:
+        """Size of the payload log, dead records included"""
+        return os.fstat(self._log.fileno()).st_size
+
+    @contextmanager
+    def lock(self):
+        # Reentrant: only the outermost holder takes and releases the flock
+        with self._thread_lock:
+            if self._lock_depth == 0:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _reopen_log(self):
+        """Switch to the current log file if another process compacted it"""
+        if os.stat(self._log_path).st_ino != os.fstat(self._log.fileno()).st_ino:
+            self._log.close()
+            self._log = open(self._log_path, "ab+")
+
+    def write_payload(self, slot: int, query: str, answer: str):
+        self._reopen_log()
+        record = json.dumps({"query": query, "answer": answer}).encode() + b"\n"
+        offset = os.fstat(self._log.fileno()).st_size
+        self._log.write(record)
+        self._log.flush()
+        self.meta["offset"][slot] = offset
+        self.meta["length"][slot] = len(record)
+
+    def read_payload(self, slot: int) -> Tuple[str, str]:
+        with self.lock():
+            self._reopen_log()
+            record = json.loads(os.pread(
+                self._log.fileno(), int(self.meta["length"][slot]), int(self.meta["offset"][slot])
+            ))
+        return record["query"], record["answer"]
+
+    def free_payload(self, slot: int):
+        # The log is append-only; the record just becomes unreachable
+        pass
+
+    def commit(self):
+        """Publish changes to other processes; call with the lock held"""
+        log_bytes = self.log_bytes
+        if log_bytes >= self._compact_min_bytes and log_bytes - self.payload_bytes > self._compact_dead_fraction * log_bytes:
+            self.compact()
+        self._header[0] += 1
+
+    def compact(self):
+        """Rewrite the payload log with the records of valid slots only"""
+        with self.lock():
+            self._reopen_log()
+            log_bytes = self.log_bytes
+            slots = np.flatnonzero(self.meta["valid"])
+            offsets = np.empty(slots.size, dtype=np.int64)
+            position = 0
+            with open(self._log_path + ".compact", "wb") as compacted:
+                for i, slot in enumerate(slots.tolist()):
+                    length = int(self.meta["length"][slot])
+                    compacted.write(os.pread(self._log.fileno(), length, int(self.meta["offset"][slot])))
+                    offsets[i] = position
+                    position += length
+                compacted.flush()
+                os.fsync(compacted.fileno())
+            os.replace(self._log_path + ".compact", self._log_path)
+            self.meta["offset"][slots] = offsets
+            self.meta.flush()
+            self._reopen_log()
+        logger.info(f"Compacted cache payload log from {log_bytes} to {position} bytes")
+
+    def flush(self):
+        self.embeddings.flush()
+        self.meta.flush()
+        self._header.flush()
+
+    def clear(self):
+        self._reopen_log()
+        self.meta[:] = 0
+        self.meta["last_access"] = time.time()  # every slot changed
+        self._log.truncate(0)
+        self.commit()
@@ -0,0 +1,113 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+import asyncio
+import hashlib
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def text_digest(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class EmbeddingService:
+    """
+    Process-wide sentence embedding engine.
+
+    The model is loaded once and runs on a dedicated thread, so encoding never
+    blocks the event loop. Concurrent encode() calls arriving within a short
+    window are merged into one batched forward pass, and embeddings are memoized
+    by text hash. All embeddings are L2-normalized.
+    """
+    _instance = None
+    _model_name = 'all-MiniLM-L6-v2'
+    _batch_window = 0.005  # seconds to wait for more requests before encoding
+    _max_batch_size = 64
+    _memo_size = 10_000  # number of embeddings kept in the LRU memo
+
+    # Singleton pattern
+    def __new__(cls):
+        if cls._instance is None:
+            # Imported lazily: importing sentence_transformers loads torch
+            from sentence_transformers import SentenceTransformer
+
+            cls._instance = super().__new__(cls)
+            cls._instance.model = SentenceTransformer(cls._model_name)
+            cls._instance.dim = cls._instance.model.get_sentence_embedding_dimension()
+            cls._instance._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding")
+            cls._instance._memo = OrderedDict()
+            cls._instance._pending = {}  # text digest -> future of its embedding
+            cls._instance._pending_texts = {}  # text digest -> text
+            cls._instance._flush_handle = None
+            cls._instance._batches = set()  # running batch tasks
+        return cls._instance
+
+    def _remember(self, digest: bytes, embedding: np.ndarray):
+        self._memo[digest] = embedding
+        self._memo.move_to_end(digest)
+        while len(self._memo) > self._memo_size:
+            self._memo.popitem(last=False)
+
+    def _lookup(self, digest: bytes):
+        embedding = self._memo.get(digest)
+        if embedding is not None:
+            self._memo.move_to_end(digest)
+        return embedding
+
+    async def encode(self, text: str) -> np.ndarray:
+        """Embed a single text, batched together with concurrent callers"""
+        digest = text_digest(text)
+        embedding = self._lookup(digest)
+        if embedding is not None:
+            return embedding
+
+        future = self._pending.get(digest)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending[digest] = future
+            self._pending_texts[digest] = text
+            if len(self._pending) >= self._max_batch_size:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_later(self._batch_window, self._flush)
+        return await asyncio.shield(future)
+
+    async def encode_many(self, texts: List[str]) -> np.ndarray:
+        return np.stack(await asyncio.gather(*(self.encode(text) for text in texts)))
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, texts = self._pending, self._pending_texts
+        self._pending, self._pending_texts = {}, {}
+        if batch:
+            task = asyncio.ensure_future(self._run_batch(batch, texts))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch: Dict[bytes, asyncio.Future], texts: Dict[bytes, str]):
+        loop = asyncio.get_running_loop()
+        try:
+            embeddings = await loop.run_in_executor(
+                self._executor,
+                lambda: self.model.encode(
+                    list(texts.values()), batch_size=self._max_batch_size, normalize_embeddings=True
+                ),
+            )
+        except Exception as e:
+            logger.error(f"Failed to encode batch of {len(batch)} texts: {str(e)}")
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (digest, future), embedding in zip(batch.items(), embeddings):
+            embedding = embedding.astype(np.float32)
+            self._remember(digest, embedding)
+            if not future.done():
+                future.set_result(embedding)
@@ -1,21 +1,36 @@
+from typing import Optional, Sequence, Union
+import numpy as np
+from services.model_profiles import DEFAULT_MODEL, get_model_profile
+
+# A token count, or an array of them for batch reports
+TokenCounts = Union[int, Sequence[int], np.ndarray]
+
+
+def _scale(tokens: TokenCounts, rate: float) -> Union[float, np.ndarray]:
+    result = np.asarray(tokens, dtype=np.float64) * rate
+    return float(result) if result.ndim == 0 else result
+
+
 class EnergyCalculator:
-    def __init__(self, watt_per_token: float = 0.0002, cost_per_token: float = 0.0000025):
+    def __init__(
+        self, model_name: str = DEFAULT_MODEL, watt_per_token: Optional[float] = None, cost_per_token: Optional[float] = None
+    ):
         """
-        Initialize the EnergyCalculator with a watt per token and cost per token.
-        
+        Initialize the EnergyCalculator with the energy use and prices of a model.
+
         Parameters:
-        - watt_per_token: Estimated watt-hours used per token (default: 0.0002 Wh).
-        - cost_per_token: Estimated cost per token in dollars (default: $0.000002).
+        - model_name: Model profile to use (default: gpt-4o-mini).
+        - watt_per_token: Watt-hours used per prompt token, overriding the profile.
+        - cost_per_token: Cost per prompt token in dollars, overriding the profile.
         """
-        self.watt_per_token = watt_per_token
-        self.cost_per_token = cost_per_token
-
-    def calculate_energy_saving(self, saved_tokens: int) -> float:
-        #Calculate saved energy in watt-hours based on saved tokens.
-        energy_saving = saved_tokens * self.watt_per_token
-        return energy_saving
-
-    def calculate_cost_saving(self, saved_tokens: int) -> float:
-        #Calculate cost savings in dollars based on saved tokens.
-        cost_saving = saved_tokens * self.cost_per_token
-        return cost_saving
+        self.profile = get_model_profile(model_name)
+        self.watt_per_token = self.profile.input_wh_per_token if watt_per_token is None else watt_per_token
+        self.cost_per_token = self.profile.input_price_per_token if cost_per_token is None else cost_per_token
+
+    def calculate_energy_saving(self, saved_tokens: TokenCounts) -> Union[float, np.ndarray]:
+        #Calculate saved energy in watt-hours based on saved prompt tokens.
+        return _scale(saved_tokens, self.watt_per_token)
+
+    def calculate_cost_saving(self, saved_tokens: TokenCounts) -> Union[float, np.ndarray]:
+        #Calculate cost savings in dollars based on saved prompt tokens.
+        return _scale(saved_tokens, self.cost_per_token)
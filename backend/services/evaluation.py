@@ -0,0 +1,303 @@
+"""
+Offline evaluation of prompt trimming: answer quality against token savings
+for a whole corpus, without going through the HTTP API.
+
+Reads a JSONL corpus with one {"prompt": ..., "id": ...} object per line ("id"
+is optional), trims the prompts on the trim process pool, answers original and
+trimmed prompts with bounded concurrency, scores the answer pairs by embedding
+similarity and with the GPT judge, and writes one row per prompt to a Parquet
+file.
+
+Run from the backend directory, e.g. against the fake OpenAI server:
+    OPENAI_BASE_URL=http://localhost:8001/v1 OPENAI_API_KEY=fake \\
+        python -m services.evaluation corpus.jsonl --out results.parquet
+
+Results are checkpointed every --chunk-size prompts to <out>.parts/; rerunning
+the same command skips the prompts that are already done and retries the ones
+that failed.
+"""
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import glob
+import hashlib
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from services.model_profiles import DEFAULT_MODEL, MODEL_PROFILES
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = {
+    "id": "string",
+    "prompt": "string",
+    "optimized_prompt": "string",
+    "original_answer": "string",
+    "optimized_answer": "string",
+    "original_tokens": "int64",
+    "optimized_tokens": "int64",
+    "token_savings": "int64",
+    "token_savings_percentage": "float64",
+    "energy_saved_wh": "float64",
+    "cost_saved_dollars": "float64",
+    "similarity_cosine": "float64",
+    "similarity_gpt": "float64",
+    "trim_ms": "float64",
+    "original_answer_ms": "float64",
+    "optimized_answer_ms": "float64",
+    "error": "string",
+}
+
+
+def read_corpus(path: str) -> List[Dict[str, str]]:
+    """Prompts of a JSONL corpus, with an id derived from the prompt where none is given"""
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            prompt = item["prompt"]
+            prompt_id = str(item.get("id") or hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16])
+            items.append({"id": prompt_id, "prompt": prompt})
+    return items
+
+
+def parts_dir(out: str) -> str:
+    return out + ".parts"
+
+
+def completed_ids(out: str) -> set:
+    """Ids of the prompts already evaluated without error in checkpoint parts"""
+    import pyarrow.parquet as pq
+
+    done = set()
+    for part in glob.glob(os.path.join(parts_dir(out), "part-*.parquet")):
+        table = pq.read_table(part, columns=["id", "error"])
+        done.update(
+            prompt_id
+            for prompt_id, error in zip(table.column("id").to_pylist(), table.column("error").to_pylist())
+            if error is None
+        )
+    return done
+
+
+def write_part(out: str, rows: List[dict]):
+    """Write a chunk of rows as the next checkpoint part, atomically"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    directory = parts_dir(out)
+    os.makedirs(directory, exist_ok=True)
+    index = len(glob.glob(os.path.join(directory, "part-*.parquet")))
+    schema = pa.schema([(name, pa.type_for_alias(dtype)) for name, dtype in COLUMNS.items()])
+    table = pa.Table.from_pylist(rows, schema=schema)
+    path = os.path.join(directory, f"part-{index:05d}.parquet")
+    pq.write_table(table, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def combine_parts(out: str) -> int:
+    """
+    Concatenate the checkpoint parts into the output file, one row per prompt;
+    returns the number of rows. A prompt evaluated again after an error keeps
+    its newest row, at the position of its first one.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    parts = sorted(glob.glob(os.path.join(parts_dir(out), "part-*.parquet")))
+    if not parts:
+        return 0
+    table = pa.concat_tables(pq.read_table(part) for part in parts)
+    newest = {}
+    for index, prompt_id in enumerate(table.column("id").to_pylist()):
+        newest[prompt_id] = index
+    table = table.take(list(newest.values()))
+    pq.write_table(table, out + ".tmp")
+    os.replace(out + ".tmp", out)
+    return table.num_rows
+
+
+class Evaluator:
+    def __init__(
+        self,
+        backend: str = "rules",
+        target_tokens: Optional[int] = None,
+        concurrency: int = 16,
+        judge: bool = True,
+        model: str = DEFAULT_MODEL,
+    ):
+        from services.embedding_service import EmbeddingService
+        from services.energy_calculator import EnergyCalculator
+        from services.llm_client import get_llm_client
+        from services.llm_service import LLMInteractionService
+        from services.model_output_comparison import ModelOutputComparison
+        from services.prompt_trimmer2 import PromptCompressionService
+        from services.token_tracker import TokenTracker
+
+        self.backend = backend
+        self.target_tokens = target_tokens
+        self.judge = judge
+        self.model = model
+        self.llm_service = LLMInteractionService(get_llm_client())
+        self.comparison_service = ModelOutputComparison()
+        self.embedding_service = EmbeddingService()
+        self.token_tracker = TokenTracker(model)
+        self.energy_calculator = EnergyCalculator(model)
+        # Bounds the LLM calls in flight, on top of the client's rate limits
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # The llmlingua queue rejects prompts beyond its size, so trims wait for a place in it instead
+        self._trim_semaphore = asyncio.Semaphore(PromptCompressionService._max_queue_size)
+
+    async def _timed(self, coroutine):
+        start = time.perf_counter()
+        result = await coroutine
+        return result, (time.perf_counter() - start) * 1000
+
+    async def _trim(self, prompt: str) -> str:
+        if self.backend == "adaptive":
+            from services.trim_planner import plan_trim
+
+            return (await plan_trim(prompt, self.target_tokens, model_name=self.model)).text
+        if self.backend == "llmlingua":
+            from services.prompt_trimmer2 import PromptCompressionService
+
+            return (await PromptCompressionService().compress(prompt, target_tokens=self.target_tokens)).prompt
+        from services.prompt_trimmer import get_text_processor
+
+        return await get_text_processor().trim_async(prompt)
+
+    async def _answer(self, prompt: str):
+        async with self._semaphore:
+            return await self._timed(self.llm_service.get_answer(prompt, self.model))
+
+    async def _evaluate_one(self, item: dict) -> dict:
+        row = {name: None for name in COLUMNS}
+        row.update(id=item["id"], prompt=item["prompt"])
+        try:
+            async with self._trim_semaphore:
+                row["optimized_prompt"], row["trim_ms"] = await self._timed(self._trim(item["prompt"]))
+            (row["original_answer"], row["original_answer_ms"]), (row["optimized_answer"], row["optimized_answer_ms"]) = (
+                await asyncio.gather(self._answer(item["prompt"]), self._answer(row["optimized_prompt"]))
+            )
+        except Exception as e:
+            row["error"] = f"{type(e).__name__}: {e}"
+        return row
+
+    async def evaluate_chunk(self, items: List[dict]) -> List[dict]:
+        """Trim, answer and score a chunk of prompts"""
+        rows = await asyncio.gather(*(self._evaluate_one(item) for item in items))
+        answered = [row for row in rows if row["error"] is None]
+
+        # Token accounting for the whole chunk in one batch
+        counts = await asyncio.to_thread(
+            self.token_tracker.count_tokens_batch,
+            [row["prompt"] for row in rows] + [row["optimized_prompt"] or "" for row in rows],
+        )
+        original, optimized = np.array(counts[:len(rows)]), np.array(counts[len(rows):])
+        savings = np.maximum(original - optimized, 0)
+        energy = self.energy_calculator.calculate_energy_saving(savings)
+        cost = self.energy_calculator.calculate_cost_saving(savings)
+        for i, row in enumerate(rows):
+            if row["optimized_prompt"] is None:
+                continue
+            row.update(
+                original_tokens=int(original[i]),
+                optimized_tokens=int(optimized[i]),
+                token_savings=int(savings[i]),
+                token_savings_percentage=float((original[i] - optimized[i]) / original[i] * 100) if original[i] else 0.0,
+                energy_saved_wh=float(energy[i]),
+                cost_saved_dollars=float(cost[i]),
+            )
+
+        if answered:
+            # Embed all answers of the chunk together and score the pairs row-wise
+            texts = [row["original_answer"] for row in answered] + [row["optimized_answer"] for row in answered]
+            embeddings = await self.embedding_service.encode_many(texts)
+            similarities = np.einsum("ij,ij->i", embeddings[:len(answered)], embeddings[len(answered):])
+            # Judged several pairs per request, reusing scores cached by earlier runs
+            judged = await self.comparison_service.gpt_similarity_batch([
+                (row["prompt"], row["original_answer"], row["optimized_answer"]) for row in answered
+            ]) if self.judge else [None] * len(answered)
+            for row, cosine, gpt in zip(answered, similarities, judged):
+                row["similarity_cosine"] = float(cosine)
+                row["similarity_gpt"] = gpt
+                if self.judge and gpt is None:
+                    # Checkpointed as failed, so a rerun judges the pair again
+                    row["error"] = "JudgeError: no score"
+        return rows
+
+
+async def run(
+    corpus: str,
+    out: str,
+    chunk_size: int = 64,
+    limit: Optional[int] = None,
+    **evaluator_kwargs,
+):
+    from services.llm_client import close_llm_client
+    from services.prompt_trimmer import shutdown_trim_pool
+
+    items = read_corpus(corpus)[:limit]
+    done = completed_ids(out)
+    todo = [item for item in items if item["id"] not in done]
+    logger.info(f"{len(items)} prompts, {len(items) - len(todo)} already evaluated, {len(todo)} to go")
+
+    evaluator = Evaluator(**evaluator_kwargs)
+    try:
+        for start in range(0, len(todo), chunk_size):
+            chunk_start = time.perf_counter()
+            rows = await evaluator.evaluate_chunk(todo[start:start + chunk_size])
+            write_part(out, rows)
+            errors = sum(row["error"] is not None for row in rows)
+            logger.info(
+                f"Evaluated {start + len(rows)}/{len(todo)} prompts "
+                f"({len(rows) / (time.perf_counter() - chunk_start):.1f}/s, {errors} errors)"
+            )
+    finally:
+        shutdown_trim_pool()
+        await close_llm_client()
+
+    rows = combine_parts(out)
+    logger.info(f"Wrote {rows} rows to {out}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", help="JSONL file with a prompt per line")
+    parser.add_argument("--out", default="evaluation.parquet")
+    parser.add_argument("--backend", choices=["rules", "adaptive", "llmlingua"], default="rules")
+    parser.add_argument("--target-tokens", type=int, default=None, help="token budget for adaptive/llmlingua")
+    parser.add_argument("--concurrency", type=int, default=16, help="LLM calls in flight")
+    parser.add_argument("--chunk-size", type=int, default=64, help="prompts per checkpoint")
+    parser.add_argument("--limit", type=int, default=None, help="only evaluate the first prompts of the corpus")
+    parser.add_argument("--no-judge", action="store_true", help="skip the GPT judge")
+    parser.add_argument(
+        "--model", choices=sorted(MODEL_PROFILES), default=DEFAULT_MODEL, help="answers the prompts; sets tokenizer and prices"
+    )
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run(
+        args.corpus,
+        args.out,
+        chunk_size=args.chunk_size,
+        limit=args.limit,
+        backend=args.backend,
+        target_tokens=args.target_tokens,
+        concurrency=args.concurrency,
+        judge=not args.no_judge,
+        model=args.model,
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+# SQLite file keeping GPT judge scores across restarts; ":memory:" keeps them in process only
+JUDGE_CACHE_PATH = os.getenv(
+    "JUDGE_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "judge_cache.sqlite3"),
+)
+
+
+@dataclass
+class JudgeCacheStats:
+    entries: int
+    hits: int
+    misses: int
+    hit_rate: float
+    path: str
+
+
+class JudgeCache:
+    """
+    Persistent GPT judge scores keyed by the content hash of the judge model and
+    the (question, answer1, answer2) triple. Several processes may share the
+    file. Thread safe; calls block on disk, so run them off the event loop.
+    """
+    def __init__(self, path: str = JUDGE_CACHE_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS judgements (key BLOB PRIMARY KEY, score REAL NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._connection.commit()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def key(model: str, question: str, answer1: str, answer2: str) -> bytes:
+        digest = hashlib.sha256()
+        for part in (model, question, answer1, answer2):
+            data = part.encode("utf-8")
+            # Length prefixes keep ("ab", "c") and ("a", "bc") apart
+            digest.update(len(data).to_bytes(8, "little"))
+            digest.update(data)
+        return digest.digest()
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, float]:
+        """Cached scores of the given keys; missing keys are left out"""
+        unique = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            # Stay below SQLite's limit on query parameters
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                rows = self._connection.execute(
+                    f"SELECT key, score FROM judgements WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update(rows)
+            hits = sum(key in found for key in keys)
+            self._hits += hits
+            self._misses += len(keys) - hits
+        return found
+
+    def put_many(self, scores: Iterable[Tuple[bytes, float]]):
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO judgements (key, score, created_at) VALUES (?, ?, ?)",
+                [(key, score, now) for key, score in scores],
+            )
+            self._connection.commit()
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM judgements")
+            self._connection.commit()
+
+    def get_stats(self) -> JudgeCacheStats:
+        with self._lock:
+            entries = self._connection.execute("SELECT COUNT(*) FROM judgements").fetchone()[0]
+            lookups = self._hits + self._misses
+            return JudgeCacheStats(
+                entries=entries,
+                hits=self._hits,
+                misses=self._misses,
+                hit_rate=self._hits / lookups if lookups else 0.0,
+                path=self.path,
+            )
+
+
+@lru_cache(maxsize=None)
+def get_judge_cache() -> JudgeCache:
+    return JudgeCache()
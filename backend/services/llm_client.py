@@ -0,0 +1,229 @@
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional
+import asyncio
+import logging
+import os
+import random
+import time
+
+from services.metrics import LLM_REQUESTS, TOKENS
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying: timeouts, conflicts, rate limits and server errors
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+COMPLETION_TOKEN_ESTIMATE = 512  # expected completion length when max_tokens is not set
+
+
+@dataclass
+class ModelLimits:
+    """Provider rate limits for one model"""
+    requests_per_minute: int = 500
+    tokens_per_minute: int = 200_000
+    max_concurrency: int = 32
+
+
+MODEL_LIMITS: Dict[str, ModelLimits] = {
+    "gpt-4o-mini": ModelLimits(requests_per_minute=500, tokens_per_minute=200_000, max_concurrency=64),
+}
+
+
+class TokenBucket:
+    """
+    Async token bucket refilled continuously at rate_per_minute and holding at
+    most capacity tokens (one minute's worth by default). Waiters are served in
+    arrival order.
+    """
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0):
+        # Larger requests than the bucket holds wait for a full bucket
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self._tokens < amount:
+                await asyncio.sleep((amount - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= amount
+
+    def refund(self, amount: float):
+        """Return (or, if negative, additionally charge) tokens after the real usage is known"""
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + amount)
+
+
+def estimate_tokens(messages: List[dict], max_tokens: Optional[int] = None) -> int:
+    """Rough token estimate of a request, about four characters per token"""
+    prompt_tokens = sum(len(message.get("content") or "") // 4 + 4 for message in messages)
+    return prompt_tokens + (max_tokens or COMPLETION_TOKEN_ESTIMATE)
+
+
+class LLMClient:
+    """
+    Shared OpenAI client for the whole app.
+
+    One HTTP connection pool is reused by every request, so keep-alive
+    connections and TLS sessions survive between calls. Requests are limited by
+    a global and a per-model concurrency semaphore and by per-model request and
+    token buckets matching the provider's RPM/TPM limits. Rate limits, timeouts
+    and server errors are retried with exponential backoff and full jitter.
+
+    base_url (or OPENAI_BASE_URL) can point at any OpenAI-compatible server,
+    e.g. benchmarks/fake_openai.py for local testing.
+    """
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 50,
+        timeout: float = 60.0,
+        max_concurrency: int = 64,
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        model_limits: Optional[Dict[str, ModelLimits]] = None,
+    ):
+        # Imported lazily to keep app startup fast
+        import httpx
+        from openai import AsyncOpenAI
+
+        api_key = api_key or os.getenv("OPENAI_API_KEY")
+        base_url = base_url or os.getenv("OPENAI_BASE_URL")
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=30.0,
+        )
+        self._http_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+        # Retries are handled here, so they respect the rate limiters
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=self._http_client, max_retries=0)
+
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.model_limits = {**MODEL_LIMITS, **(model_limits or {})}
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._model_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._request_buckets: Dict[str, TokenBucket] = {}
+        self._token_buckets: Dict[str, TokenBucket] = {}
+
+    def _limits_for(self, model: str) -> ModelLimits:
+        return self.model_limits.get(model, ModelLimits())
+
+    def _model_semaphore(self, model: str) -> asyncio.Semaphore:
+        if model not in self._model_semaphores:
+            self._model_semaphores[model] = asyncio.Semaphore(self._limits_for(model).max_concurrency)
+        return self._model_semaphores[model]
+
+    async def _acquire_rate(self, model: str, tokens: int):
+        limits = self._limits_for(model)
+        if model not in self._request_buckets:
+            self._request_buckets[model] = TokenBucket(limits.requests_per_minute)
+            self._token_buckets[model] = TokenBucket(limits.tokens_per_minute)
+        await self._request_buckets[model].acquire(1)
+        await self._token_buckets[model].acquire(tokens)
+
+    def _retry_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        try:
+            # Never retry earlier than the server asked for
+            return max(delay, float(retry_after)) if retry_after else delay
+        except ValueError:
+            return delay
+
+    async def _with_retries(self, model: str, call, estimate: int):
+        import openai
+
+        for attempt in range(self.max_retries + 1):
+            # Every attempt is a request to the provider, so each one waits for the rate limits
+            await self._acquire_rate(model, estimate)
+            try:
+                response = await call()
+                LLM_REQUESTS.inc(model=model, outcome="ok")
+                return response
+            except openai.APIStatusError as e:
+                LLM_REQUESTS.inc(model=model, outcome=str(e.status_code))
+                if e.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    raise
+                delay = self._retry_delay(attempt, e.response.headers.get("retry-after"))
+                reason = f"status {e.status_code}"
+            except openai.APIConnectionError as e:  # includes timeouts
+                LLM_REQUESTS.inc(model=model, outcome=type(e).__name__)
+                if attempt == self.max_retries:
+                    raise
+                delay = self._retry_delay(attempt)
+                reason = type(e).__name__
+            logger.warning(f"Retrying {model} request in {delay:.2f}s after {reason} (attempt {attempt + 1})")
+            await asyncio.sleep(delay)
+
+    def _record_usage(self, model: str, estimate: int, usage):
+        # Correct the rate limiter's estimate with the real usage
+        self._token_buckets[model].refund(estimate - usage.total_tokens)
+        TOKENS.inc(usage.prompt_tokens, model=model, direction="in")
+        TOKENS.inc(usage.completion_tokens, model=model, direction="out")
+
+    async def chat(self, messages: List[dict], model: str = "gpt-4o-mini", **kwargs):
+        """Create a chat completion within the concurrency and rate limits, retrying transient errors"""
+        estimate = estimate_tokens(messages, kwargs.get("max_tokens"))
+        async with self._semaphore, self._model_semaphore(model):
+            response = await self._with_retries(
+                model, lambda: self.client.chat.completions.create(messages=messages, model=model, **kwargs), estimate
+            )
+        if response.usage is not None:
+            self._record_usage(model, estimate, response.usage)
+        return response
+
+    async def chat_stream(self, messages: List[dict], model: str = "gpt-4o-mini", **kwargs) -> AsyncIterator:
+        """
+        Stream a chat completion chunk by chunk. Opening the stream is retried
+        like chat(); the concurrency slot is held until the stream ends. The
+        last chunk carries the usage.
+        """
+        estimate = estimate_tokens(messages, kwargs.get("max_tokens"))
+        async with self._semaphore, self._model_semaphore(model):
+            stream = await self._with_retries(
+                model,
+                lambda: self.client.chat.completions.create(
+                    messages=messages, model=model, stream=True, stream_options={"include_usage": True}, **kwargs
+                ),
+                estimate,
+            )
+            try:
+                async for chunk in stream:
+                    if chunk.usage is not None:
+                        self._record_usage(model, estimate, chunk.usage)
+                    yield chunk
+            finally:
+                await stream.close()
+
+    async def aclose(self):
+        await self._http_client.aclose()
+
+
+_llm_client: Optional[LLMClient] = None
+
+
+def get_llm_client() -> LLMClient:
+    """The app-wide LLM client, created on first use"""
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = LLMClient()
+    return _llm_client
+
+
+async def close_llm_client():
+    global _llm_client
+    if _llm_client is not None:
+        await _llm_client.aclose()
+        _llm_client = None
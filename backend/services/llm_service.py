@@ -1,26 +1,53 @@
-from openai import AsyncOpenAI
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+from services.llm_client import LLMClient
+from services.metrics import timed
+from services.model_profiles import DEFAULT_MODEL
+
+
+@dataclass
+class AnswerDelta:
+    """A piece of a streamed answer; the last one carries the token usage"""
+    content: str = ""
+    usage: Optional[dict] = None
 
 
 class LLMInteractionService:
-    def __init__(self, api_key: str):
-        self.client = AsyncOpenAI(
-            # This is the default and can be omitted
-            api_key=api_key,
-        )
+    def __init__(self, llm_client: LLMClient):
+        # Shared client, so connections are reused across requests
+        self.llm_client = llm_client
 
-    async def get_answer(self, prompt: str) -> str:
+    @timed("get_answer")
+    async def get_answer(self, prompt: str, model: str = DEFAULT_MODEL) -> str:
         # Create chat completion request
-        response = await self.client.chat.completions.create(
+        response = await self.llm_client.chat(
             messages=[
                 {
                     "role": "user",
                     "content": prompt
                 }
             ],
-            model="gpt-4o-mini",
+            model=model,
             temperature=0.3  # Lower temperature for more consistent scoring
         )
         
         # Extract response content
         result = response.choices[0].message.content
         return result
+
+    async def stream_answer(self, prompt: str, model: str = DEFAULT_MODEL) -> AsyncIterator[AnswerDelta]:
+        # Same request as get_answer, streamed
+        async for chunk in self.llm_client.chat_stream(
+            messages=[
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            model=model,
+            temperature=0.3
+        ):
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield AnswerDelta(content=chunk.choices[0].delta.content)
+            if chunk.usage is not None:
+                yield AnswerDelta(usage=chunk.usage.model_dump(exclude_none=True))
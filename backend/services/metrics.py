@@ -0,0 +1,214 @@
+"""
+Lightweight Prometheus-style metrics: counters, gauges and histograms kept in
+process and rendered in the Prometheus text format by /metrics.
+
+Pipeline stages are timed with timed(), as a decorator of sync or async
+functions or as a context manager:
+
+    @timed("get_answer")
+    async def get_answer(...): ...
+
+    with timed("check_cache"):
+        ...
+"""
+from bisect import bisect_left
+from functools import wraps
+from typing import Callable, Dict, List, Sequence, Tuple
+import asyncio
+import os
+import resource
+import threading
+import time
+
+# Upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes the labels {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            return "\n".join(header + self._samples())
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[LabelValues, List[int]] = {}  # per bucket, the last one is +Inf
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    def _samples(self) -> List[str]:
+        samples = []
+        names = self.labelnames + ("le",)
+        for key, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                samples.append(f"{self.name}_bucket{_format_labels(names, key + (le,))} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            samples.append(f"{self.name}_sum{labels} {_format_value(self._sums[key])}")
+            samples.append(f"{self.name}_count{labels} {cumulative}")
+        return samples
+
+
+REGISTRY: List[_Metric] = []
+
+STAGE_SECONDS = Histogram(
+    "tokenterminator_stage_seconds", "Latency of a request pipeline stage", ["stage"]
+)
+REQUEST_SECONDS = Histogram(
+    "tokenterminator_request_seconds", "Latency of HTTP requests until the response starts", ["method", "path", "status"]
+)
+TOKENS = Counter(
+    "tokenterminator_llm_tokens_total", "Tokens sent to (in) and generated by (out) the LLM", ["model", "direction"]
+)
+LLM_REQUESTS = Counter(
+    "tokenterminator_llm_requests_total", "LLM requests by outcome", ["model", "outcome"]
+)
+CACHE_LOOKUPS = Counter(
+    "tokenterminator_cache_lookups_total", "Cache lookups by cache and result", ["cache", "result"]
+)
+CACHE_ENTRIES = Gauge(
+    "tokenterminator_cache_entries", "Entries held by a cache", ["cache"]
+)
+EVENT_LOOP_LAG = Histogram(
+    "tokenterminator_event_loop_lag_seconds", "Delay of event loop callbacks past their scheduled time"
+)
+RESIDENT_MEMORY = Gauge(
+    "process_resident_memory_bytes", "Resident memory size of the API process"
+)
+
+
+class _Timer:
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        STAGE_SECONDS.observe(time.perf_counter() - self._start, stage=self.stage)
+
+    def __call__(self, func: Callable) -> Callable:
+        stage = self.stage
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with _Timer(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def timed(stage: str) -> _Timer:
+    """Record the duration of a stage in STAGE_SECONDS"""
+    return _Timer(stage)
+
+
+def observe_stages(timings: Dict[str, float]):
+    """Record stage durations measured elsewhere, e.g. in a worker process"""
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+async def monitor_event_loop(interval: float = 0.05):
+    """Record in EVENT_LOOP_LAG how late a sleep of interval seconds wakes up, until cancelled"""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(time.perf_counter() - start - interval, 0.0))
+
+
+def resident_memory_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # No procfs (macOS): peak instead of current size, reported in bytes there
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def render_metrics() -> str:
+    RESIDENT_MEMORY.set(resident_memory_bytes())
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
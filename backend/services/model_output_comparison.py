@@ -1,15 +1,32 @@
+import asyncio
+import json
+import logging
 import os
-from sklearn.metrics.pairwise import cosine_similarity
-from sentence_transformers import SentenceTransformer
-from openai import OpenAI
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from services.embedding_service import EmbeddingService
+from services.judge_cache import JudgeCache, get_judge_cache
+from services.llm_client import get_llm_client
+from services.metrics import CACHE_LOOKUPS, timed
+
+logger = logging.getLogger(__name__)
+
+JUDGE_MODEL = "gpt-4o-mini"
+# Answer pairs scored per request by gpt_similarity_batch
+JUDGE_BATCH_SIZE = int(os.getenv("JUDGE_BATCH_SIZE", "8"))
+
+# (question, original answer, optimized answer)
+Triple = Tuple[str, str, str]
 
 class ModelOutputComparison:
     def __init__(self):
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.embedding_service = EmbeddingService()
 
-    def calculate_similarity(self, original: str, optimized: str) -> float:
-        embeddings = self.model.encode([original, optimized])
-        return cosine_similarity([embeddings[0]], [embeddings[1]])[0][0]
+    @timed("calculate_similarity")
+    async def calculate_similarity(self, original: str, optimized: str) -> float:
+        embeddings = await self.embedding_service.encode_many([original, optimized])
+        # Embeddings are normalized, so their dot product is the cosine similarity
+        return float(np.dot(embeddings[0], embeddings[1]))
     
 
     comparison_prompt = """
@@ -66,7 +83,49 @@ Your response should follow this format:
 <score>[Your similarity score from 0 to 100]</score>"""
 
 
-    def gpt_similarity(self, question: str, original_answer: str, optimized_answer: str) -> float:
+    batch_comparison_prompt = """
+You are tasked with calculating similarity scores between pairs of answers provided by a language model (LLM). Each pair answers the question given with it. For every pair, determine how similar the two answers are in terms of content, focusing on whether important facts, concepts, and arguments are present in both responses.
+
+Here are the pairs:
+
+{{PAIRS}}
+
+For each pair, identify the important facts, main concepts and central arguments of both answers, compare them, and calculate a similarity score on a scale of 0 to 100, where:
+- 0 means the answers are completely different with no shared important information
+- 100 means the answers are identical in all important aspects
+- Scores in between reflect partial similarity, with higher scores indicating greater similarity
+
+Judge every pair on its own. Respond with a JSON object with one result per pair, in this format:
+
+{"results": [{"id": 1, "justification": "<one or two sentences>", "score": <similarity score from 0 to 100>}]}"""
+
+    @staticmethod
+    def _parse_score(result: str) -> Optional[float]:
+        """Score of a judge response scaled to [0, 1], None if it has none"""
+        try:
+            # Find the score tag
+            score_start = result.find("<score>")
+            score_end = result.find("</score>")
+
+            if score_start == -1 or score_end == -1:
+                raise ValueError("Score tags not found in response")
+
+            # Extract and convert score to float
+            score_text = result[score_start + len("<score>"):score_end].strip()
+            score = float(score_text)
+
+            # Validate score is within expected range
+            if not (0 <= score <= 100):
+                raise ValueError(f"Score {score} is outside valid range [0, 100]")
+
+            return float(score/100)
+
+        except (ValueError, IndexError) as e:
+            logger.error(f"Error extracting score: {str(e)}")
+            logger.error(f"Full response: {result}")
+            return None
+
+    async def _judge(self, question: str, original_answer: str, optimized_answer: str) -> Optional[float]:
         # Format the comparison prompt with the answers
         formatted_prompt = self.comparison_prompt.replace(
             "{{QUESTION}}", question
@@ -75,15 +134,10 @@ Your response should follow this format:
         ).replace(
             "{{ANSWER2}}", optimized_answer
         )
-        
-        client = OpenAI(
-            # This is the default and can be omitted
-            api_key=os.environ.get("OPENAI_API_KEY"),
-        )
 
         try:
-            # Create chat completion request
-            response = client.chat.completions.create(
+            # Create chat completion request on the shared async client
+            response = await get_llm_client().chat(
                 messages=[
                     {
                         "role": "system",
@@ -94,40 +148,94 @@ Your response should follow this format:
                         "content": formatted_prompt
                     }
                 ],
-                model="gpt-4o-mini",
+                model=JUDGE_MODEL,
                 temperature=0.3  # Lower temperature for more consistent scoring
             )
-            
+
             # Extract response content
             result = response.choices[0].message.content
 
-            print("Got the following response from the comparision Service:", result)
-            
-            # Extract score from the response
-            try:
-                # Find the score tag
-                score_start = result.find("<score>") + len("<score>")
-                score_end = result.find("</score>")
-                
-                if score_start == -1 or score_end == -1:
-                    raise ValueError("Score tags not found in response")
-                    
-                # Extract and convert score to float
-                score_text = result[score_start:score_end].strip()
-                score = float(score_text)
-                
-                # Validate score is within expected range
-                if not (0 <= score <= 100):
-                    raise ValueError(f"Score {score} is outside valid range [0, 100]")
-                    
-                return float(score/100)
-                
-            except (ValueError, IndexError) as e:
-                print(f"Error extracting score: {str(e)}")
-                print(f"Full response: {result}")
-                return 0.0
-                
+            logger.debug(f"Got the following response from the comparison service: {result}")
+            return self._parse_score(result)
+
         except Exception as e:
-            print(f"Error during API call: {str(e)}")
-            return 0.0
-            
\ No newline at end of file
+            logger.error(f"Error during API call: {str(e)}")
+            return None
+
+    async def _judge_batch(self, triples: List[Triple]) -> Dict[int, float]:
+        """Scores of several answer pairs judged in one request, by position; pairs without a valid score are left out"""
+        pairs = "\n\n".join(
+            f'<pair id="{i}">\n<question>\n{question}\n</question>\n'
+            f"<answer1>\n{original_answer}\n</answer1>\n<answer2>\n{optimized_answer}\n</answer2>\n</pair>"
+            for i, (question, original_answer, optimized_answer) in enumerate(triples, start=1)
+        )
+        try:
+            response = await get_llm_client().chat(
+                messages=[
+                    {"role": "system", "content": "You are an expert at analyzing and comparing text responses."},
+                    {"role": "user", "content": self.batch_comparison_prompt.replace("{{PAIRS}}", pairs)},
+                ],
+                model=JUDGE_MODEL,
+                temperature=0.3,
+                response_format={"type": "json_object"},
+            )
+            result = response.choices[0].message.content
+            logger.debug(f"Got the following response from the comparison service: {result}")
+            scores = {}
+            for item in json.loads(result)["results"]:
+                position, score = int(item["id"]) - 1, float(item["score"])
+                if 0 <= position < len(triples) and 0 <= score <= 100:
+                    scores[position] = score / 100
+            return scores
+        except Exception as e:
+            logger.error(f"Error during batched judging of {len(triples)} pairs: {str(e)}")
+            return {}
+
+    @timed("gpt_similarity")
+    async def gpt_similarity(self, question: str, original_answer: str, optimized_answer: str) -> Optional[float]:
+        """GPT similarity of one answer pair, None if the judge gave no score"""
+        return (await self.gpt_similarity_batch([(question, original_answer, optimized_answer)]))[0]
+
+    async def gpt_similarity_batch(self, triples: Sequence[Triple], batch_size: int = JUDGE_BATCH_SIZE) -> List[Optional[float]]:
+        """
+        GPT similarity of many answer pairs. Cached scores are reused; the rest
+        is judged batch_size pairs per request, and pairs missing from a batch
+        response are judged one by one. Pairs the judge gave no score are None
+        and are not cached.
+        """
+        cache = get_judge_cache()
+        keys = [JudgeCache.key(JUDGE_MODEL, *triple) for triple in triples]
+        scores = await asyncio.to_thread(cache.get_many, keys)
+        # Per requested pair: a cached triple requested twice is two hits
+        hits = sum(key in scores for key in keys)
+        CACHE_LOOKUPS.inc(hits, cache="judge", result="hit")
+        CACHE_LOOKUPS.inc(len(keys) - hits, cache="judge", result="miss")
+
+        # Judge each uncached triple once, even if it occurs several times
+        todo = {key: triple for key, triple in zip(keys, triples) if key not in scores}
+        if todo:
+            todo_keys, todo_triples = list(todo), list(todo.values())
+            if batch_size > 1 and len(todo) > 1:
+                chunks = [range(start, min(start + batch_size, len(todo))) for start in range(0, len(todo), batch_size)]
+                batches = await asyncio.gather(*(self._judge_batch([todo_triples[i] for i in chunk]) for chunk in chunks))
+                judged = {chunk[position]: score for chunk, batch in zip(chunks, batches) for position, score in batch.items()}
+            else:
+                judged = {}
+            missing = [i for i in range(len(todo)) if i not in judged]
+            for i, score in zip(missing, await asyncio.gather(*(self._judge(*todo_triples[i]) for i in missing))):
+                if score is not None:
+                    judged[i] = score
+
+            new_scores = {todo_keys[i]: score for i, score in judged.items()}
+            if new_scores:
+                await asyncio.to_thread(cache.put_many, new_scores.items())
+            scores.update(new_scores)
+        return [scores.get(key) for key in keys]
+
+    async def compare(self, question: str, original_answer: str, optimized_answer: str) -> Tuple[float, Optional[float]]:
+        """Cosine and GPT similarity of the two answers, computed concurrently; the GPT score is None if judging failed"""
+        cosine, gpt = await asyncio.gather(
+            self.calculate_similarity(original_answer, optimized_answer),
+            self.gpt_similarity(question, original_answer, optimized_answer),
+        )
+        return cosine, gpt
@@ -0,0 +1,36 @@
+from dataclasses import dataclass
+from typing import Dict
+
+DEFAULT_MODEL = "gpt-4o-mini"
+
+# Rough energy estimate per prompt token. Providers publish no per-model
+# figures, so every profile shares it: energy savings scale with the tokens
+# saved, not with the model, unlike the cost savings.
+ENERGY_WH_PER_INPUT_TOKEN = 0.0002
+
+
+@dataclass(frozen=True)
+class ModelProfile:
+    """Tokenizer, prompt token price and energy use of one model"""
+    name: str
+    encoding: str  # tiktoken encoding
+    input_price_per_token: float  # dollars
+    input_wh_per_token: float = ENERGY_WH_PER_INPUT_TOKEN  # the same for all models, see above
+
+
+MODEL_PROFILES: Dict[str, ModelProfile] = {
+    profile.name: profile
+    for profile in (
+        ModelProfile("gpt-4o-mini", "o200k_base", input_price_per_token=0.15e-6),
+        ModelProfile("gpt-4o", "o200k_base", input_price_per_token=2.50e-6),
+        ModelProfile("gpt-4-turbo", "cl100k_base", input_price_per_token=10.00e-6),
+        ModelProfile("gpt-3.5-turbo", "cl100k_base", input_price_per_token=0.50e-6),
+    )
+}
+
+
+def get_model_profile(model_name: str) -> ModelProfile:
+    profile = MODEL_PROFILES.get(model_name)
+    if profile is None:
+        raise ValueError(f"Unknown model {model_name}, expected one of {sorted(MODEL_PROFILES)}")
+    return profile
@@ -0,0 +1,77 @@
+"""
+Sampling profiler for single requests.
+
+A background thread samples the stack of the profiled thread (the event loop)
+at a fixed interval and counts identical stacks. The result is in the folded
+format understood by flamegraph.pl and speedscope. Since the event loop serves
+every request, samples of concurrent requests show up too.
+
+Enabled with ALLOW_PROFILING=1; a request is then profiled by sending the
+X-Profile: 1 header, and the response carries an X-Profile-Id for
+GET /metrics/profiles/{id}.
+"""
+from collections import Counter, OrderedDict
+from typing import Optional
+import os
+import sys
+import threading
+import time
+import uuid
+
+ALLOW_PROFILING = os.getenv("ALLOW_PROFILING", "0") == "1"
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))  # seconds between samples
+MAX_STORED_PROFILES = 20
+
+
+class SamplingProfiler:
+    def __init__(self, thread_id: Optional[int] = None, interval: float = PROFILE_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        if stack:
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self) -> "SamplingProfiler":
+        self._started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self) -> str:
+        """Stop sampling and return the folded stacks, most frequent first"""
+        self._stop.set()
+        self._thread.join()
+        elapsed = time.perf_counter() - self._started
+        header = f"# {self.samples} samples every {self.interval * 1000:.1f}ms over {elapsed:.3f}s\n"
+        return header + "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+_profiles: "OrderedDict[str, str]" = OrderedDict()
+
+
+def store_profile(profile: str) -> str:
+    """Keep a profile for later retrieval; returns its id"""
+    profile_id = uuid.uuid4().hex
+    _profiles[profile_id] = profile
+    while len(_profiles) > MAX_STORED_PROFILES:
+        _profiles.popitem(last=False)
+    return profile_id
+
+
+def get_profile(profile_id: str) -> Optional[str]:
+    return _profiles.get(profile_id)
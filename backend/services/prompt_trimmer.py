@@ -1,13 +1,17 @@
+import asyncio
+import inspect
+import multiprocessing
+import os
 import re
-from typing import Optional, List, Tuple
+import time
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from typing import Callable, Dict, Iterable, Iterator, Optional, List, Sequence, TextIO, Tuple, Union
 
-import nltk
-from nltk.corpus import stopwords
-from nltk.stem import PorterStemmer, SnowballStemmer, LancasterStemmer
-
-nltk.download('punkt', quiet=True)
-nltk.download('stopwords', quiet=True)
-nltk.download('punkt_tab', quiet=True)
+from services.metrics import CACHE_LOOKUPS, observe_stages
+from services.startup import ensure_nltk_resources
+from services.trim_cache import TrimCache, options_fingerprint
 
 ARTICLES_PREPOSITIONS = {
     "english": ['the', 'a', 'an', 'in', 'on', 'at', 'for', 'to', 'of']
@@ -23,7 +27,179 @@ NEGATION_WORDS = {
     ],
 }
 
-PUNCTUATION = [".", ",", "'", '"', "!", "?", ";", ":", "-"]
+PUNCTUATION = frozenset([".", ",", "'", '"', "!", "?", ";", ":", "-"])
+
+# Words (keeping inner hyphens, apostrophes, dots and commas as in "state-of-the-art",
+# "e.g" or "1,000"), ellipses, and any other single non-space character
+TOKEN_PATTERN = re.compile(r"\w+(?:[-'.,]\w+)*|\.\.\.|[^\w\s]")
+SPACE_BEFORE_PUNCTUATION = re.compile(r"\s([?.!,:;])")
+WHITESPACE = re.compile(r"\s+")
+
+# Separately applicable trimming passes, cheapest first
+TRIM_PASSES = ("whitespace", "punctuation", "stopwords", "chunks", "stemming")
+
+STEM_CACHE_SIZE = 65536  # memoized stems per stemmer
+
+# Worker processes used to trim off the event loop
+TRIM_POOL_WORKERS = int(os.getenv("TRIM_POOL_WORKERS", "0")) or os.cpu_count() or 1
+
+
+def _create_stemmer(stemmer_name: str, language: str):
+    # Imported lazily: importing nltk takes more than a second
+    from nltk.stem import PorterStemmer, SnowballStemmer, LancasterStemmer
+
+    if stemmer_name == "porter":
+        return PorterStemmer()
+    elif stemmer_name == "snowball":
+        return SnowballStemmer(language)
+    elif stemmer_name == "lancaster":
+        return LancasterStemmer()
+
+
+@lru_cache(maxsize=None)
+def _stem_function(stemmer_name: str, language: str) -> Callable[[str], str]:
+    """
+    Shared stem function per stemmer and language. Results are memoized in a
+    bounded LRU cache and keep the case of the original word.
+    """
+    stemmer = _create_stemmer(stemmer_name, language)
+
+    @lru_cache(maxsize=STEM_CACHE_SIZE)
+    def stem(word: str) -> str:
+        stemmed = stemmer.stem(word)
+        if word.istitle():
+            return stemmed.title()
+        elif word.isupper():
+            return stemmed.upper()
+        return stemmed
+
+    stem.stemmer = stemmer
+    return stem
+
+
+def _sa_is(s: List[int], upper: int) -> List[int]:
+    """
+    Suffix array of an integer sequence with values in [0, upper] using SA-IS
+    (induced sorting), in O(n) time and memory
+    """
+    n = len(s)
+    if n == 0:
+        return []
+    if n == 1:
+        return [0]
+    if n == 2:
+        return [0, 1] if s[0] < s[1] else [1, 0]
+    if n < 10:
+        return sorted(range(n), key=lambda i: s[i:])
+
+    sa = [0] * n
+    # ls[i] is True if suffix i is S-type (smaller than suffix i + 1)
+    ls = [False] * n
+    for i in range(n - 2, -1, -1):
+        ls[i] = ls[i + 1] if s[i] == s[i + 1] else s[i] < s[i + 1]
+
+    # Bucket boundaries per character for L-type and S-type suffixes
+    sum_l = [0] * (upper + 1)
+    sum_s = [0] * (upper + 1)
+    for i in range(n):
+        if not ls[i]:
+            sum_s[s[i]] += 1
+        else:
+            sum_l[s[i] + 1] += 1
+    for i in range(upper + 1):
+        sum_s[i] += sum_l[i]
+        if i < upper:
+            sum_l[i + 1] += sum_s[i]
+
+    def induce(lms: List[int]):
+        for i in range(n):
+            sa[i] = -1
+        buf = sum_s[:]
+        for d in lms:
+            if d == n:
+                continue
+            sa[buf[s[d]]] = d
+            buf[s[d]] += 1
+        buf = sum_l[:]
+        sa[buf[s[n - 1]]] = n - 1
+        buf[s[n - 1]] += 1
+        for i in range(n):
+            v = sa[i]
+            if v >= 1 and not ls[v - 1]:
+                sa[buf[s[v - 1]]] = v - 1
+                buf[s[v - 1]] += 1
+        buf = sum_l[:]
+        for i in range(n - 1, -1, -1):
+            v = sa[i]
+            if v >= 1 and ls[v - 1]:
+                buf[s[v - 1] + 1] -= 1
+                sa[buf[s[v - 1] + 1]] = v - 1
+
+    # Leftmost S-type positions (LMS) split the input into LMS substrings
+    lms_map = [-1] * (n + 1)
+    lms = []
+    for i in range(1, n):
+        if not ls[i - 1] and ls[i]:
+            lms_map[i] = len(lms)
+            lms.append(i)
+    m = len(lms)
+    induce(lms)
+
+    if m:
+        # Name the sorted LMS substrings and recurse on the reduced string
+        sorted_lms = [v for v in sa if lms_map[v] != -1]
+        rec_s = [0] * m
+        rec_upper = 0
+        for i in range(1, m):
+            left = sorted_lms[i - 1]
+            right = sorted_lms[i]
+            end_l = lms[lms_map[left] + 1] if lms_map[left] + 1 < m else n
+            end_r = lms[lms_map[right] + 1] if lms_map[right] + 1 < m else n
+            same = True
+            if end_l - left != end_r - right:
+                same = False
+            else:
+                while left < end_l and s[left] == s[right]:
+                    left += 1
+                    right += 1
+                if left == n or s[left] != s[right]:
+                    same = False
+            if not same:
+                rec_upper += 1
+            rec_s[lms_map[sorted_lms[i]]] = rec_upper
+
+        rec_sa = _sa_is(rec_s, rec_upper)
+        sorted_lms = [lms[i] for i in rec_sa]
+        induce(sorted_lms)
+    return sa
+
+
+class IntervalSet:
+    """Union of half-open intervals [start, end), kept as sorted disjoint spans"""
+    def __init__(self):
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+
+    def __iter__(self):
+        return zip(self.starts, self.ends)
+
+    def overlaps(self, start: int, end: int) -> bool:
+        """Check in O(log n) whether [start, end) intersects any span"""
+        i = bisect_right(self.starts, start) - 1
+        if i >= 0 and self.ends[i] > start:
+            return True
+        return i + 1 < len(self.starts) and self.starts[i + 1] < end
+
+    def add(self, start: int, end: int):
+        """Insert [start, end), merging it with the spans it overlaps or touches"""
+        lo = bisect_left(self.ends, start)
+        hi = bisect_right(self.starts, end)
+        if lo < hi:
+            start = min(start, self.starts[lo])
+            end = max(end, self.ends[hi - 1])
+        self.starts[lo:hi] = [start]
+        self.ends[lo:hi] = [end]
+
 
 class SuffixArray:
     """Helper class for building suffix arrays and LCP arrays"""
@@ -32,10 +208,9 @@ class SuffixArray:
         self.n = len(text)
         
     def build_suffix_array(self) -> List[int]:
-        """Build suffix array using prefix doubling"""
-        suffixes = [(self.text[i:], i) for i in range(self.n)]
-        suffixes.sort()
-        return [pos for _, pos in suffixes]
+        """Build suffix array using SA-IS over the text's character ranks in O(n)"""
+        alphabet = {char: rank for rank, char in enumerate(sorted(set(self.text)))}
+        return _sa_is([alphabet[char] for char in self.text], max(len(alphabet) - 1, 0))
 
     def build_lcp_array(self, suffix_array: List[int]) -> List[int]:
         """Build LCP array using Kasai's algorithm"""
@@ -63,14 +238,17 @@ class TextProcessor:
     Enhanced text processor with trimming and integrated chunk removal
     """
     def __init__(self, language: str = "english"):
+        ensure_nltk_resources()
+        from nltk.corpus import stopwords
+
         self.language = language
         if language not in stopwords.fileids():
             raise ValueError("Unsupported language")
         
         self.nltk_stopwords = stopwords.words(language)
-        self.words_to_exclude = set(
+        self.words_to_exclude = frozenset(
             self.nltk_stopwords + ARTICLES_PREPOSITIONS.get(language, [])
-        ) - set(NEGATION_WORDS.get(language, []))
+        ) - frozenset(NEGATION_WORDS.get(language, []))
 
     def trim(
         self,
@@ -82,72 +260,195 @@ class TextProcessor:
         remove_chunks: bool = True,
         min_chunk_length: int = 15,
         min_chunk_occurrences: int = 2,
-        keep_first_chunk: bool = True  # Keep the first occurrence of each chunk
+        keep_first_chunk: bool = True,  # Keep the first occurrence of each chunk
+        timings: Optional[Dict[str, float]] = None  # if given, filled with the seconds spent per step
     ) -> str:
-        accepted_stemmers = ("snowball", "porter", "lancaster")
-        if stemmer and stemmer not in accepted_stemmers:
-            raise ValueError("Stemmer must be one of", accepted_stemmers)
+        self._check_stemmer(stemmer)
+        start = time.perf_counter()
 
         # Merge contractions early
-        text = text.replace("'", "").replace("'", "")
-
-        # First pass: identify sentence boundaries and chunks
-        sentences = nltk.sent_tokenize(text)
-        processed_text = text
+        processed_text = self._merge_contractions(text)
+        contractions_done = time.perf_counter()
 
         # Remove repeated chunks if requested
         if remove_chunks:
-            # Find all repeated chunks
-            chunks = self.find_repeated_chunks(
-                processed_text,
-                min_length=min_chunk_length,
-                min_occurrences=min_chunk_occurrences
+            processed_text = self._remove_repeated_chunks(
+                processed_text, min_chunk_length, min_chunk_occurrences, keep_first_chunk
             )
-            
-            # Filter out overlapping chunks
-            non_overlapping_chunks = self.find_non_overlapping_chunks(chunks)
-            
-            # Sort chunks by position (reversed) to remove from end to start
-            for chunk, positions, _ in sorted(non_overlapping_chunks, 
-                                           key=lambda x: (-x[1][0], -len(x[0]))):
-                # Skip the first occurrence if keep_first_chunk is True
-                chunk_positions = positions[1:] if keep_first_chunk else positions
-                
-                # Remove chunks from end to start to maintain position accuracy
-                for pos in sorted(chunk_positions, reverse=True):
-                    processed_text = (
-                        processed_text[:pos] + 
-                        " " +  # Add space to prevent word joining
-                        processed_text[pos + len(chunk):]
-                    )
+        chunks_done = time.perf_counter()
+
+        trimmed = self._trim_words(processed_text, stemmer, remove_spaces, remove_stopwords, remove_punctuation)
+        if timings is not None:
+            timings["trim.contractions"] = contractions_done - start
+            if remove_chunks:
+                timings["trim.chunks"] = chunks_done - contractions_done
+            timings["trim.words"] = time.perf_counter() - chunks_done
+        return trimmed
+
+    def trim_pass(self, name: str, text: str, stemmer: str = "porter") -> str:
+        """
+        Apply one trimming pass. Words are kept separated by spaces, so passes
+        can be applied one after the other.
+        """
+        if name == "whitespace":
+            return WHITESPACE.sub(" ", self._merge_contractions(text)).strip()
+        if name == "punctuation":
+            return self._trim_words(text, None, False, False, True)
+        if name == "stopwords":
+            return self._trim_words(text, None, False, True, True)
+        if name == "chunks":
+            return WHITESPACE.sub(" ", self._remove_repeated_chunks(text, 15, 2, True)).strip()
+        if name == "stemming":
+            self._check_stemmer(stemmer)
+            return self._trim_words(text, stemmer, False, True, True)
+        raise ValueError(f"Trimming pass must be one of {TRIM_PASSES}")
+
+    def trim_stream(
+        self,
+        source: Union[Iterable[str], TextIO],
+        block_size: int = 64 * 1024,
+        window_size: int = 16 * 1024,
+        stemmer: Optional[str] = None,
+        remove_spaces: bool = True,
+        remove_stopwords: bool = True,
+        remove_punctuation: bool = True,
+        remove_chunks: bool = True,
+        min_chunk_length: int = 15,
+        min_chunk_occurrences: int = 2,
+        keep_first_chunk: bool = True
+    ) -> Iterator[str]:
+        """
+        Trim a large prompt incrementally with bounded memory
+
+        Args:
+            source: Iterable of text chunks or a file-like object opened in text mode
+            block_size: Amount of text trimmed at once; blocks are cut at whitespace
+            window_size: Amount of already trimmed input kept as a rolling window, so
+                chunks repeating an earlier block are removed as well
+            Other arguments as for trim()
+
+        Yields:
+            Trimmed output, block by block. Joining the pieces gives the trimmed prompt.
+        """
+        self._check_stemmer(stemmer)
+        if hasattr(source, "read"):
+            file = source
+            source = iter(lambda: file.read(block_size), "")
+
+        window = ""
+        pending = ""
+        emitted = False
+        join_str = "" if remove_spaces else " "
+
+        def trim_block(block: str) -> str:
+            nonlocal window
+            block = self._merge_contractions(block)
+            processed_block = block
+            if remove_chunks:
+                processed_block = self._remove_repeated_chunks(
+                    block, min_chunk_length, min_chunk_occurrences, keep_first_chunk, context=window
+                )
+            window = (window + block)[-window_size:] if window_size else ""
+            return self._trim_words(processed_block, stemmer, remove_spaces, remove_stopwords, remove_punctuation)
 
-        # Tokenize words after chunk removal
-        tokenized = nltk.word_tokenize(processed_text)
+        def blocks() -> Iterator[str]:
+            nonlocal pending
+            for piece in source:
+                pending += piece
+                while len(pending) >= block_size:
+                    cut = self._block_boundary(pending, block_size)
+                    block, pending = pending[:cut], pending[cut:]
+                    yield block
+            if pending:
+                yield pending
 
-        if remove_punctuation:
-            tokenized = [word for word in tokenized if word not in PUNCTUATION]
+        for block in blocks():
+            trimmed = trim_block(block)
+            if trimmed:
+                yield (join_str if emitted else "") + trimmed
+                emitted = True
+
+    @staticmethod
+    def _check_stemmer(stemmer: Optional[str]):
+        accepted_stemmers = ("snowball", "porter", "lancaster")
+        if stemmer and stemmer not in accepted_stemmers:
+            raise ValueError("Stemmer must be one of", accepted_stemmers)
 
-        if remove_stopwords:
-            tokenized = [word for word in tokenized if word.lower() not in self.words_to_exclude]
+    @staticmethod
+    def _merge_contractions(text: str) -> str:
+        return text.replace("'", "").replace("'", "")
+
+    @staticmethod
+    def _block_boundary(text: str, block_size: int) -> int:
+        """Cut position just after the last whitespace within the first block_size characters"""
+        cut = max(text.rfind(char, 0, block_size) for char in " \n\t")
+        return cut + 1 if cut >= 0 else block_size
+
+    def _remove_repeated_chunks(
+        self,
+        text: str,
+        min_length: int,
+        min_occurrences: int,
+        keep_first: bool,
+        context: str = ""
+    ) -> str:
+        """
+        Remove repeated chunks from text. Occurrences in context (text that precedes
+        it and was already emitted) are counted but never removed.
+        """
+        offset = len(context)
 
-        words = tokenized
+        # Find all repeated chunks
+        chunks = self.find_repeated_chunks(
+            context + text,
+            min_length=min_length,
+            min_occurrences=min_occurrences
+        )
 
-        # Apply stemming if requested
-        if stemmer:
-            stemmer_instance = self._get_stemmer(stemmer)
-            words = [stemmer_instance.stem(word) for word in tokenized]
-            words = self._restore_case(words, tokenized)
+        # Filter out overlapping chunks
+        non_overlapping_chunks = self.find_non_overlapping_chunks(chunks)
+
+        # Collect the spans to remove, skipping the first occurrence if keep_first is True
+        spans = []
+        for chunk, positions, _ in non_overlapping_chunks:
+            first = min(positions)
+            for pos in positions:
+                if pos < offset or (keep_first and pos == first):
+                    continue
+                spans.append((pos - offset, pos - offset + len(chunk)))
+
+        removed = IntervalSet()
+        for start, end in sorted(spans):
+            removed.add(start, end)
+
+        return self._remove_spans(text, removed)
+
+    def _trim_words(
+        self,
+        text: str,
+        stemmer: Optional[str],
+        remove_spaces: bool,
+        remove_stopwords: bool,
+        remove_punctuation: bool
+    ) -> str:
+        # Tokenize, filter and stem in a single pass over the text
+        excluded = self.words_to_exclude if remove_stopwords else frozenset()
+        punctuation = PUNCTUATION if remove_punctuation else frozenset()
+        stem = _stem_function(stemmer, self.language) if stemmer else None
+
+        words = []
+        for word in TOKEN_PATTERN.findall(text):
+            if word in punctuation or word.lower() in excluded:
+                continue
+            words.append(stem(word) if stem else word)
 
         # Join words
         join_str = "" if remove_spaces else " "
-        trimmed = join_str.join(words).strip()
-        
-        # Clean up multiple spaces that might have been introduced
-        trimmed = re.sub(r'\s+', ' ', trimmed)
-        
+        trimmed = join_str.join(words)
+
         if not remove_punctuation:
             # Remove spaces before punctuation
-            trimmed = re.sub(r"\s([?.!,:;])", r"\1", trimmed)
+            trimmed = SPACE_BEFORE_PUNCTUATION.sub(r"\1", trimmed)
 
         return trimmed
 
@@ -214,35 +515,156 @@ class TextProcessor:
             return []
             
         filtered_chunks = []
-        used_positions = set()
+        used_spans = IntervalSet()
         
         for chunk, positions, occurrences in chunks:
-            chunk_positions = set(range(pos, pos + len(chunk)) for pos in positions)
-            if not any(pos in used_positions for positions_set in chunk_positions for pos in positions_set):
+            if not any(used_spans.overlaps(pos, pos + len(chunk)) for pos in positions):
                 filtered_chunks.append((chunk, positions, occurrences))
-                used_positions.update(pos for positions_set in chunk_positions for pos in positions_set)
+                for pos in positions:
+                    used_spans.add(pos, pos + len(chunk))
                 
         return filtered_chunks
 
+    @staticmethod
+    def _remove_spans(text: str, spans: Iterable[Tuple[int, int]]) -> str:
+        """Build the text once from the kept pieces, replacing each removed span with a space"""
+        pieces = []
+        cursor = 0
+        for start, end in spans:
+            pieces.append(text[cursor:start])
+            pieces.append(" ")  # Add space to prevent word joining
+            cursor = end
+        pieces.append(text[cursor:])
+        return "".join(pieces)
+
     def _get_stemmer(self, stemmer_name: str):
-        """Get the appropriate stemmer instance"""
-        if stemmer_name == "porter":
-            return PorterStemmer()
-        elif stemmer_name == "snowball":
-            return SnowballStemmer(self.language)
-        elif stemmer_name == "lancaster":
-            return LancasterStemmer()
-        
-    def _restore_case(self, stemmed_words: List[str], original_words: List[str]) -> List[str]:
-        """Restore original case after stemming"""
-        case_restored = []
-        for stemmed, original in zip(stemmed_words, original_words):
-            if original.istitle():
-                stemmed = stemmed.title()
-            elif original.isupper():
-                stemmed = stemmed.upper()
-            case_restored.append(stemmed)
-        return case_restored
+        """Get the shared stemmer instance"""
+        return _stem_function(stemmer_name, self.language).stemmer
+
+    def _cache_key(self, text: str, trim_kwargs: dict):
+        unknown = set(trim_kwargs) - set(TRIM_DEFAULTS)
+        if unknown:
+            raise TypeError(f"Unexpected trim options: {sorted(unknown)}")
+        return TrimCache.key(text, options_fingerprint(self.language, {**TRIM_DEFAULTS, **trim_kwargs}))
+
+    def trim_many(self, texts: Sequence[str], **trim_kwargs) -> List[str]:
+        """Trim several texts in parallel on the trim process pool, reusing cached results"""
+        cache = get_trim_cache()
+        keys = [self._cache_key(text, trim_kwargs) for text in texts]
+        results = {key: cache.get(key) for key in keys}
+        missing = {key: text for key, text in zip(keys, texts) if results[key] is None}
+        CACHE_LOOKUPS.inc(len(keys) - len(missing), cache="trim", result="hit")
+        CACHE_LOOKUPS.inc(len(missing), cache="trim", result="miss")
+        if missing:
+            chunksize = max(1, len(missing) // (4 * TRIM_POOL_WORKERS))
+            trimmed = get_trim_pool().map(
+                partial(_timed_trim_in_worker, self.language, trim_kwargs), missing.values(), chunksize=chunksize
+            )
+            for key, (result, timings) in zip(missing, trimmed):
+                results[key] = result
+                observe_stages(timings)
+                cache.put(key, result, timings["trim"])
+        return [results[key] for key in keys]
+
+    async def trim_async(self, text: str, **trim_kwargs) -> str:
+        """trim() on the process pool, without blocking the event loop, reusing cached results"""
+        cache = get_trim_cache()
+        key = self._cache_key(text, trim_kwargs)
+        result = cache.get(key)
+        CACHE_LOOKUPS.inc(cache="trim", result="miss" if result is None else "hit")
+        if result is not None:
+            return result
+
+        loop = asyncio.get_running_loop()
+        result, timings = await loop.run_in_executor(
+            get_trim_pool(), _timed_trim_in_worker, self.language, trim_kwargs, text
+        )
+        observe_stages(timings)
+        cache.put(key, result, timings["trim"])
+        return result
+
+    async def trim_many_async(self, texts: Sequence[str], **trim_kwargs) -> List[str]:
+        return list(await asyncio.gather(*(self.trim_async(text, **trim_kwargs) for text in texts)))
+
+
+# Options of trim() and their defaults, part of the trim cache key
+TRIM_DEFAULTS = {
+    name: parameter.default
+    for name, parameter in inspect.signature(TextProcessor.trim).parameters.items()
+    if parameter.default is not inspect.Parameter.empty and name != "timings"
+}
+
+
+@lru_cache(maxsize=None)
+def get_text_processor(language: str = "english") -> TextProcessor:
+    """The shared TextProcessor of a language, so stopwords are loaded once per process"""
+    return TextProcessor(language)
+
+
+_trim_cache: Optional[TrimCache] = None
+
+
+def get_trim_cache() -> TrimCache:
+    """The process-wide trim result cache"""
+    global _trim_cache
+    if _trim_cache is None:
+        _trim_cache = TrimCache()
+    return _trim_cache
+
+
+_trim_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _init_trim_worker(languages: Tuple[str, ...]):
+    """Load stopwords and stemmers once when a worker process starts"""
+    for language in languages:
+        get_text_processor(language)
+        for stemmer_name in ("snowball", "porter", "lancaster"):
+            _stem_function(stemmer_name, language)
+
+
+def _trim_in_worker(language: str, trim_kwargs: dict, text: str) -> str:
+    return get_text_processor(language).trim(text, **trim_kwargs)
+
+
+def _timed_trim_in_worker(language: str, trim_kwargs: dict, text: str) -> Tuple[str, Dict[str, float]]:
+    """trim() in a worker, with the seconds spent in total ("trim") and per step"""
+    timings = {}
+    start = time.perf_counter()
+    result = get_text_processor(language).trim(text, timings=timings, **trim_kwargs)
+    timings["trim"] = time.perf_counter() - start
+    return result, timings
+
+
+def get_trim_pool() -> ProcessPoolExecutor:
+    """The process-wide trim pool, started on first use and reused afterwards"""
+    global _trim_pool
+    if _trim_pool is None:
+        # spawn rather than fork: the parent runs model threads that must not be forked
+        _trim_pool = ProcessPoolExecutor(
+            max_workers=TRIM_POOL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_trim_worker,
+            initargs=(("english",),),
+        )
+    return _trim_pool
+
+
+async def warm_up_trim_pool():
+    """Start every worker process, so the first requests do not pay for it"""
+    loop = asyncio.get_running_loop()
+    pool = get_trim_pool()
+    await asyncio.gather(*(
+        loop.run_in_executor(pool, _trim_in_worker, "english", {}, "warm up")
+        for _ in range(TRIM_POOL_WORKERS)
+    ))
+
+
+def shutdown_trim_pool():
+    global _trim_pool
+    if _trim_pool is not None:
+        _trim_pool.shutdown(cancel_futures=True)
+        _trim_pool = None
 
 
 def demo():
@@ -1,8 +1,165 @@
-from llmlingua import PromptCompressor
+"""
+Model based prompt compression with llmlingua.
 
-llm_lingua = PromptCompressor()
+The model is loaded once and runs on a dedicated worker thread, on CPU by
+default. Requests are queued and taken by the worker in micro-batches, and each
+one may ask for its own compression rate or target token budget.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional, Tuple
+import asyncio
+import logging
+import os
+import time
 
+from services.metrics import STAGE_SECONDS
 
-def trim(prompt: str):
-    compressed_prompt = llm_lingua.compress_prompt(prompt, instruction="", question="")
-    return compressed_prompt
\ No newline at end of file
+logger = logging.getLogger(__name__)
+
+LLMLINGUA_MODEL = os.getenv("LLMLINGUA_MODEL", "microsoft/llmlingua-2-bert-base-multilingual-cased-meetingbank")
+LLMLINGUA_DEVICE = os.getenv("LLMLINGUA_DEVICE", "cpu")
+DEFAULT_RATE = 0.5  # share of tokens kept when neither a rate nor a target is given
+
+
+@lru_cache(maxsize=None)
+def get_compressor():
+    """Load the llmlingua model on first use instead of at import time"""
+    from llmlingua import PromptCompressor
+
+    return PromptCompressor(
+        model_name=LLMLINGUA_MODEL,
+        device_map=LLMLINGUA_DEVICE,
+        use_llmlingua2="llmlingua-2" in LLMLINGUA_MODEL,
+    )
+
+
+class CompressionQueueFull(RuntimeError):
+    """More prompts are waiting for the model than the queue allows"""
+
+
+@dataclass
+class CompressionResult:
+    prompt: str
+    original_tokens: int
+    compressed_tokens: int
+    compression_ratio: float  # original tokens per compressed token
+    latency_seconds: float  # time in the queue plus compute_seconds
+    compute_seconds: float
+
+
+def _compress(prompt: str, rate: Optional[float], target_tokens: Optional[int]) -> Tuple[dict, float]:
+    start = time.perf_counter()
+    if target_tokens is not None:
+        result = get_compressor().compress_prompt(prompt, target_token=target_tokens)
+    else:
+        result = get_compressor().compress_prompt(prompt, rate=DEFAULT_RATE if rate is None else rate)
+    return result, time.perf_counter() - start
+
+
+class PromptCompressionService:
+    """
+    Queue in front of the llmlingua model.
+
+    Requests arriving within a short window are handed to the worker thread
+    together, which compresses them back to back (llmlingua compresses one
+    prompt per call). When more than _max_queue_size prompts are waiting,
+    compress() raises CompressionQueueFull instead of adding to the tail latency.
+    """
+    _instance = None
+    _batch_window = 0.005  # seconds to wait for more requests before handing a batch to the worker
+    _max_batch_size = 16
+    _max_queue_size = 64  # prompts waiting or being compressed
+
+    # Singleton pattern
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llmlingua")
+            cls._instance._pending = []  # (prompt, rate, target_tokens, enqueued_at, future)
+            cls._instance._flush_handle = None
+            cls._instance._queued = 0
+            cls._instance._batches = set()  # running batch tasks
+        return cls._instance
+
+    async def load(self):
+        """Load the model on the worker thread"""
+        await asyncio.get_running_loop().run_in_executor(self._executor, get_compressor)
+
+    async def compress(
+        self, prompt: str, rate: Optional[float] = None, target_tokens: Optional[int] = None
+    ) -> CompressionResult:
+        """Compress a prompt to the given share of its tokens, or to a token budget"""
+        if rate is not None and not 0 < rate <= 1:
+            raise ValueError("Compression rate must be in (0, 1]")
+        if target_tokens is not None and target_tokens <= 0:
+            raise ValueError("Target token budget must be positive")
+        if self._queued >= self._max_queue_size:
+            raise CompressionQueueFull(f"{self._queued} prompts are waiting for compression")
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queued += 1
+        self._pending.append((prompt, rate, target_tokens, time.perf_counter(), future))
+        if len(self._pending) >= self._max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self._batch_window, self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    def _compress_batch(self, batch: List[tuple]) -> List[Tuple[Optional[dict], float, Optional[Exception]]]:
+        results = []
+        for prompt, rate, target_tokens, _, _ in batch:
+            try:
+                result, seconds = _compress(prompt, rate, target_tokens)
+                results.append((result, seconds, None))
+            except Exception as e:
+                results.append((None, 0.0, e))
+        return results
+
+    async def _run_batch(self, batch: List[tuple]):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self._executor, self._compress_batch, batch)
+        except Exception as e:
+            logger.error(f"Failed to compress batch of {len(batch)} prompts: {str(e)}")
+            results = [(None, 0.0, e)] * len(batch)
+        finally:
+            self._queued -= len(batch)
+
+        done = time.perf_counter()
+        for (prompt, _, _, enqueued_at, future), (result, seconds, error) in zip(batch, results):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+                continue
+            STAGE_SECONDS.observe(seconds, stage="llmlingua")
+            STAGE_SECONDS.observe(done - enqueued_at - seconds, stage="llmlingua.queue")
+            original_tokens = int(result["origin_tokens"])
+            compressed_tokens = int(result["compressed_tokens"])
+            future.set_result(CompressionResult(
+                prompt=result["compressed_prompt"],
+                original_tokens=original_tokens,
+                compressed_tokens=compressed_tokens,
+                compression_ratio=original_tokens / compressed_tokens if compressed_tokens else 0.0,
+                latency_seconds=done - enqueued_at,
+                compute_seconds=seconds,
+            ))
+
+
+def trim(prompt: str) -> str:
+    """Compress a prompt synchronously with the default rate"""
+    result, _ = _compress(prompt, None, None)
+    return result["compressed_prompt"]
@@ -0,0 +1,121 @@
+from typing import Awaitable, Callable, Dict, List, Optional, Set, TypeVar
+import asyncio
+import logging
+import numpy as np
+from services.embedding_service import EmbeddingService, text_digest
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Case and whitespace insensitive form of a prompt"""
+    return " ".join(prompt.lower().split())
+
+
+class RequestCoalescer:
+    """
+    Single-flight deduplication of in-flight prompts.
+
+    The first request for a prompt runs the work in a task of its own. Requests
+    arriving while it runs await the same result instead of doing the work
+    again if their normalized prompt is identical or their embedding is at
+    least as similar as the threshold (the cache's by default). With exact=True
+    only identical prompts are coalesced and no embedding is computed. Only
+    requests of the same variant (e.g. trim options) are coalesced. The work is
+    not cancelled when the request that started it goes away.
+    """
+    _instance = None
+
+    # Singleton pattern
+    def __new__(cls):
+        if cls._instance is None:
+            from services.cache import CacheService
+
+            cls._instance = super().__new__(cls)
+            cls._instance.embedding_service = EmbeddingService()
+            cls._instance.threshold = CacheService._similarity_threshold
+            cls._instance._inflight: Dict[bytes, asyncio.Future] = {}  # normalized prompt digest -> result
+            # Per variant, the embeddings of the prompts whose work is running
+            cls._instance._embeddings: Dict[str, Dict[bytes, np.ndarray]] = {}
+            cls._instance._tasks: Set[asyncio.Task] = set()
+            cls._instance.leaders = 0
+            cls._instance.coalesced = 0
+        return cls._instance
+
+    def _find_similar(self, embedding: np.ndarray, threshold: float, variant: str) -> Optional[bytes]:
+        embeddings = self._embeddings.get(variant)
+        if not embeddings:
+            return None
+        keys: List[bytes] = list(embeddings)
+        similarities = np.stack([embeddings[key] for key in keys]) @ embedding
+        best = int(np.argmax(similarities))
+        return keys[best] if similarities[best] >= threshold else None
+
+    async def run(
+        self,
+        prompt: str,
+        work: Callable[[], Awaitable[T]],
+        threshold: Optional[float] = None,
+        variant: str = "",
+        exact: bool = False,
+    ) -> T:
+        """Result of work() for the prompt, shared with concurrent requests for the same or a similar prompt"""
+        if exact:
+            key = text_digest(f"exact\0{variant}\0{prompt}")
+        else:
+            key = text_digest(f"{variant}\0{normalize_prompt(prompt)}")
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        # Claimed before anything is awaited, so exact duplicates join right away
+        future = asyncio.get_running_loop().create_future()
+        # Nobody may be left to retrieve an error
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        task = asyncio.create_task(self._lead(key, prompt, work, threshold, variant, exact, future))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return await asyncio.shield(future)
+
+    async def _lead(
+        self,
+        key: bytes,
+        prompt: str,
+        work: Callable[[], Awaitable[T]],
+        threshold: Optional[float],
+        variant: str,
+        exact: bool,
+        future,
+    ):
+        try:
+            similar = None
+            if not exact:
+                embedding = await self.embedding_service.encode(prompt)
+                similar = self._find_similar(embedding, self.threshold if threshold is None else threshold, variant)
+            if similar is not None:
+                # A similar prompt is already being answered
+                logger.info("Coalesced request with a similar in-flight prompt")
+                self.coalesced += 1
+                result = await asyncio.shield(self._inflight[similar])
+            else:
+                self.leaders += 1
+                if not exact:
+                    self._embeddings.setdefault(variant, {})[key] = embedding
+                result = await work()
+            future.set_result(result)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            del self._inflight[key]
+            embeddings = self._embeddings.get(variant)
+            if embeddings is not None:
+                embeddings.pop(key, None)
+                if not embeddings:
+                    del self._embeddings[variant]
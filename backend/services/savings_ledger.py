@@ -0,0 +1,240 @@
+"""
+Append-only ledger of the token, energy and cost savings of every analyzed
+request.
+
+record() only appends to memory: the entry is queued and added to the
+aggregates of its time window and model. A background task flushes the queue
+in batches to SQLite (LEDGER_PATH), writing the raw entries and adding the
+window aggregates to a per (window, model) table in the same transaction.
+Totals are answered from that table plus the aggregates not flushed yet,
+without reading the raw entries.
+"""
+from dataclasses import asdict, dataclass, fields
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import contextlib
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+LEDGER_PATH = os.getenv(
+    "LEDGER_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "savings_ledger.sqlite3"),
+)
+LEDGER_WINDOW_SECONDS = int(os.getenv("LEDGER_WINDOW_SECONDS", "3600"))  # granularity of the aggregates
+LEDGER_FLUSH_INTERVAL = float(os.getenv("LEDGER_FLUSH_INTERVAL", "2.0"))  # seconds between flushes
+LEDGER_FLUSH_BATCH = int(os.getenv("LEDGER_FLUSH_BATCH", "1000"))  # entries that trigger an early flush
+
+if LEDGER_WINDOW_SECONDS <= 0:
+    raise ValueError("LEDGER_WINDOW_SECONDS must be positive")
+
+WindowKey = Tuple[int, str]  # (window start, model)
+
+
+@dataclass
+class LedgerEntry:
+    timestamp: float
+    model: str
+    original_tokens: int
+    optimized_tokens: int
+    token_savings: int
+    energy_saved_wh: float
+    cost_saved_dollars: float
+    cached: bool = False  # answered from the semantic cache, so the whole prompt was saved
+
+
+@dataclass
+class SavingsTotals:
+    requests: int = 0
+    original_tokens: int = 0
+    optimized_tokens: int = 0
+    token_savings: int = 0
+    energy_saved_wh: float = 0.0
+    cost_saved_dollars: float = 0.0
+
+    def add(self, other: "SavingsTotals"):
+        for field in fields(self):
+            setattr(self, field.name, getattr(self, field.name) + getattr(other, field.name))
+
+    @classmethod
+    def of(cls, entry: LedgerEntry) -> "SavingsTotals":
+        return cls(
+            requests=1,
+            original_tokens=entry.original_tokens,
+            optimized_tokens=entry.optimized_tokens,
+            token_savings=entry.token_savings,
+            energy_saved_wh=entry.energy_saved_wh,
+            cost_saved_dollars=entry.cost_saved_dollars,
+        )
+
+
+TOTAL_COLUMNS = [field.name for field in fields(SavingsTotals)]
+ENTRY_COLUMNS = [field.name for field in fields(LedgerEntry)]
+
+
+def window_start(timestamp: float) -> int:
+    return int(timestamp // LEDGER_WINDOW_SECONDS * LEDGER_WINDOW_SECONDS)
+
+
+class SavingsLedger:
+    _instance = None
+
+    # Singleton pattern
+    def __new__(cls, path: str = LEDGER_PATH):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.path = path
+            cls._instance._connection = None
+            cls._instance._db_lock = threading.Lock()
+            cls._instance._pending: List[LedgerEntry] = []
+            cls._instance._pending_windows: Dict[WindowKey, SavingsTotals] = {}
+            cls._instance._flush_requested = None
+            # Held by flushes and queries, so a query never misses entries that are being written
+            cls._instance._lock = asyncio.Lock()
+            cls._instance._flush_task = None
+            cls._instance.recorded = 0
+            cls._instance.flushed = 0
+        return cls._instance
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                f"CREATE TABLE IF NOT EXISTS entries ({', '.join(ENTRY_COLUMNS)})"
+            )
+            connection.execute(
+                f"CREATE TABLE IF NOT EXISTS windows (window_start INTEGER, model TEXT, {', '.join(TOTAL_COLUMNS)}, "
+                "PRIMARY KEY (window_start, model))"
+            )
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    def start(self):
+        """Start the background flushes; called from the app lifespan"""
+        if self._flush_task is None:
+            self._flush_requested = asyncio.Event()
+            self._flush_task = asyncio.create_task(self._flush_periodically())
+
+    async def close(self):
+        """Stop the background flushes and write what is left"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            # Let a flush in progress unwind before the last one
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._flush_task
+            self._flush_task = None
+        await self.flush()
+
+    def record(self, entry: LedgerEntry):
+        """Queue an entry for the next flush; never blocks"""
+        self._pending.append(entry)
+        key = (window_start(entry.timestamp), entry.model)
+        self._pending_windows.setdefault(key, SavingsTotals()).add(SavingsTotals.of(entry))
+        self.recorded += 1
+        if len(self._pending) >= LEDGER_FLUSH_BATCH and self._flush_requested is not None:
+            self._flush_requested.set()
+
+    async def _flush_periodically(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), LEDGER_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            entries, windows = self._pending, self._pending_windows
+            if not entries:
+                return
+            self._pending, self._pending_windows = [], {}
+            try:
+                await asyncio.to_thread(self._write, entries, windows)
+                self.flushed += len(entries)
+            except Exception as e:
+                logger.error(f"Failed to write {len(entries)} ledger entries: {str(e)}")
+                # Keep them for the next flush, ahead of the entries recorded meanwhile
+                self._pending = entries + self._pending
+                for key, totals in self._pending_windows.items():
+                    windows.setdefault(key, SavingsTotals()).add(totals)
+                self._pending_windows = windows
+
+    def _write(self, entries: List[LedgerEntry], windows: Dict[WindowKey, SavingsTotals]):
+        with self._db_lock:
+            connection = self._connect()
+            with connection:
+                connection.executemany(
+                    f"INSERT INTO entries VALUES ({', '.join('?' * len(ENTRY_COLUMNS))})",
+                    [tuple(asdict(entry).values()) for entry in entries],
+                )
+                connection.executemany(
+                    f"INSERT INTO windows VALUES (?, ?, {', '.join('?' * len(TOTAL_COLUMNS))}) "
+                    "ON CONFLICT (window_start, model) DO UPDATE SET "
+                    + ", ".join(f"{column} = {column} + excluded.{column}" for column in TOTAL_COLUMNS),
+                    [(start, model, *asdict(totals).values()) for (start, model), totals in windows.items()],
+                )
+
+    def _read_windows(self, since: Optional[int], until: Optional[int], model: Optional[str]) -> List[tuple]:
+        conditions, parameters = [], []
+        if since is not None:
+            conditions.append("window_start >= ?")
+            parameters.append(since)
+        if until is not None:
+            conditions.append("window_start < ?")
+            parameters.append(until)
+        if model is not None:
+            conditions.append("model = ?")
+            parameters.append(model)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._db_lock:
+            return self._connect().execute(
+                f"SELECT window_start, model, {', '.join(TOTAL_COLUMNS)} FROM windows {where}", parameters
+            ).fetchall()
+
+    async def totals(
+        self,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        model: Optional[str] = None,
+        group_by: Optional[str] = None,
+    ) -> Tuple[SavingsTotals, Dict[tuple, SavingsTotals]]:
+        """
+        Savings between since and until (timestamps, widened to whole windows),
+        optionally for one model, in total and grouped by "model" or "window".
+        """
+        if group_by not in (None, "model", "window"):
+            raise ValueError("group_by must be None, 'model' or 'window'")
+        first = window_start(since) if since is not None else None
+        # until falls in the window it ends, so that window is included
+        last = window_start(until) + LEDGER_WINDOW_SECONDS if until is not None else None
+
+        async with self._lock:
+            rows = [
+                ((start, row_model), SavingsTotals(*values))
+                for start, row_model, *values in await asyncio.to_thread(self._read_windows, first, last, model)
+            ]
+            # Recorded but not flushed yet
+            rows += [
+                (key, SavingsTotals(**asdict(totals)))
+                for key, totals in self._pending_windows.items()
+                if (first is None or key[0] >= first) and (last is None or key[0] < last)
+                and (model is None or key[1] == model)
+            ]
+
+        total = SavingsTotals()
+        groups: Dict[tuple, SavingsTotals] = {}
+        for (start, row_model), totals in rows:
+            total.add(totals)
+            if group_by is not None:
+                group = (row_model,) if group_by == "model" else (start,)
+                groups.setdefault(group, SavingsTotals()).add(totals)
+        return total, dict(sorted(groups.items()))
+
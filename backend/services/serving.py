@@ -0,0 +1,103 @@
+"""
+Serving modes of /optimize-prompt.
+
+Prompts are trimmed by the rule based TextProcessor ("rules"), compressed by
+the llmlingua model ("llmlingua") or trimmed pass by pass until they fit a
+token budget ("adaptive"), selected by TRIM_BACKEND or per request.
+
+"compare" (default) answers every prompt twice, original and optimized, for
+the side-by-side demo. "speculative" serves confident semantic cache hits,
+otherwise only queries the optimized prompt. A sample of the traffic also gets
+the original-prompt baseline call, and those answer pairs are appended to a
+JSONL log for offline quality analysis.
+"""
+from dataclasses import asdict, dataclass
+from typing import Optional
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SERVING_MODES = ("compare", "speculative")
+SERVING_MODE = os.getenv("SERVING_MODE", "compare")
+TRIM_BACKENDS = ("rules", "llmlingua", "adaptive")
+TRIM_BACKEND = os.getenv("TRIM_BACKEND", "rules")
+# Minimum similarity for serving a cached answer in speculative mode
+SPECULATIVE_CACHE_THRESHOLD = float(os.getenv("SPECULATIVE_CACHE_THRESHOLD", "0.95"))
+# Share of speculative requests that also get the original-prompt answer
+BASELINE_SAMPLE_RATE = float(os.getenv("BASELINE_SAMPLE_RATE", "0.05"))
+BASELINE_LOG_PATH = os.getenv(
+    "BASELINE_LOG_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "baseline_pairs.jsonl"),
+)
+
+if SERVING_MODE not in SERVING_MODES:
+    raise ValueError(f"SERVING_MODE must be one of {SERVING_MODES}")
+if TRIM_BACKEND not in TRIM_BACKENDS:
+    raise ValueError(f"TRIM_BACKEND must be one of {TRIM_BACKENDS}")
+
+
+@dataclass
+class BaselinePair:
+    timestamp: float
+    prompt: str
+    optimized_prompt: str
+    original_answer: str
+    optimized_answer: str
+    similarity_cosine: Optional[float] = None
+
+
+class BaselineRecorder:
+    """Samples requests for a baseline call and appends the answer pairs to a JSONL file"""
+    _instance = None
+
+    # Singleton pattern
+    def __new__(cls, path: str = BASELINE_LOG_PATH, sample_rate: float = BASELINE_SAMPLE_RATE):
+        if cls._instance is None:
+            if not 0.0 <= sample_rate <= 1.0:
+                raise ValueError("Baseline sample rate must be between 0 and 1")
+            cls._instance = super().__new__(cls)
+            cls._instance.path = path
+            cls._instance.sample_rate = sample_rate
+            cls._instance._lock = threading.Lock()
+            cls._instance.sampled = 0
+            cls._instance.skipped = 0
+        return cls._instance
+
+    def should_sample(self) -> bool:
+        sampled = random.random() < self.sample_rate
+        if sampled:
+            self.sampled += 1
+        else:
+            self.skipped += 1
+        return sampled
+
+    def _append(self, line: str):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    async def record(self, prompt: str, optimized_prompt: str, original_answer: str, optimized_answer: str):
+        """Score the answer pair by embedding similarity and append it to the log"""
+        from services.model_output_comparison import ModelOutputComparison
+
+        pair = BaselinePair(
+            timestamp=time.time(),
+            prompt=prompt,
+            optimized_prompt=optimized_prompt,
+            original_answer=original_answer,
+            optimized_answer=optimized_answer,
+        )
+        try:
+            pair.similarity_cosine = await ModelOutputComparison().calculate_similarity(
+                original_answer, optimized_answer
+            )
+            await asyncio.to_thread(self._append, json.dumps(asdict(pair)))
+        except Exception as e:
+            logger.error(f"Failed to record baseline pair: {str(e)}")
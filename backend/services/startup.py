@@ -0,0 +1,128 @@
+"""
+Startup helpers: local NLTK resources, offline model downloads and the optional
+warm-up phase that runs before a worker accepts traffic.
+
+Fetch everything the service needs at build time (see the Dockerfile):
+    python -m services.startup --models
+"""
+from functools import lru_cache
+import argparse
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# NLTK resources used by the trimmer, by download name and data path
+NLTK_RESOURCES = {
+    "stopwords": "corpora/stopwords",
+}
+
+NLTK_DATA_DIR = os.getenv(
+    "NLTK_DATA",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "nltk_data"),
+)
+
+# Load models and start worker processes before serving, unless WARM_UP=0
+WARM_UP = os.getenv("WARM_UP", "1") != "0"
+
+
+def configure_nltk_data():
+    """Point NLTK, and the trim worker processes started later, at the local data directory"""
+    import nltk
+
+    os.environ.setdefault("NLTK_DATA", NLTK_DATA_DIR)
+    if NLTK_DATA_DIR not in nltk.data.path:
+        nltk.data.path.insert(0, NLTK_DATA_DIR)
+
+
+@lru_cache(maxsize=None)
+def ensure_nltk_resources():
+    """Check that the NLTK resources are available locally. Never downloads."""
+    import nltk
+
+    configure_nltk_data()
+    missing = []
+    for name, path in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            missing.append(name)
+    if missing:
+        raise RuntimeError(
+            f"Missing NLTK resources {missing}. "
+            f"Run `python -m services.startup` to download them into {NLTK_DATA_DIR}"
+        )
+
+
+def download_nltk_resources():
+    import nltk
+
+    for name in NLTK_RESOURCES:
+        if not nltk.download(name, download_dir=NLTK_DATA_DIR, quiet=True):
+            raise RuntimeError(f"Failed to download NLTK resource {name}")
+    ensure_nltk_resources.cache_clear()
+    ensure_nltk_resources()
+
+
+def download_models():
+    """Fetch the embedding model, tokenizer and (if selected) llmlingua model into their local caches"""
+    import tiktoken
+    from sentence_transformers import SentenceTransformer
+    from services.embedding_service import EmbeddingService
+    from services.model_profiles import MODEL_PROFILES
+
+    SentenceTransformer(EmbeddingService._model_name)
+    for encoding_name in {profile.encoding for profile in MODEL_PROFILES.values()}:
+        tiktoken.get_encoding(encoding_name)
+
+    from services.serving import TRIM_BACKEND
+
+    if TRIM_BACKEND == "llmlingua":
+        from services.prompt_trimmer2 import get_compressor
+
+        get_compressor()
+
+
+async def warm_up():
+    """Load models and start worker processes, logging how long each step took"""
+    from services.embedding_service import EmbeddingService
+    from services.prompt_trimmer import get_text_processor, warm_up_trim_pool
+    from services.model_profiles import MODEL_PROFILES
+    from services.token_tracker import TokenTracker
+
+    from services.prompt_trimmer2 import PromptCompressionService
+    from services.serving import TRIM_BACKEND
+
+    steps = (
+        ("nltk", lambda: ensure_nltk_resources()),
+        ("text_processor", lambda: get_text_processor()),
+        ("trim_pool", warm_up_trim_pool),
+        ("embedding_model", lambda: EmbeddingService().encode("warm up")),
+        ("token_trackers", lambda: [TokenTracker(name) for name in MODEL_PROFILES]),
+    )
+    if TRIM_BACKEND == "llmlingua":
+        steps += (("llmlingua_model", lambda: PromptCompressionService().load()),)
+    for name, step in steps:
+        start = time.perf_counter()
+        result = step()
+        if hasattr(result, "__await__"):
+            await result
+        logger.info(f"Warm-up step {name} took {time.perf_counter() - start:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", action="store_true", help="also download the embedding model and tokenizer")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    download_nltk_resources()
+    logger.info(f"NLTK resources available in {NLTK_DATA_DIR}")
+    if args.models:
+        download_models()
+        logger.info("Embedding model and tokenizer downloaded")
+
+
+if __name__ == "__main__":
+    main()
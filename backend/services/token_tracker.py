@@ -1,25 +1,105 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List
+import os
+import threading
 import tiktoken
+from services.embedding_service import text_digest
+from services.metrics import timed
+from services.model_profiles import DEFAULT_MODEL, get_model_profile
+
+# Threads used by tiktoken's encode_batch
+ENCODE_THREADS = int(os.getenv("TOKEN_ENCODE_THREADS", min(8, os.cpu_count() or 1)))
+
+
+@lru_cache(maxsize=None)
+def get_encoder(encoding_name: str) -> tiktoken.Encoding:
+    """tiktoken encoding, loaded once per process"""
+    return tiktoken.get_encoding(encoding_name)
+
+
+@dataclass
+class TokenSavings:
+    original_tokens: int
+    optimized_tokens: int
+    token_savings: int  # never negative
+    token_savings_percentage: float
+
 
 class TokenTracker:
-    def __init__(self, model_name: str = "gpt-3.5-turbo"):
-        self.encoder = tiktoken.encoding_for_model(model_name)
+    """
+    Token counter for a model's tokenizer, shared by all requests.
+
+    The tokenizer comes from the model's profile. Models with the same encoding
+    share one instance, whose token counts are memoized in an LRU keyed by text
+    hash, so every text is encoded only once. Safe to use from worker threads.
+    """
+    _instances: Dict[str, "TokenTracker"] = {}
+    _memo_size = 10_000  # number of token counts kept in the LRU memo
+    _lock = threading.Lock()
+
+    # One shared instance per encoding
+    def __new__(cls, model_name: str = DEFAULT_MODEL):
+        encoding_name = get_model_profile(model_name).encoding
+        with cls._lock:
+            if encoding_name not in cls._instances:
+                instance = super().__new__(cls)
+                instance.encoding_name = encoding_name
+                instance.encoder = get_encoder(encoding_name)
+                instance._memo = OrderedDict()
+                instance._memo_lock = threading.Lock()
+                cls._instances[encoding_name] = instance
+            return cls._instances[encoding_name]
+
+    def _lookup(self, digest: bytes):
+        with self._memo_lock:
+            count = self._memo.get(digest)
+            if count is not None:
+                self._memo.move_to_end(digest)
+            return count
+
+    def _remember(self, digest: bytes, count: int):
+        with self._memo_lock:
+            self._memo[digest] = count
+            self._memo.move_to_end(digest)
+            while len(self._memo) > self._memo_size:
+                self._memo.popitem(last=False)
 
     def count_tokens(self, text: str) -> int:
-        tokens = self.encoder.encode(text)
-        return len(tokens)
+        return self.count_tokens_batch([text])[0]
 
-    def optimized_tokens(self, original_text: str, optimized_text: str) -> int:
-        original_tokens = self.count_tokens(original_text)
-        optimized_tokens = self.count_tokens(optimized_text)
+    @timed("count_tokens")
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        """Token counts of texts, encoding the uncached ones in one multithreaded batch"""
+        digests = [text_digest(text) for text in texts]
+        counts = {digest: self._lookup(digest) for digest in digests}
+        missing = {digest: text for digest, text in zip(digests, texts) if counts[digest] is None}
+        if len(missing) == 1:
+            (digest, text), = missing.items()
+            counts[digest] = len(self.encoder.encode(text))
+            self._remember(digest, counts[digest])
+        elif missing:
+            encoded = self.encoder.encode_batch(list(missing.values()), num_threads=ENCODE_THREADS)
+            for digest, tokens in zip(missing, encoded):
+                counts[digest] = len(tokens)
+                self._remember(digest, counts[digest])
+        return [counts[digest] for digest in digests]
+
+    def savings_report(self, original_text: str, optimized_text: str) -> TokenSavings:
+        """Token counts and savings of a prompt and its optimized version, each encoded at most once"""
+        original_tokens, optimized_tokens = self.count_tokens_batch([original_text, optimized_text])
         token_saving = original_tokens - optimized_tokens
-        return token_saving if token_saving > 0 else 0  # Ensures no negative values
+        return TokenSavings(
+            original_tokens=original_tokens,
+            optimized_tokens=optimized_tokens,
+            token_savings=token_saving if token_saving > 0 else 0,  # Ensures no negative values
+            # Avoid division by zero
+            token_savings_percentage=(token_saving / original_tokens) * 100 if original_tokens else 0.0,
+        )
 
-    def calculate_token_savings_percentage(self, original_text: str, optimized_text: str) -> float:
-        original_tokens = self.count_tokens(original_text)
-        optimized_tokens = self.count_tokens(optimized_text)
-        
-        if original_tokens == 0:  # Avoid division by zero
-            return 0.0
+    def optimized_tokens(self, original_text: str, optimized_text: str) -> int:
+        return self.savings_report(original_text, optimized_text).token_savings
 
-        token_saving = original_tokens - optimized_tokens
-        return (token_saving / original_tokens) * 100
\ No newline at end of file
+    def calculate_token_savings_percentage(self, original_text: str, optimized_text: str) -> float:
+        return self.savings_report(original_text, optimized_text).token_savings_percentage
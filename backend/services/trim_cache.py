@@ -0,0 +1,97 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+import hashlib
+import os
+import threading
+
+# Bounds of the trim result cache: number of entries and total characters of the trimmed texts
+TRIM_CACHE_ENTRIES = int(os.getenv("TRIM_CACHE_ENTRIES", "10000"))
+TRIM_CACHE_CHARS = int(os.getenv("TRIM_CACHE_CHARS", str(32 * 1024 * 1024)))
+
+CacheKey = Tuple[bytes, tuple]
+
+
+def options_fingerprint(language: str, options: dict) -> tuple:
+    """Hashable identity of a trim configuration; options must include the defaults"""
+    return (language,) + tuple(sorted(options.items()))
+
+
+@dataclass
+class TrimCacheStats:
+    entries: int
+    chars: int
+    max_entries: int
+    max_chars: int
+    hits: int
+    misses: int
+    evictions: int
+    hit_rate: float
+    time_saved_seconds: float  # trim time that hits did not have to spend again
+
+
+class TrimCache:
+    """
+    LRU of trim results keyed by (text digest, options fingerprint), bounded by
+    entry count and total size. Remembers how long each result took to compute,
+    to report the time saved by hits. Thread safe.
+    """
+    def __init__(self, max_entries: int = TRIM_CACHE_ENTRIES, max_chars: int = TRIM_CACHE_CHARS):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self._entries: "OrderedDict[CacheKey, Tuple[str, float]]" = OrderedDict()
+        self._chars = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._time_saved = 0.0
+
+    @staticmethod
+    def key(text: str, fingerprint: tuple) -> CacheKey:
+        return hashlib.sha256(text.encode("utf-8")).digest(), fingerprint
+
+    def get(self, key: CacheKey) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            self._time_saved += entry[1]
+            return entry[0]
+
+    def put(self, key: CacheKey, result: str, seconds: float):
+        if len(result) > self.max_chars:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._chars -= len(previous[0])
+            self._entries[key] = (result, seconds)
+            self._chars += len(result)
+            while len(self._entries) > self.max_entries or self._chars > self.max_chars:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._chars -= len(evicted)
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._chars = 0
+
+    def get_stats(self) -> TrimCacheStats:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return TrimCacheStats(
+                entries=len(self._entries),
+                chars=self._chars,
+                max_entries=self.max_entries,
+                max_chars=self.max_chars,
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                hit_rate=self._hits / lookups if lookups else 0.0,
+                time_saved_seconds=self._time_saved,
+            )
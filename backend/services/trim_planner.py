@@ -0,0 +1,102 @@
+"""
+Adaptive trimming: apply trimming passes from the cheapest to the most
+expensive and stop as soon as the prompt fits a token budget.
+
+    whitespace -> punctuation -> stopwords -> chunks -> stemming -> model
+
+The rule based passes run one after the other on a trim worker process, each on
+the output of the previous one. If they cannot reach the budget, the llmlingua
+model compresses the original prompt to the budget.
+"""
+from dataclasses import dataclass, field
+from typing import List, Optional
+import asyncio
+import time
+
+from services.metrics import STAGE_SECONDS
+from services.prompt_trimmer import TRIM_PASSES, get_text_processor, get_trim_pool
+from services.model_profiles import DEFAULT_MODEL
+from services.token_tracker import TokenTracker
+
+PASSES = TRIM_PASSES + ("model",)
+
+
+@dataclass
+class PassReport:
+    name: str
+    seconds: float
+    tokens: int  # token count after the pass
+
+
+@dataclass
+class TrimPlan:
+    text: str
+    original_tokens: int
+    tokens: int
+    budget: Optional[int]  # None runs every rule based pass
+    passes: List[PassReport] = field(default_factory=list)
+    fallback: bool = False  # the model pass was needed but its queue was full
+
+    @property
+    def budget_met(self) -> bool:
+        return self.budget is None or self.tokens <= self.budget
+
+
+def run_rule_passes(
+    text: str,
+    budget: Optional[int],
+    language: str = "english",
+    stemmer: str = "porter",
+    model_name: str = DEFAULT_MODEL,
+) -> TrimPlan:
+    """Apply the rule based passes in order until the text fits the budget"""
+    processor = get_text_processor(language)
+    token_tracker = TokenTracker(model_name)
+
+    tokens = token_tracker.count_tokens(text)
+    plan = TrimPlan(text=text, original_tokens=tokens, tokens=tokens, budget=budget)
+    for name in TRIM_PASSES:
+        if plan.budget_met and budget is not None:
+            break
+        start = time.perf_counter()
+        plan.text = processor.trim_pass(name, plan.text, stemmer)
+        plan.tokens = token_tracker.count_tokens(plan.text)
+        plan.passes.append(PassReport(name, time.perf_counter() - start, plan.tokens))
+    return plan
+
+
+async def plan_trim(
+    text: str,
+    budget: Optional[int],
+    language: str = "english",
+    stemmer: str = "porter",
+    model_name: str = DEFAULT_MODEL,
+    use_model: bool = True,
+) -> TrimPlan:
+    """Trim text down to budget tokens with as few and as cheap passes as possible"""
+    if budget is not None and budget <= 0:
+        raise ValueError("Token budget must be positive")
+    loop = asyncio.get_running_loop()
+    plan = await loop.run_in_executor(
+        get_trim_pool(), run_rule_passes, text, budget, language, stemmer, model_name
+    )
+    for report in plan.passes:
+        STAGE_SECONDS.observe(report.seconds, stage=f"trim.pass.{report.name}")
+    if plan.budget_met or not use_model:
+        return plan
+
+    from services.prompt_trimmer2 import CompressionQueueFull, PromptCompressionService
+
+    start = time.perf_counter()
+    try:
+        result = await PromptCompressionService().compress(text, target_tokens=budget)
+    except CompressionQueueFull:
+        plan.fallback = True
+        return plan
+    tokens = await asyncio.to_thread(TokenTracker(model_name).count_tokens, result.prompt)
+    # Keep the rule based result if the model did worse
+    if tokens < plan.tokens:
+        plan.text, plan.tokens = result.prompt, tokens
+    plan.passes.append(PassReport("model", time.perf_counter() - start, tokens))
+    STAGE_SECONDS.observe(plan.passes[-1].seconds, stage="trim.pass.model")
+    return plan
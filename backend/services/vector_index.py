@@ -0,0 +1,452 @@
+from typing import Dict, List, Optional, Tuple
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize a vector or a matrix of row vectors as float32"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class ExactVectorIndex:
+    """
+    Brute-force cosine similarity index.
+
+    All embeddings live normalized in one contiguous float32 matrix, so a lookup
+    is a single matrix-vector product instead of a Python loop over entries.
+    Entries are addressed by integer slots; removed slots are reused.
+    Storing rows as float16 halves the memory at the cost of slower lookups.
+
+    The matrix and validity mask can be supplied by the caller (e.g. memory-mapped
+    files shared between processes). Such an index does not grow, and refresh()
+    must be called when the arrays were changed from outside, with the changed
+    slots if they are known so only those are looked at.
+    """
+
+    def __init__(
+        self,
+        dim: int,
+        capacity: int = 1024,
+        dtype=np.float32,
+        matrix: Optional[np.ndarray] = None,
+        valid: Optional[np.ndarray] = None,
+    ):
+        self.dim = dim
+        self._growable = matrix is None
+        if matrix is None:
+            matrix = np.zeros((capacity, dim), dtype=dtype)
+            valid = np.zeros(capacity, dtype=bool)
+        elif valid is None or matrix.shape != (valid.shape[0], dim):
+            raise ValueError("An external matrix needs a validity mask with one entry per row")
+        self._matrix = matrix
+        self._valid = valid
+        # Validity of the slots as last counted; differs from an external mask until refresh()
+        self._seen = valid
+        self._size = 0  # high-water mark of used slots
+        self._count = 0
+        self._free: Optional[List[int]] = []  # None until needed after a full refresh
+        if not self._growable:
+            self.refresh()
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def capacity(self) -> int:
+        return self._matrix.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self._matrix.nbytes + self._valid.nbytes
+
+    def slots(self) -> np.ndarray:
+        """Slots that currently hold a vector"""
+        return np.flatnonzero(self._valid[:self._size])
+
+    def refresh(self, changed: Optional[np.ndarray] = None):
+        """
+        Re-derive the bookkeeping from the validity mask.
+
+        changed optionally lists the slots written or removed from outside since
+        the last refresh; without it the whole mask is scanned.
+        """
+        if changed is None:
+            self._seen = self._valid if self._growable else self._valid.copy()
+            slots = np.flatnonzero(self._valid)
+            self._size = int(slots[-1]) + 1 if slots.size else 0
+            self._count = int(slots.size)
+            self._free = None
+            return
+
+        changed = changed[self._valid[changed] != self._seen[changed]]
+        added = changed[self._valid[changed]]
+        removed = changed[~self._valid[changed]]
+        self._seen[changed] = self._valid[changed]
+        self._count += added.size - removed.size
+        if added.size:
+            self._size = max(self._size, int(added.max()) + 1)
+        if self._free is not None:
+            self._free.extend(removed.tolist())
+
+    def _grow(self):
+        capacity = self.capacity * 2
+        matrix = np.zeros((capacity, self.dim), dtype=self._matrix.dtype)
+        matrix[:self._size] = self._matrix[:self._size]
+        valid = np.zeros(capacity, dtype=bool)
+        valid[:self._size] = self._valid[:self._size]
+        self._matrix, self._valid, self._seen = matrix, valid, valid
+
+    def free_slot(self) -> Optional[int]:
+        """A slot that holds no vector, or None if the index is full"""
+        if self._free is None:
+            self._free = np.flatnonzero(~self._valid[:self._size])[::-1].tolist()
+        while self._free and self._valid[self._free[-1]]:
+            self._free.pop()  # taken by set() in the meantime
+        if self._free:
+            return self._free[-1]
+        return self._size if self._size < self.capacity else None
+
+    def add(self, vector: np.ndarray) -> int:
+        """Insert a vector and return the slot it was stored in"""
+        slot = self.free_slot()
+        if slot is None:
+            if not self._growable:
+                raise IndexError("Vector index is full")
+            self._grow()
+            slot = self._size
+        self.set(slot, vector)
+        return slot
+
+    def set(self, slot: int, vector: np.ndarray):
+        """Store a vector in a specific slot, replacing what was there"""
+        self._matrix[slot] = normalize(vector)
+        if not self._seen[slot]:
+            self._seen[slot] = True
+            self._count += 1
+        self._valid[slot] = True
+        self._size = max(self._size, slot + 1)
+
+    def remove(self, slot: int):
+        if not self._valid[slot] and not self._seen[slot]:
+            return
+        if self._seen[slot]:
+            self._seen[slot] = False
+            self._count -= 1
+        self._valid[slot] = False
+        if self._free is not None:
+            self._free.append(slot)
+
+    def clear(self):
+        self._valid[:] = False
+        self._seen[:] = False
+        self._size = 0
+        self._count = 0
+        self._free = []
+
+    def _top_k(self, candidates: Optional[np.ndarray], query: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        if candidates is None:
+            scores = self._matrix[:self._size] @ query
+            scores[~self._valid[:self._size]] = -np.inf
+            slots = None
+        else:
+            slots = candidates[self._valid[candidates]]
+            scores = self._matrix[slots] @ query
+
+        if scores.size == 0:
+            return []
+        k = min(k, scores.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        results = []
+        for i in top:
+            if scores[i] == -np.inf:
+                break
+            slot = int(i) if slots is None else int(slots[i])
+            results.append((slot, float(scores[i])))
+        return results
+
+    def search(self, vector: np.ndarray, k: int = 1) -> List[Tuple[int, float]]:
+        """Return up to k (slot, cosine similarity) pairs, best match first"""
+        if len(self) == 0:
+            return []
+        return self._top_k(None, self._query(vector), k)
+
+    def _query(self, vector: np.ndarray) -> np.ndarray:
+        return normalize(vector).astype(self._matrix.dtype, copy=False)
+
+
+class IVFVectorIndex(ExactVectorIndex):
+    """
+    Approximate index using an inverted file (IVF) over spherical k-means cells.
+
+    Vectors are assigned to their nearest centroid; a lookup only scores the
+    vectors in the n_probe cells closest to the query. Until enough vectors are
+    stored to train the centroids the index behaves exactly like ExactVectorIndex.
+    An index over an external matrix trains by default once half of it is used.
+
+    With state_dir, processes sharing an external matrix also share the index:
+    the centroids are saved to ivf_centroids.npz whenever they are trained and
+    the cell of every slot is kept in the memory-mapped ivf_assignment.npy, so
+    opening the index or picking up another process's writes reads the saved
+    assignment instead of the vectors and never retrains. Only set(), called
+    by the writer holding the store lock, trains.
+    """
+
+    def __init__(
+        self,
+        dim: int,
+        capacity: int = 1024,
+        dtype=np.float32,
+        matrix: Optional[np.ndarray] = None,
+        valid: Optional[np.ndarray] = None,
+        n_lists: int = 256,
+        n_probe: int = 8,
+        train_size: Optional[int] = None,
+        kmeans_iterations: int = 10,
+        seed: int = 0,
+        state_dir: Optional[str] = None,
+    ):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        if matrix is None:
+            self.train_size = max(train_size or n_lists * 40, n_lists)
+        else:
+            # A fixed-size index must be able to reach the training size
+            rows = matrix.shape[0]
+            self.train_size = max(train_size or min(n_lists * 40, rows // 2), n_lists)
+            if self.train_size > rows:
+                raise ValueError(f"IVF index needs {self.train_size} vectors to train but only holds {rows}")
+        self.kmeans_iterations = kmeans_iterations
+        self._rng = np.random.default_rng(seed)
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[List[int]] = []
+        self._list_arrays: Dict[int, np.ndarray] = {}
+        self._assignment = np.full(capacity if matrix is None else matrix.shape[0], -1, dtype=np.int32)
+        self._trained_at = 0
+        self.state_dir = state_dir
+        self._shared_assignment: Optional[np.ndarray] = None
+        self._state_version = None
+        if state_dir is not None:
+            if matrix is None:
+                raise ValueError("Only an index over an external matrix can share its state")
+            self._shared_assignment = self._open_shared_assignment(matrix.shape[0])
+        super().__init__(dim, capacity, dtype, matrix, valid)
+
+    @property
+    def _state_path(self) -> str:
+        return os.path.join(self.state_dir, "ivf_centroids.npz")
+
+    def _open_shared_assignment(self, rows: int) -> np.ndarray:
+        path = os.path.join(self.state_dir, "ivf_assignment.npy")
+        if not os.path.exists(path):
+            assignment = np.lib.format.open_memmap(path, mode="w+", dtype=np.int32, shape=(rows,))
+            assignment[:] = -1
+            return assignment
+        assignment = np.lib.format.open_memmap(path, mode="r+")
+        if assignment.dtype != np.int32 or assignment.shape != (rows,):
+            raise ValueError(f"IVF assignment {path} has shape {assignment.shape}, expected {(rows,)}")
+        return assignment
+
+    def _save_state(self):
+        with open(self._state_path + ".tmp", "wb") as f:
+            np.savez(f, centroids=self._centroids, trained_at=self._trained_at)
+        os.replace(self._state_path + ".tmp", self._state_path)
+        self._state_version = self._version()
+
+    def _version(self):
+        try:
+            stat = os.stat(self._state_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _load_state(self) -> bool:
+        """Adopt centroids saved by another process; returns whether they changed"""
+        if self.state_dir is None:
+            return False
+        version = self._version()
+        if version is None or version == self._state_version:
+            return False
+        with np.load(self._state_path) as state:
+            centroids, trained_at = state["centroids"], int(state["trained_at"])
+        self._state_version = version
+        if centroids.shape != (self.n_lists, self.dim):
+            logger.warning(f"Ignoring saved IVF centroids of shape {centroids.shape}")
+            return False
+
+        self._centroids = centroids
+        self._trained_at = trained_at
+        slots = self.slots()
+        labels = self._shared_assignment[slots]
+        known = labels >= 0
+        slots, missing, labels = slots[known], slots[~known], labels[known]
+        order = np.argsort(labels, kind="stable")
+        bounds = np.cumsum(np.bincount(labels, minlength=self.n_lists))[:-1]
+        self._lists = [cell.tolist() for cell in np.split(slots[order], bounds)]
+        self._list_arrays = {}
+        self._assignment[:] = -1
+        self._assignment[slots] = labels
+        self._assign(missing)
+        logger.info(f"Loaded IVF centroids trained on {trained_at} vectors")
+        return True
+
+    @property
+    def nbytes(self) -> int:
+        nbytes = super().nbytes + self._assignment.nbytes
+        if self._centroids is not None:
+            nbytes += self._centroids.nbytes + 8 * sum(len(cell) for cell in self._lists)
+        return nbytes
+
+    def _grow(self):
+        super()._grow()
+        assignment = np.full(self.capacity, -1, dtype=np.int32)
+        assignment[:self._assignment.shape[0]] = self._assignment
+        self._assignment = assignment
+
+    def _unassign(self, slot: int):
+        label = int(self._assignment[slot])
+        if label >= 0:
+            self._lists[label].remove(slot)
+            self._list_arrays.pop(label, None)
+            self._assignment[slot] = -1
+
+    def _place(self, slots: np.ndarray, labels: np.ndarray):
+        for slot, label in zip(slots.tolist(), labels.tolist()):
+            self._unassign(slot)
+            self._lists[label].append(slot)
+            self._list_arrays.pop(label, None)
+            self._assignment[slot] = label
+
+    def _assign(self, slots: np.ndarray):
+        for start in range(0, slots.size, 65536):
+            batch = slots[start:start + 65536]
+            labels = np.argmax(self._matrix[batch].astype(np.float32) @ self._centroids.T, axis=1)
+            self._place(batch, labels)
+            if self._shared_assignment is not None:
+                self._shared_assignment[batch] = labels
+
+    def _train(self):
+        slots = self.slots()
+        sample = slots
+        if sample.size > self.n_lists * 256:
+            sample = self._rng.choice(slots, self.n_lists * 256, replace=False)
+        data = self._matrix[sample].astype(np.float32)
+
+        centroids = data[self._rng.choice(data.shape[0], self.n_lists, replace=False)]
+        for _ in range(self.kmeans_iterations):
+            labels = np.argmax(data @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, data)
+            empty = np.bincount(labels, minlength=self.n_lists) == 0
+            sums[empty] = centroids[empty]  # keep centroids of empty cells
+            centroids = normalize(sums)
+
+        self._centroids = centroids
+        self._lists = [[] for _ in range(self.n_lists)]
+        self._list_arrays = {}
+        self._assignment[:] = -1
+        if self._shared_assignment is not None:
+            self._shared_assignment[:] = -1
+        self._assign(slots)
+        self._trained_at = slots.size
+        if self.state_dir is not None:
+            self._save_state()
+        logger.info(f"Trained IVF index with {self.n_lists} lists on {slots.size} vectors")
+
+    def _update(self, slots: np.ndarray):
+        if self._centroids is None:
+            if len(self) >= self.train_size:
+                self._train()
+        elif len(self) >= 2 * self._trained_at:
+            # Retrain as the data grows so cells stay balanced
+            self._train()
+        else:
+            self._assign(slots)
+
+    def refresh(self, changed: Optional[np.ndarray] = None):
+        super().refresh(changed)
+        if changed is None:
+            self._state_version = None  # rebuild the cells from the saved assignment
+        if self._load_state():
+            return
+        if changed is None:
+            self._centroids = None
+            self._update(self.slots())
+            return
+        if self._centroids is None:
+            # Processes sharing the state leave training to the writer
+            if self.state_dir is None and len(self) >= self.train_size:
+                self._train()
+            return
+
+        for slot in changed[~self._valid[changed]].tolist():
+            self._unassign(slot)
+        current = changed[self._valid[changed]]
+        if self._shared_assignment is None:
+            self._update(current)
+            return
+        # Assigned by the processes that wrote them, with the same centroids
+        labels = self._shared_assignment[current]
+        self._place(current[labels >= 0], labels[labels >= 0])
+        self._assign(current[labels < 0])
+
+    def set(self, slot: int, vector: np.ndarray):
+        super().set(slot, vector)
+        self._update(np.array([slot]))
+
+    def remove(self, slot: int):
+        if not self._valid[slot]:
+            return
+        super().remove(slot)
+        if self._centroids is not None:
+            self._unassign(slot)
+
+    def clear(self):
+        super().clear()
+        self._centroids = None
+        self._lists = []
+        self._list_arrays = {}
+        self._assignment[:] = -1
+        self._trained_at = 0
+        if self.state_dir is not None:
+            self._shared_assignment[:] = -1
+            if os.path.exists(self._state_path):
+                os.remove(self._state_path)
+            self._state_version = None
+
+    def _cell(self, label: int) -> np.ndarray:
+        if label not in self._list_arrays:
+            self._list_arrays[label] = np.array(self._lists[label], dtype=np.int64)
+        return self._list_arrays[label]
+
+    def search(self, vector: np.ndarray, k: int = 1) -> List[Tuple[int, float]]:
+        if len(self) == 0:
+            return []
+        query = self._query(vector)
+        if self._centroids is None:
+            return self._top_k(None, query, k)
+
+        n_probe = min(self.n_probe, self.n_lists)
+        probes = np.argpartition(-(self._centroids @ query.astype(np.float32)), n_probe - 1)[:n_probe]
+        candidates = np.concatenate([self._cell(int(label)) for label in probes])
+        return self._top_k(candidates, query, k)
+
+
+INDEX_BACKENDS = {
+    "exact": ExactVectorIndex,
+    "ivf": IVFVectorIndex,
+}
+
+
+def create_index(backend: str, dim: int, **kwargs) -> ExactVectorIndex:
+    """Create a vector index by backend name ("exact" or "ivf")"""
+    if backend not in INDEX_BACKENDS:
+        raise ValueError(f"Index backend must be one of {tuple(INDEX_BACKENDS)}")
+    return INDEX_BACKENDS[backend](dim, **kwargs)
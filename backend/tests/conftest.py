@@ -0,0 +1,129 @@
+import socket
+import threading
+import time
+
+import pytest
+import uvicorn
+
+from benchmarks.fake_openai import create_app
+
+
+class BackgroundServer:
+    """An ASGI app served by uvicorn from a background thread"""
+    def __init__(self, app):
+        self.app = app
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        self.thread.start()
+        deadline = time.monotonic() + 30
+        while not self.server.started:
+            if time.monotonic() > deadline or not self.thread.is_alive():
+                raise RuntimeError("Server did not start")
+            time.sleep(0.01)
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+class FakeOpenAI(BackgroundServer):
+    """benchmarks/fake_openai.py, without latency unless asked for"""
+    def __init__(self, **options):
+        super().__init__(create_app(**{"latency": 0.0, "jitter": 0.0, "token_latency": 0.0, **options}))
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.url}/v1"
+
+    @property
+    def requests(self) -> int:
+        return self.app.state.requests
+
+
+@pytest.fixture
+def fake_openai():
+    """Start fake OpenAI servers with the given create_app options"""
+    servers = []
+
+    def start(**options) -> FakeOpenAI:
+        server = FakeOpenAI(**options)
+        server.start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+class RecordingCache:
+    """Semantic cache that never hits and records what is saved"""
+    def __init__(self):
+        self.saved = []
+
+    async def check_cache(self, prompt: str):
+        from services.cache import CacheResult
+
+        return CacheResult(answer="None", cached=False)
+
+    async def save_cache(self, prompt: str, answer: str):
+        self.saved.append((prompt, answer))
+
+
+@pytest.fixture
+def nltk_resources():
+    """Skip tests of the rule based trimmer where its NLTK data was not downloaded (python -m services.startup)"""
+    from services.startup import ensure_nltk_resources
+
+    try:
+        ensure_nltk_resources()
+    except RuntimeError as e:
+        pytest.skip(str(e))
+
+
+@pytest.fixture
+def app_server(monkeypatch, tmp_path, nltk_resources):
+    """
+    Start main.app against a fake OpenAI server started with the given options,
+    with a recording semantic cache and its data files in a temporary directory.
+    """
+    import main
+    from services import llm_client
+    from services.savings_ledger import SavingsLedger
+
+    servers = []
+
+    def start(**options) -> BackgroundServer:
+        fake = FakeOpenAI(**options)
+        fake.start()
+        servers.append(fake)
+        monkeypatch.setenv("OPENAI_BASE_URL", fake.base_url)
+        monkeypatch.setenv("OPENAI_API_KEY", "fake")
+        monkeypatch.setattr(main, "WARM_UP", False)
+        monkeypatch.setattr(SavingsLedger, "_instance", None)
+        SavingsLedger(str(tmp_path / "ledger.sqlite3"))
+        cache = RecordingCache()
+        monkeypatch.setitem(main.app.dependency_overrides, main.get_cache_service, lambda: cache)
+
+        server = BackgroundServer(main.app)
+        server.cache = cache
+        server.fake = fake
+        server.start()
+        servers.append(server)
+        # Fail fast instead of backing off
+        client = llm_client.get_llm_client()
+        client.backoff_base = client.backoff_max = 0.0
+        return server
+
+    yield start
+    for server in reversed(servers):
+        server.stop()
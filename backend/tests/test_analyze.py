@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+import main
+from services.savings_ledger import SavingsLedger
+from services.token_tracker import TokenSavings
+
+
+class WordTracker:
+    """Counts words instead of tokens, so no tokenizer has to be loaded"""
+    def savings_report(self, original_text: str, optimized_text: str) -> TokenSavings:
+        original, optimized = len(original_text.split()), len(optimized_text.split())
+        return TokenSavings(original, optimized, max(original - optimized, 0), (original - optimized) / original * 100)
+
+
+class UnusedComparison:
+    async def compare(self, *args):
+        raise AssertionError("Similarity must not be scored")
+
+
+@pytest.fixture
+def ledger(monkeypatch, tmp_path):
+    monkeypatch.setattr(SavingsLedger, "_instance", None)
+    monkeypatch.setattr(main, "get_token_tracker", lambda model: WordTracker())
+    return SavingsLedger(str(tmp_path / "ledger.sqlite3"))
+
+
+def analyze(ledger, **fields):
+    request = main.AnalyzePromptRequest(**fields)
+    return asyncio.run(main.analyze(request, comparison_service=UnusedComparison(), savings_ledger=ledger))
+
+
+def test_unanswered_original_prompt_skips_similarity(ledger):
+    response = analyze(
+        ledger,
+        originalPrompt="please tell me what the capital city of France is",
+        optimizedPrompt="capital France",
+        originalAnswer="None",
+        optimizedAnswer="Paris",
+    )
+
+    assert response.similarityScoreCosine is None
+    assert response.similarityScoreGPT is None
+    assert (response.originalTokens, response.optimizedTokens, response.tokenSavings) == (10, 2, 8)
+    calculator = main.get_energy_calculator(main.DEFAULT_MODEL)
+    assert response.energySavedWatts == pytest.approx(calculator.calculate_energy_saving(8))
+    assert response.costSavedDollars == pytest.approx(calculator.calculate_cost_saving(8))
+
+    [entry] = ledger._pending
+    assert (entry.token_savings, entry.cached) == (8, False)
+    assert entry.energy_saved_wh == pytest.approx(response.energySavedWatts)
+
+
+def test_unjudged_answer_has_no_gpt_score(ledger):
+    class FailingJudge:
+        async def compare(self, *args):
+            return 0.9, None
+
+    request = main.AnalyzePromptRequest(
+        originalPrompt="please tell me what the capital city of France is",
+        optimizedPrompt="capital France",
+        originalAnswer="Paris",
+        optimizedAnswer="Paris",
+    )
+    response = asyncio.run(main.analyze(request, comparison_service=FailingJudge(), savings_ledger=ledger))
+
+    assert response.similarityScoreCosine == 0.9
+    assert response.similarityScoreGPT is None
@@ -0,0 +1,169 @@
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from services import cache as cache_module
+from services.cache import CacheService
+
+
+class OneHotEmbedding:
+    """Embeds each distinct text as its own unit vector, so only identical texts are similar"""
+    dim = 16
+    _texts = {}  # shared by all instances, like a real model
+
+    async def encode(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        vector[self._texts.setdefault(text, len(self._texts))] = 1.0
+        return vector
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture(params=["memory", "disk"])
+def make_cache(request, monkeypatch, tmp_path):
+    clock = Clock()
+    monkeypatch.setattr(cache_module, "time", SimpleNamespace(time=clock.time))
+    monkeypatch.setattr(cache_module, "EmbeddingService", OneHotEmbedding)
+    monkeypatch.setattr(OneHotEmbedding, "_texts", {})
+
+    def make(**attributes) -> CacheService:
+        monkeypatch.setattr(CacheService, "_instance", None)
+        monkeypatch.setattr(CacheService, "_store_path", str(tmp_path / "store") if request.param == "disk" else None)
+        for name, value in attributes.items():
+            monkeypatch.setattr(CacheService, name, value)
+        cache = CacheService()
+        cache.clock = clock
+        return cache
+
+    return make
+
+
+def save(cache, *queries):
+    for query in queries:
+        assert asyncio.run(cache.save_cache(query, f"answer to {query}"))
+        cache.clock.now += 1
+
+
+def answer(cache, query):
+    result = asyncio.run(cache.check_cache(query))
+    cache.clock.now += 1
+    return result.answer if result.cached else None
+
+
+def test_lru_evicts_the_least_recently_used_entry(make_cache):
+    cache = make_cache(_capacity=2, _eviction_policy="lru")
+    save(cache, "a", "b")
+    assert answer(cache, "a") == "answer to a"
+
+    save(cache, "c")
+
+    assert answer(cache, "b") is None
+    assert answer(cache, "a") == "answer to a"
+    assert answer(cache, "c") == "answer to c"
+    assert (cache.get_stats().entries, cache.get_stats().evictions) == (2, 1)
+
+
+def test_lfu_evicts_the_least_frequently_used_entry(make_cache):
+    cache = make_cache(_capacity=2, _eviction_policy="lfu")
+    save(cache, "a", "b")
+    answer(cache, "a")
+    answer(cache, "a")
+    answer(cache, "b")  # used more recently, but less often
+
+    save(cache, "c")
+
+    assert answer(cache, "b") is None
+    assert answer(cache, "a") == "answer to a"
+    assert answer(cache, "c") == "answer to c"
+
+
+def test_saving_a_query_again_overwrites_its_entry(make_cache):
+    cache = make_cache(_capacity=2)
+    save(cache, "a", "b")
+    assert asyncio.run(cache.save_cache("a", "new answer"))
+
+    assert answer(cache, "a") == "new answer"
+    assert answer(cache, "b") == "answer to b"
+    stats = cache.get_stats()
+    assert (stats.entries, stats.evictions) == (2, 0)
+
+
+def test_expired_entries_are_not_served(make_cache):
+    cache = make_cache(_ttl_seconds=60)
+    save(cache, "a")
+    assert answer(cache, "a") == "answer to a"
+
+    cache.clock.now += 60
+    assert answer(cache, "a") is None
+    stats = cache.get_stats()
+    assert (stats.entries, stats.expirations) == (0, 1)
+
+
+def test_expired_entries_are_freed_before_evicting(make_cache):
+    cache = make_cache(_capacity=2, _ttl_seconds=60)
+    save(cache, "a")
+    cache.clock.now += 30
+    save(cache, "b")
+    cache.clock.now += 30
+
+    save(cache, "c")  # "a" expired, "b" did not
+
+    assert answer(cache, "b") == "answer to b"
+    assert answer(cache, "c") == "answer to c"
+    stats = cache.get_stats()
+    assert (stats.entries, stats.evictions, stats.expirations) == (2, 0, 1)
+
+
+@pytest.mark.parametrize("make_cache", ["disk"], indirect=True)
+def test_workers_see_each_others_writes_and_evictions(make_cache):
+    first = make_cache(_capacity=2)
+    save(first, "a", "b")
+    second = make_cache(_capacity=2)  # another worker on the same store
+    assert answer(second, "a") == "answer to a"
+
+    save(second, "c")  # evicts "b", the least recently used
+
+    assert answer(first, "c") == "answer to c"
+    assert answer(first, "b") is None
+    assert answer(first, "a") == "answer to a"
+    assert first.get_stats().entries == 2
+
+
+@pytest.mark.parametrize("make_cache", ["disk"], indirect=True)
+def test_slow_store_writes_do_not_block_the_event_loop(make_cache, monkeypatch):
+    import time
+
+    cache = make_cache()
+    commit = cache.store.commit
+
+    def slow_commit():
+        time.sleep(0.3)  # e.g. compacting a large payload log
+        commit()
+
+    monkeypatch.setattr(cache.store, "commit", slow_commit)
+
+    async def run():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        saved = await cache.save_cache("a", "answer to a")
+        ticker.cancel()
+        return saved, ticks
+
+    saved, ticks = asyncio.run(run())
+    assert saved
+    assert ticks >= 10
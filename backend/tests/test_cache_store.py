@@ -0,0 +1,64 @@
+from services.cache_store import DiskCacheStore
+
+
+def save(store, slot, query, answer):
+    """Store an entry the way CacheService.save_cache does"""
+    with store.lock():
+        store.write_payload(slot, query, answer)
+        store.meta["valid"][slot] = True
+        store.commit()
+
+
+def small_store(path, **attributes):
+    store = DiskCacheStore(str(path), capacity=64, dim=4)
+    store._compact_min_bytes = 0
+    for name, value in attributes.items():
+        setattr(store, name, value)
+    return store
+
+
+def test_overwrites_do_not_grow_the_log(tmp_path):
+    store = small_store(tmp_path)
+    for round in range(5):
+        for slot in range(50):
+            save(store, slot, f"query {slot}", f"answer {slot} " * 5 + str(round))
+        # Compaction keeps at most as much dead data as live data
+        assert store.log_bytes <= 2 * store.payload_bytes
+    for slot in range(50):
+        assert store.read_payload(slot) == (f"query {slot}", f"answer {slot} " * 5 + "4")
+
+
+def test_payload_bytes_only_counts_live_entries(tmp_path):
+    store = small_store(tmp_path, _compact_min_bytes=1 << 30)
+    for slot in range(10):
+        save(store, slot, "query", "answer")
+    live = store.payload_bytes
+    with store.lock():
+        store.meta["valid"][:5] = False
+        store.commit()
+    assert store.payload_bytes == live // 2
+    assert store.log_bytes == live
+
+
+def test_other_processes_read_the_compacted_log(tmp_path):
+    writer = small_store(tmp_path, _compact_min_bytes=1 << 30)
+    for slot in range(20):
+        save(writer, slot, f"query {slot}", "old")
+    reader = small_store(tmp_path, _compact_min_bytes=1 << 30)
+    assert reader.read_payload(3) == ("query 3", "old")
+
+    for slot in range(20):
+        save(writer, slot, f"query {slot}", "new")
+    writer.compact()
+    assert writer.log_bytes == writer.payload_bytes
+    # The reader still has the replaced file open and must switch to the new one
+    assert [reader.read_payload(slot) for slot in range(20)] == [(f"query {slot}", "new") for slot in range(20)]
+
+
+def test_reopening_drops_an_unfinished_compaction(tmp_path):
+    store = small_store(tmp_path)
+    save(store, 0, "query", "answer")
+    (tmp_path / "payloads.log.compact").write_bytes(b"partial")
+    reopened = DiskCacheStore(str(tmp_path), capacity=64, dim=4)
+    assert not (tmp_path / "payloads.log.compact").exists()
+    assert reopened.read_payload(0) == ("query", "answer")
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from services.energy_calculator import EnergyCalculator
+from services.model_profiles import DEFAULT_MODEL, ENERGY_WH_PER_INPUT_TOKEN, MODEL_PROFILES, get_model_profile
+
+
+def test_profiles_are_looked_up_by_name():
+    profile = get_model_profile("gpt-4o")
+    assert profile is MODEL_PROFILES["gpt-4o"]
+    assert (profile.encoding, profile.input_price_per_token) == ("o200k_base", 2.50e-6)
+    assert get_model_profile(DEFAULT_MODEL).name == DEFAULT_MODEL
+    assert all(profile.input_wh_per_token == ENERGY_WH_PER_INPUT_TOKEN for profile in MODEL_PROFILES.values())
+
+
+def test_unknown_model_is_rejected():
+    with pytest.raises(ValueError, match="gpt-4o-mini"):
+        get_model_profile("gpt-5-nano")
+    with pytest.raises(ValueError):
+        EnergyCalculator("gpt-5-nano")
+
+
+def test_single_count_gives_a_float():
+    calculator = EnergyCalculator("gpt-4o")
+    energy, cost = calculator.calculate_energy_saving(100), calculator.calculate_cost_saving(100)
+    assert type(energy) is float and type(cost) is float
+    assert energy == pytest.approx(100 * ENERGY_WH_PER_INPUT_TOKEN)
+    assert cost == pytest.approx(100 * 2.50e-6)
+
+
+def test_counts_give_an_array():
+    calculator = EnergyCalculator("gpt-4-turbo")
+    saved = [0, 10, 250]
+    for counts in (saved, np.array(saved)):
+        energy, cost = calculator.calculate_energy_saving(counts), calculator.calculate_cost_saving(counts)
+        assert isinstance(energy, np.ndarray) and isinstance(cost, np.ndarray)
+        np.testing.assert_allclose(energy, np.array(saved) * ENERGY_WH_PER_INPUT_TOKEN)
+        np.testing.assert_allclose(cost, np.array(saved) * 10.00e-6)
+        # element-wise the same as one count at a time
+        assert list(cost) == [calculator.calculate_cost_saving(count) for count in saved]
+
+
+def test_overrides_replace_the_profile_rates():
+    calculator = EnergyCalculator("gpt-4o", watt_per_token=0.5, cost_per_token=0.01)
+    assert calculator.calculate_energy_saving(4) == 2.0
+    assert calculator.calculate_cost_saving(np.array([1, 2])).tolist() == [0.01, 0.02]
+    # An override of zero is kept, not replaced by the profile
+    assert EnergyCalculator(cost_per_token=0.0).calculate_cost_saving(1000) == 0.0
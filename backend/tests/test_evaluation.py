@@ -0,0 +1,131 @@
+from types import SimpleNamespace
+import asyncio
+import json
+import time
+
+import numpy as np
+import pyarrow.parquet as pq
+import pytest
+
+from services import embedding_service, evaluation, llm_client, model_output_comparison, token_tracker
+from services.llm_client import LLMClient
+
+PROMPTS = [f"Please explain question number {i} about the weather in a few short sentences" for i in range(4)]
+
+
+class HashEmbedding:
+    """Deterministic unit vectors instead of the sentence embedding model"""
+    async def encode_many(self, texts):
+        vectors = np.stack([np.random.default_rng(len(text)).standard_normal(8) for text in texts])
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class WordTracker:
+    """Counts words instead of tokens, so no tokenizer has to be loaded"""
+    def __init__(self, model_name):
+        pass
+
+    def count_tokens_batch(self, texts):
+        return [len(text.split()) for text in texts]
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch, nltk_resources):
+    monkeypatch.setattr(embedding_service, "EmbeddingService", HashEmbedding)
+    monkeypatch.setattr(model_output_comparison, "EmbeddingService", HashEmbedding)
+    monkeypatch.setattr(token_tracker, "TokenTracker", WordTracker)
+    path = tmp_path / "corpus.jsonl"
+    path.write_text("".join(json.dumps({"id": str(i), "prompt": prompt}) + "\n" for i, prompt in enumerate(PROMPTS)))
+    return str(path)
+
+
+def evaluate(monkeypatch, server, corpus, out, **options):
+    # run() closes the client when it is done
+    monkeypatch.setattr(llm_client, "_llm_client", LLMClient(api_key="fake", base_url=server.base_url, max_retries=0))
+    asyncio.run(evaluation.run(corpus, out, **{"chunk_size": 2, "judge": False, **options}))
+
+
+def test_resume_retries_failed_prompts(monkeypatch, fake_openai, corpus, tmp_path):
+    out = str(tmp_path / "results.parquet")
+    working, failing = fake_openai(), fake_openai(error_rate=1.0)
+
+    evaluate(monkeypatch, working, corpus, out, limit=2)
+    evaluate(monkeypatch, failing, corpus, out)
+    assert evaluation.completed_ids(out) == {"0", "1"}
+    assert failing.requests == 4  # the last two prompts, original and trimmed
+
+    evaluate(monkeypatch, working, corpus, out)
+    assert working.requests == 8
+    assert evaluation.completed_ids(out) == {"0", "1", "2", "3"}
+
+    rows = pq.read_table(out).to_pylist()
+    assert [row["id"] for row in rows] == ["0", "1", "2", "3"]
+    assert all(row["error"] is None and row["original_answer"] for row in rows)
+    assert all(row["similarity_cosine"] is not None for row in rows)
+
+
+def test_nothing_left_to_do(monkeypatch, fake_openai, corpus, tmp_path):
+    out = str(tmp_path / "results.parquet")
+    server = fake_openai()
+
+    evaluate(monkeypatch, server, corpus, out)
+    evaluate(monkeypatch, server, corpus, out)
+    assert server.requests == 8
+    assert pq.read_table(out).num_rows == 4
+
+
+def test_adaptive_budgets_use_the_evaluated_model(monkeypatch, corpus):
+    from services import trim_planner
+
+    calls = []
+
+    async def plan_trim(text, budget, model_name):
+        calls.append((text, budget, model_name))
+        return SimpleNamespace(text=text)
+
+    monkeypatch.setattr(trim_planner, "plan_trim", plan_trim)
+    monkeypatch.setattr(llm_client, "_llm_client", LLMClient(api_key="fake", base_url="http://127.0.0.1:9/v1"))
+    evaluator = evaluation.Evaluator(backend="adaptive", target_tokens=10, model="gpt-4o")
+
+    assert asyncio.run(evaluator._trim(PROMPTS[0])) == PROMPTS[0]
+    assert calls == [(PROMPTS[0], 10, "gpt-4o")]
+
+
+def test_unjudged_pairs_are_retried(monkeypatch, fake_openai, corpus, tmp_path):
+    out = str(tmp_path / "results.parquet")
+    server = fake_openai()
+    judge = model_output_comparison.ModelOutputComparison.gpt_similarity_batch
+
+    async def no_scores(self, triples):
+        return [None] * len(triples)
+
+    monkeypatch.setattr(model_output_comparison.ModelOutputComparison, "gpt_similarity_batch", no_scores)
+    evaluate(monkeypatch, server, corpus, out, judge=True)
+    rows = pq.read_table(out).to_pylist()
+    assert all(row["error"] == "JudgeError: no score" and row["similarity_gpt"] is None for row in rows)
+    assert evaluation.completed_ids(out) == set()
+
+    monkeypatch.setattr(model_output_comparison.ModelOutputComparison, "gpt_similarity_batch", judge)
+    evaluate(monkeypatch, server, corpus, out, judge=True)
+    rows = pq.read_table(out).to_pylist()
+    assert all(row["error"] is None and row["similarity_gpt"] is not None for row in rows)
+
+
+def test_model_trims_wait_for_the_compression_queue(monkeypatch, fake_openai, corpus, tmp_path):
+    from services import prompt_trimmer2
+
+    class SlowCompressor:
+        def compress_prompt(self, prompt, rate=None, target_token=None):
+            time.sleep(0.01)
+            return {"compressed_prompt": prompt[:20], "origin_tokens": 10, "compressed_tokens": 4}
+
+    monkeypatch.setattr(prompt_trimmer2.PromptCompressionService, "_instance", None)
+    monkeypatch.setattr(prompt_trimmer2.PromptCompressionService, "_max_queue_size", 2)
+    monkeypatch.setattr(prompt_trimmer2.PromptCompressionService, "_max_batch_size", 1)
+    monkeypatch.setattr(prompt_trimmer2, "get_compressor", SlowCompressor)
+    out = str(tmp_path / "results.parquet")
+
+    evaluate(monkeypatch, fake_openai(), corpus, out, backend="llmlingua", chunk_size=4)
+    rows = pq.read_table(out).to_pylist()
+    assert [row["error"] for row in rows] == [None] * 4
+    assert all(row["optimized_prompt"] == row["prompt"][:20] for row in rows)
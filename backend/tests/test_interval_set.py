@@ -0,0 +1,84 @@
+import random
+
+from services.prompt_trimmer import IntervalSet
+
+
+def covered(spans):
+    return {point for start, end in spans for point in range(start, end)}
+
+
+def assert_matches(intervals, added):
+    spans = list(intervals)
+    assert covered(spans) == covered(added)
+    # Sorted, non-empty and separated by gaps, so touching spans were merged
+    assert all(start < end for start, end in spans)
+    assert all(spans[i][1] < spans[i + 1][0] for i in range(len(spans) - 1))
+
+
+def test_empty_set_overlaps_nothing():
+    intervals = IntervalSet()
+    assert list(intervals) == []
+    assert not intervals.overlaps(0, 1)
+
+
+def test_single_span():
+    intervals = IntervalSet()
+    intervals.add(3, 4)
+    assert list(intervals) == [(3, 4)]
+    assert intervals.overlaps(3, 4)
+    assert not intervals.overlaps(2, 3)
+    assert not intervals.overlaps(4, 5)
+
+
+def test_touching_spans_merge():
+    intervals = IntervalSet()
+    for start in range(0, 20, 2):
+        intervals.add(start, start + 2)
+    assert list(intervals) == [(0, 20)]
+
+
+def test_span_covering_others_replaces_them():
+    intervals = IntervalSet()
+    for start in (2, 6, 10):
+        intervals.add(start, start + 1)
+    intervals.add(0, 12)
+    assert list(intervals) == [(0, 12)]
+
+
+def test_random_operations_match_point_sets():
+    rng = random.Random(0)
+    for _ in range(300):
+        intervals, added = IntervalSet(), []
+        for _ in range(rng.randint(0, 30)):
+            start = rng.randint(0, 60)
+            end = start + rng.randint(1, 8)
+            points = covered(added)
+            assert intervals.overlaps(start, end) == any(point in points for point in range(start, end))
+            intervals.add(start, end)
+            added.append((start, end))
+            assert_matches(intervals, added)
+
+
+def naive_non_overlapping_chunks(chunks):
+    used, kept = set(), []
+    for chunk, positions, occurrences in chunks:
+        spans = [set(range(pos, pos + len(chunk))) for pos in positions]
+        if not any(span & used for span in spans):
+            kept.append((chunk, positions, occurrences))
+            for span in spans:
+                used |= span
+    return kept
+
+
+def test_find_non_overlapping_chunks_matches_naive_filter():
+    from services.prompt_trimmer import TextProcessor
+
+    rng = random.Random(1)
+    for _ in range(200):
+        chunks = []
+        for _ in range(rng.randint(0, 15)):
+            chunk = "x" * rng.randint(1, 10)
+            positions = sorted(rng.sample(range(100), rng.randint(1, 4)))
+            chunks.append((chunk, positions, len(positions)))
+        # The filter does not touch any processor state
+        assert TextProcessor.find_non_overlapping_chunks(None, chunks) == naive_non_overlapping_chunks(chunks)
@@ -0,0 +1,55 @@
+import asyncio
+
+from services import model_output_comparison
+from services.judge_cache import JudgeCache
+from services.metrics import CACHE_LOOKUPS
+from services.model_output_comparison import JUDGE_MODEL, ModelOutputComparison
+
+CACHED = ("What is 2 + 2?", "4", "Four")
+UNCACHED = ("What is 3 + 3?", "6", "Six")
+
+
+def lookups(result: str) -> float:
+    return CACHE_LOOKUPS._values.get(CACHE_LOOKUPS._key({"cache": "judge", "result": result}), 0.0)
+
+
+def test_lookups_are_counted_per_requested_pair(monkeypatch):
+    cache = JudgeCache(":memory:")
+    cache.put_many([(JudgeCache.key(JUDGE_MODEL, *CACHED), 0.75)])
+    monkeypatch.setattr(model_output_comparison, "get_judge_cache", lambda: cache)
+    monkeypatch.setattr(model_output_comparison, "EmbeddingService", lambda: None)
+    hits, misses = lookups("hit"), lookups("miss")
+
+    scores = asyncio.run(ModelOutputComparison().gpt_similarity_batch([CACHED, CACHED]))
+
+    assert scores == [0.75, 0.75]
+    assert lookups("hit") - hits == 2
+    assert lookups("miss") - misses == 0
+    assert cache.get_stats().hits == 2
+
+
+def test_keys_separate_models_and_fields():
+    assert JudgeCache.key(JUDGE_MODEL, *CACHED) != JudgeCache.key("gpt-4o", *CACHED)
+    assert JudgeCache.key(JUDGE_MODEL, "ab", "c", "d") != JudgeCache.key(JUDGE_MODEL, "a", "bc", "d")
+    assert JudgeCache.key(JUDGE_MODEL, *CACHED) != JudgeCache.key(JUDGE_MODEL, *UNCACHED)
+
+
+def test_unjudged_pairs_are_none_and_not_cached(monkeypatch):
+    cache = JudgeCache(":memory:")
+    cache.put_many([(JudgeCache.key(JUDGE_MODEL, *CACHED), 0.75)])
+    monkeypatch.setattr(model_output_comparison, "get_judge_cache", lambda: cache)
+    monkeypatch.setattr(model_output_comparison, "EmbeddingService", lambda: None)
+    comparison = ModelOutputComparison()
+
+    async def no_batch_scores(triples):
+        return {}
+
+    async def no_score(*triple):
+        return None
+
+    monkeypatch.setattr(comparison, "_judge_batch", no_batch_scores)
+    monkeypatch.setattr(comparison, "_judge", no_score)
+
+    assert asyncio.run(comparison.gpt_similarity_batch([UNCACHED, CACHED])) == [None, 0.75]
+    assert asyncio.run(comparison.gpt_similarity(*UNCACHED)) is None
+    assert cache.get_many([JudgeCache.key(JUDGE_MODEL, *UNCACHED)]) == {}
@@ -0,0 +1,79 @@
+import asyncio
+
+import openai
+import pytest
+
+from services.llm_client import LLMClient, ModelLimits
+
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+
+def client_for(server, **options) -> LLMClient:
+    return LLMClient(api_key="fake", base_url=server.base_url, backoff_base=0.0, backoff_max=0.0, **options)
+
+
+def test_retries_wait_for_the_request_bucket(fake_openai):
+    server = fake_openai(error_rate=1.0, retry_after=0.0)
+    limits = {"gpt-4o-mini": ModelLimits(requests_per_minute=2)}
+
+    async def run():
+        client = client_for(server, max_retries=4, model_limits=limits)
+        try:
+            # Two attempts fit in the bucket; the third has to wait 30 seconds for a refill
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(client.chat(MESSAGES), timeout=2.0)
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
+    assert server.requests == 2
+
+
+def test_streams_wait_for_the_request_bucket(fake_openai):
+    server = fake_openai(error_rate=1.0, retry_after=0.0)
+    limits = {"gpt-4o-mini": ModelLimits(requests_per_minute=2)}
+
+    async def consume(client):
+        async for _ in client.chat_stream(MESSAGES):
+            pass
+
+    async def run():
+        client = client_for(server, max_retries=4, model_limits=limits)
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(consume(client), timeout=2.0)
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
+    assert server.requests == 2
+
+
+def test_gives_up_after_max_retries(fake_openai):
+    server = fake_openai(error_rate=1.0, retry_after=0.0)
+
+    async def run():
+        client = client_for(server, max_retries=2)
+        try:
+            with pytest.raises(openai.APIStatusError):
+                await client.chat(MESSAGES)
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
+    assert server.requests == 3
+
+
+def test_successful_call_returns_the_completion(fake_openai):
+    server = fake_openai()
+
+    async def run():
+        client = client_for(server)
+        try:
+            return await client.chat(MESSAGES)
+        finally:
+            await client.aclose()
+
+    response = asyncio.run(run())
+    assert response.choices[0].message.content == "Answer: Hello"
+    assert server.requests == 1
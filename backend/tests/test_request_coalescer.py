@@ -0,0 +1,73 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import numpy as np
+import pytest
+
+from benchmarks.fake_openai import fake_answer
+from services import request_coalescer
+from services.request_coalescer import RequestCoalescer
+
+PROMPT = "What is the capital city of France?"
+NEAR_DUPLICATE = "What is the capital city of France ?"
+
+
+class SameEmbedding:
+    """Embeds every text as the same vector, so all prompts are near-duplicates"""
+    async def encode(self, text: str) -> np.ndarray:
+        return np.ones(4, dtype=np.float32) / 2
+
+
+@pytest.fixture
+def coalescer(monkeypatch):
+    monkeypatch.setattr(RequestCoalescer, "_instance", None)
+    monkeypatch.setattr(request_coalescer, "EmbeddingService", SameEmbedding)
+    return RequestCoalescer()
+
+
+def run_concurrently(coalescer, prompts, **options):
+    calls = []
+
+    async def answer(prompt):
+        calls.append(prompt)
+        await asyncio.sleep(0.05)
+        return f"answer to {prompt}"
+
+    async def run():
+        return await asyncio.gather(
+            *(coalescer.run(prompt, lambda prompt=prompt: answer(prompt), **options) for prompt in prompts)
+        )
+
+    return asyncio.run(run()), calls
+
+
+def test_similar_prompts_share_the_leaders_result(coalescer):
+    results, calls = run_concurrently(coalescer, [PROMPT, NEAR_DUPLICATE])
+    assert calls == [PROMPT]
+    assert results == [f"answer to {PROMPT}"] * 2
+
+
+def test_exact_coalesces_identical_prompts_only(coalescer):
+    results, calls = run_concurrently(coalescer, [PROMPT, NEAR_DUPLICATE, PROMPT], exact=True)
+    assert calls == [PROMPT, NEAR_DUPLICATE]
+    assert results == [f"answer to {PROMPT}", f"answer to {NEAR_DUPLICATE}", f"answer to {PROMPT}"]
+    assert (coalescer.leaders, coalescer.coalesced) == (2, 1)
+
+
+def test_compare_mode_answers_near_duplicates_separately(app_server, coalescer):
+    server = app_server(latency=0.3)
+
+    def optimize(prompt):
+        response = httpx.post(
+            f"{server.url}/optimize-prompt", json={"prompt": prompt, "backend": "rules"}, timeout=30
+        )
+        response.raise_for_status()
+        return response.json()
+
+    with ThreadPoolExecutor(2) as pool:
+        first, second = pool.map(optimize, [PROMPT, NEAR_DUPLICATE])
+
+    assert first["originalAnswer"] == fake_answer(PROMPT)
+    assert second["originalAnswer"] == fake_answer(NEAR_DUPLICATE)
+    assert server.fake.requests == 4
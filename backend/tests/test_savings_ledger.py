@@ -0,0 +1,156 @@
+from datetime import datetime, timezone
+import asyncio
+import sqlite3
+
+import pytest
+
+import main
+from services.savings_ledger import LEDGER_WINDOW_SECONDS, LedgerEntry, SavingsLedger, SavingsTotals
+
+HOUR = 100 * LEDGER_WINDOW_SECONDS  # start of a window
+
+
+def entry(timestamp: float, model: str, savings: int) -> LedgerEntry:
+    return LedgerEntry(
+        timestamp=timestamp,
+        model=model,
+        original_tokens=savings * 2,
+        optimized_tokens=savings,
+        token_savings=savings,
+        energy_saved_wh=savings / 10,
+        cost_saved_dollars=savings / 1000,
+    )
+
+
+ENTRIES = [
+    entry(HOUR + 10, "gpt-4o", 10),
+    entry(HOUR + 20, "gpt-4o-mini", 20),
+    entry(HOUR + LEDGER_WINDOW_SECONDS + 5, "gpt-4o", 30),
+]
+
+
+@pytest.fixture
+def ledger(monkeypatch, tmp_path):
+    monkeypatch.setattr(SavingsLedger, "_instance", None)
+    return SavingsLedger(str(tmp_path / "ledger.sqlite3"))
+
+
+def record_all(ledger):
+    for item in ENTRIES:
+        ledger.record(item)
+
+
+def savings(totals: SavingsTotals) -> tuple:
+    return totals.requests, totals.token_savings
+
+
+def test_flush_writes_entries_and_window_aggregates(ledger):
+    record_all(ledger)
+    assert (ledger.recorded, ledger.flushed) == (3, 0)
+
+    asyncio.run(ledger.flush())
+    assert (ledger.recorded, ledger.flushed) == (3, 3)
+    assert ledger._pending == [] and ledger._pending_windows == {}
+
+    connection = sqlite3.connect(ledger.path)
+    assert connection.execute("SELECT token_savings FROM entries ORDER BY timestamp").fetchall() == [(10,), (20,), (30,)]
+    windows = connection.execute(
+        "SELECT window_start, model, requests, token_savings FROM windows ORDER BY window_start, model"
+    ).fetchall()
+    assert windows == [
+        (HOUR, "gpt-4o", 1, 10),
+        (HOUR, "gpt-4o-mini", 1, 20),
+        (HOUR + LEDGER_WINDOW_SECONDS, "gpt-4o", 1, 30),
+    ]
+
+    # A later flush adds to the aggregates of the same window
+    ledger.record(entry(HOUR + 30, "gpt-4o", 5))
+    asyncio.run(ledger.flush())
+    assert connection.execute(
+        "SELECT requests, token_savings FROM windows WHERE window_start = ? AND model = 'gpt-4o'", (HOUR,)
+    ).fetchone() == (2, 15)
+
+
+@pytest.mark.parametrize("flushed", [False, True])
+def test_totals(ledger, flushed):
+    record_all(ledger)
+    if flushed:
+        asyncio.run(ledger.flush())
+
+    total, groups = asyncio.run(ledger.totals())
+    assert savings(total) == (3, 60) and groups == {}
+    assert total.energy_saved_wh == pytest.approx(6.0)
+
+    _, groups = asyncio.run(ledger.totals(group_by="model"))
+    assert {key: savings(totals) for key, totals in groups.items()} == {("gpt-4o",): (2, 40), ("gpt-4o-mini",): (1, 20)}
+
+    _, groups = asyncio.run(ledger.totals(group_by="window"))
+    assert {key: savings(totals) for key, totals in groups.items()} == {
+        (HOUR,): (2, 30), (HOUR + LEDGER_WINDOW_SECONDS,): (1, 30),
+    }
+
+    assert savings(asyncio.run(ledger.totals(model="gpt-4o"))[0]) == (2, 40)
+    # since and until are widened to the windows they fall in
+    assert savings(asyncio.run(ledger.totals(since=HOUR + 15))[0]) == (3, 60)
+    assert savings(asyncio.run(ledger.totals(since=HOUR + LEDGER_WINDOW_SECONDS))[0]) == (1, 30)
+    assert savings(asyncio.run(ledger.totals(until=HOUR + 15))[0]) == (2, 30)
+    assert savings(asyncio.run(ledger.totals(until=HOUR - 1))[0]) == (0, 0)
+
+    with pytest.raises(ValueError):
+        asyncio.run(ledger.totals(group_by="day"))
+
+
+def test_failed_flush_requeues_entries(ledger, monkeypatch):
+    record_all(ledger)
+    write = ledger._write
+
+    def fail(entries, windows):
+        ledger.record(entry(HOUR + 40, "gpt-4o", 7))  # recorded while the write is running
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(ledger, "_write", fail)
+    asyncio.run(ledger.flush())
+    assert ledger.flushed == 0
+    assert [item.token_savings for item in ledger._pending] == [10, 20, 30, 7]
+    assert savings(ledger._pending_windows[(HOUR, "gpt-4o")]) == (2, 17)
+    assert savings(asyncio.run(ledger.totals())[0]) == (4, 67)
+
+    monkeypatch.setattr(ledger, "_write", write)
+    asyncio.run(ledger.flush())
+    assert ledger.flushed == 4 and ledger._pending == []
+    assert savings(asyncio.run(ledger.totals())[0]) == (4, 67)
+
+
+def test_close_stops_the_flush_task_and_writes_the_rest(ledger):
+    async def run(entries):
+        ledger.start()
+        task = ledger._flush_task
+        for item in entries:
+            ledger.record(item)
+        await asyncio.sleep(0)  # the flush task is waiting for its interval
+        await ledger.close()
+        assert task.cancelled() and ledger._flush_task is None
+
+    asyncio.run(run([]))
+    asyncio.run(run(ENTRIES))
+    assert ledger.flushed == 3
+    assert sqlite3.connect(ledger.path).execute("SELECT COUNT(*) FROM entries").fetchone() == (3,)
+
+
+def test_savings_endpoint_groups(ledger):
+    record_all(ledger)
+    asyncio.run(ledger.flush())
+
+    response = asyncio.run(main.get_savings(groupBy="window", savings_ledger=ledger))
+    assert response["windowSeconds"] == LEDGER_WINDOW_SECONDS
+    assert response["totals"]["token_savings"] == 60
+    assert [group["windowStart"] for group in response["groups"]] == [
+        datetime.fromtimestamp(HOUR, timezone.utc).isoformat(),
+        datetime.fromtimestamp(HOUR + LEDGER_WINDOW_SECONDS, timezone.utc).isoformat(),
+    ]
+
+    response = asyncio.run(main.get_savings(
+        since=datetime.fromtimestamp(HOUR, timezone.utc), model="gpt-4o-mini", groupBy="model", savings_ledger=ledger,
+    ))
+    assert response["groups"] == [{"model": "gpt-4o-mini", **response["totals"]}]
+    assert response["totals"]["requests"] == 1
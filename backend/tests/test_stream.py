@@ -0,0 +1,100 @@
+import json
+import time
+
+import httpx
+
+from benchmarks.fake_openai import fake_answer
+
+PROMPT = "Please explain in a few words why the sky is blue and why sunsets are red"
+
+
+def read_events(server, body):
+    with httpx.stream("POST", f"{server.url}/optimize-prompt/stream", json=body, timeout=30) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        return [json.loads(line) for line in response.iter_lines() if line]
+
+
+def test_prompt_then_deltas_then_usage(app_server):
+    server = app_server()
+    events = read_events(server, {"prompt": PROMPT, "backend": "rules"})
+
+    assert [event["type"] for event in events[:1] + events[-1:]] == ["prompt", "usage"]
+    assert {event["type"] for event in events[1:-1]} == {"delta"}
+    optimized_prompt = events[0]["optimizedPrompt"]
+    assert events[0]["trimReport"]["backend"] == "rules"
+
+    answers = {"original": "", "optimized": ""}
+    for event in events[1:-1]:
+        answers[event["answer"]] += event["content"]
+    assert answers == {"original": fake_answer(PROMPT), "optimized": fake_answer(optimized_prompt)}
+
+    for name in ("original", "optimized"):
+        usage = events[-1][name]
+        assert usage["total_tokens"] == usage["prompt_tokens"] + usage["completion_tokens"] > 0
+    assert server.cache.saved == [(PROMPT, answers["optimized"])]
+
+
+def test_stream_error_ends_with_an_error_record(app_server):
+    server = app_server(error_rate=1.0, retry_after=0.0)
+    events = read_events(server, {"prompt": PROMPT, "backend": "rules"})
+
+    assert [event["type"] for event in events] == ["prompt", "error"]
+    assert "Injected error" in events[-1]["message"]
+    assert server.cache.saved == []
+
+
+def test_client_disconnect_closes_the_upstream_streams(app_server):
+    from services.llm_client import get_llm_client
+
+    server = app_server(token_latency=0.5)
+    client = get_llm_client()
+    free_slots = client._semaphore._value
+
+    with httpx.stream("POST", f"{server.url}/optimize-prompt/stream", json={"prompt": PROMPT}, timeout=30) as response:
+        lines = response.iter_lines()
+        assert json.loads(next(lines))["type"] == "prompt"
+        assert json.loads(next(lines))["type"] == "delta"
+
+    # Both streams give back their concurrency slots long before they would have ended
+    deadline = time.monotonic() + 2
+    while client._semaphore._value < free_slots and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert client._semaphore._value == free_slots
+    assert server.cache.saved == []
+
+
+def test_merged_streams_fail_as_soon_as_one_fails():
+    import asyncio
+
+    from main import merge_answer_streams
+
+    closed = []
+
+    async def slow():
+        try:
+            while True:
+                yield "slow"
+                await asyncio.sleep(0.05)
+        finally:
+            closed.append("slow")
+
+    async def failing():
+        yield "first"
+        await asyncio.sleep(0.1)
+        raise RuntimeError("stream broke")
+
+    async def run():
+        received = []
+        start = asyncio.get_running_loop().time()
+        try:
+            async for name, delta in merge_answer_streams(slow=slow(), failing=failing()):
+                received.append((name, delta))
+        except RuntimeError as e:
+            return str(e), received, asyncio.get_running_loop().time() - start
+
+    message, received, elapsed = asyncio.run(asyncio.wait_for(run(), timeout=5))
+    assert message == "stream broke"
+    assert ("failing", "first") in received and ("slow", "slow") in received
+    assert elapsed < 1
+    assert closed == ["slow"]
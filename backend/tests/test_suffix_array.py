@@ -0,0 +1,47 @@
+import random
+
+import pytest
+
+from services.prompt_trimmer import SuffixArray, _sa_is
+
+
+def naive_suffix_array(text):
+    return sorted(range(len(text)), key=lambda i: text[i:])
+
+
+def naive_lcp(text, suffix_array):
+    lcp = [0] * len(text)
+    for rank in range(len(suffix_array) - 1):
+        a, b = text[suffix_array[rank]:], text[suffix_array[rank + 1]:]
+        while lcp[rank] < min(len(a), len(b)) and a[lcp[rank]] == b[lcp[rank]]:
+            lcp[rank] += 1
+    return lcp
+
+
+EDGE_CASES = ["", "a", "aa", "ab", "ba", "aaaaaaaaaaaaaaaaaaaa", "abababababababababab", "abcabcabcabcabcabc",
+              "mississippi", "banana", "zyxwvutsrqponmlkjihgfedcba", "the cat and the cat and the cat"]
+
+
+@pytest.mark.parametrize("text", EDGE_CASES)
+def test_edge_cases_match_naive_sorting(text):
+    suffix_array = SuffixArray(text).build_suffix_array()
+    assert suffix_array == naive_suffix_array(text)
+    assert SuffixArray(text).build_lcp_array(suffix_array) == naive_lcp(text, suffix_array)
+
+
+@pytest.mark.parametrize("alphabet", ["ab", "abc", "abcdefghij", "aab ", "éa€b"])
+def test_random_strings_match_naive_sorting(alphabet):
+    rng = random.Random(alphabet)
+    for _ in range(300):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 200)))
+        suffix_array = SuffixArray(text).build_suffix_array()
+        assert suffix_array == naive_suffix_array(text), text
+        assert SuffixArray(text).build_lcp_array(suffix_array) == naive_lcp(text, suffix_array), text
+
+
+def test_integer_sequences_with_unused_values():
+    rng = random.Random(0)
+    for _ in range(200):
+        upper = rng.randint(0, 20)
+        sequence = [rng.randint(0, upper) for _ in range(rng.randint(0, 100))]
+        assert _sa_is(sequence, upper) == naive_suffix_array(sequence)
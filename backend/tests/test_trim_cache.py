@@ -0,0 +1,65 @@
+import pytest
+
+from services import prompt_trimmer
+from services.trim_cache import TrimCache, options_fingerprint
+
+TEXT = "The report of the results of the runners"
+
+
+def test_key_covers_language_and_every_option(nltk_resources):
+    processor = prompt_trimmer.get_text_processor()
+    default = processor._cache_key(TEXT, {})
+    variants = [{"stemmer": "porter"}, {"stemmer": "lancaster"}] + [
+        {name: not value if isinstance(value, bool) else value + 1}
+        for name, value in prompt_trimmer.TRIM_DEFAULTS.items()
+        if name != "stemmer"
+    ]
+    keys = [processor._cache_key(TEXT, options) for options in variants]
+    assert len(set(keys)) == len(variants) and default not in keys
+
+    assert processor._cache_key(TEXT, dict(prompt_trimmer.TRIM_DEFAULTS)) == default
+    assert processor._cache_key(TEXT + ".", {}) != default
+    assert TrimCache.key(TEXT, options_fingerprint("german", prompt_trimmer.TRIM_DEFAULTS)) != default
+    with pytest.raises(TypeError):
+        processor._cache_key(TEXT, {"rate": 0.5})
+
+
+def test_cached_result_is_reused_per_options(nltk_resources, monkeypatch):
+    monkeypatch.setattr(prompt_trimmer, "_trim_cache", TrimCache())
+    processor = prompt_trimmer.get_text_processor()
+    key = processor._cache_key(TEXT, {})
+    prompt_trimmer.get_trim_cache().put(key, "cached", 0.25)
+
+    assert prompt_trimmer.get_trim_cache().get(key) == "cached"
+    assert prompt_trimmer.get_trim_cache().get(processor._cache_key(TEXT, {"stemmer": "porter"})) is None
+    stats = prompt_trimmer.get_trim_cache().get_stats()
+    assert (stats.hits, stats.misses, stats.time_saved_seconds) == (1, 1, 0.25)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TrimCache(max_entries=2)
+    first, second, third = (TrimCache.key(text, ("english",)) for text in "abc")
+    cache.put(first, "1", 0.1)
+    cache.put(second, "2", 0.1)
+    assert cache.get(first) == "1"  # second is now the least recently used
+
+    cache.put(third, "3", 0.1)
+    assert cache.get(second) is None
+    assert (cache.get(first), cache.get(third)) == ("1", "3")
+    assert cache.get_stats().evictions == 1
+
+
+def test_size_bound_evicts_by_characters():
+    cache = TrimCache(max_entries=10, max_chars=10)
+    keys = [TrimCache.key(str(i), ()) for i in range(4)]
+    for key in keys[:3]:
+        cache.put(key, "x" * 4, 0.0)
+    assert cache.get(keys[0]) is None
+    assert cache.get_stats().chars == 8
+
+    cache.put(keys[1], "y" * 2, 0.0)  # overwriting releases the old size
+    assert cache.get_stats().chars == 6
+
+    cache.put(keys[3], "z" * 11, 0.0)  # larger than the whole cache, not stored
+    assert cache.get(keys[3]) is None
+    assert cache.get_stats().entries == 2
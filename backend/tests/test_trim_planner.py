@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from services import trim_planner
+from services.prompt_trimmer import TRIM_PASSES, get_text_processor
+
+TEXT = (
+    "Well,   the report   of the results , the runners ran quickly .  "
+    "The results of the runners were reported in the report of the results of the runners ."
+)
+
+
+class WordTracker:
+    """Counts words as tokens, tiktoken encodings may not be downloadable"""
+    def __init__(self, model_name=None):
+        pass
+
+    def count_tokens(self, text):
+        return len(text.split())
+
+
+@pytest.fixture
+def planner(monkeypatch, nltk_resources):
+    monkeypatch.setattr(trim_planner, "TokenTracker", WordTracker)
+    monkeypatch.setattr(trim_planner, "get_trim_pool", lambda: None)  # rule passes on a thread of this process
+    return trim_planner
+
+
+def plan(text, budget, **kwargs):
+    return asyncio.run(trim_planner.plan_trim(text, budget, use_model=False, **kwargs))
+
+
+def test_without_budget_every_rule_pass_runs_in_order(planner):
+    result = plan(TEXT, None)
+    assert [report.name for report in result.passes] == list(TRIM_PASSES)
+    assert result.original_tokens == 29
+    assert result.tokens == result.passes[-1].tokens == len(result.text.split())
+    assert [report.tokens for report in result.passes] == sorted((r.tokens for r in result.passes), reverse=True)
+    assert result.budget_met
+
+
+def test_passes_stop_once_the_budget_is_met(planner):
+    result = plan(TEXT, 26)
+    assert [report.name for report in result.passes] == ["whitespace", "punctuation"]
+    assert result.tokens == 26 and result.budget_met
+
+    result = plan(TEXT, 12)
+    assert [report.name for report in result.passes] == ["whitespace", "punctuation", "stopwords"]
+    assert "the" not in result.text.split()
+
+
+def test_text_within_budget_is_left_alone(planner):
+    result = plan(TEXT, 100)
+    assert result.passes == [] and result.text == TEXT
+
+
+def test_unreachable_budget_without_model_reports_not_met(planner):
+    result = plan(TEXT, 1)
+    assert [report.name for report in result.passes] == list(TRIM_PASSES)
+    assert not result.budget_met and not result.fallback
+
+
+def test_budget_must_be_positive(planner):
+    with pytest.raises(ValueError):
+        plan(TEXT, 0)
+
+
+def test_chunks_pass_keeps_single_spaces(nltk_resources):
+    processor = get_text_processor()
+    phrase = "results of runners"
+    assert processor.trim_pass("chunks", f"{phrase} a {phrase} b {phrase} c") == f"{phrase} a b {phrase} c"
+    assert processor.trim_pass("chunks", f"a {phrase} b {phrase} c {phrase}") == f"a {phrase} b {phrase} c"
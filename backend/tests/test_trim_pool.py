@@ -0,0 +1,36 @@
+import asyncio
+import random
+
+import pytest
+
+from services import prompt_trimmer
+
+OPTIONS = [{}, {"stemmer": "porter"}, {"remove_stopwords": False, "remove_spaces": False}]
+
+
+@pytest.fixture
+def pool(monkeypatch, nltk_resources):
+    """A fresh two-process trim pool and an empty trim cache"""
+    prompt_trimmer.shutdown_trim_pool()
+    monkeypatch.setattr(prompt_trimmer, "TRIM_POOL_WORKERS", 2)
+    monkeypatch.setattr(prompt_trimmer, "_trim_cache", None)
+    yield prompt_trimmer.get_trim_pool()
+    prompt_trimmer.shutdown_trim_pool()
+
+
+def texts():
+    rng = random.Random(0)
+    vocabulary = ["the", "a", "running", "runners", "quickly", "data", "isn't", "report", "of", "results", ",", "."]
+    sentence = " ".join(rng.choice(vocabulary) for _ in range(12))
+    return [" ".join(rng.choice(vocabulary) for _ in range(rng.randint(0, 80))) + f" {sentence} {sentence}" for _ in range(20)]
+
+
+def test_pool_matches_inline_trimming(pool):
+    processor = prompt_trimmer.get_text_processor()
+    prompts = texts()
+    for options in OPTIONS:
+        expected = [processor.trim(text, **options) for text in prompts]
+
+        assert processor.trim_many(prompts, **options) == expected
+        prompt_trimmer._trim_cache = None  # answer from the pool again, not from the cache
+        assert asyncio.run(processor.trim_many_async(prompts, **options)) == expected
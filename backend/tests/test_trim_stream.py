@@ -0,0 +1,57 @@
+import io
+import random
+
+import pytest
+
+from services.prompt_trimmer import TextProcessor
+
+PHRASE = "quantum flux capacitor requires careful calibration"
+KEEP_WORDS = dict(remove_spaces=False, remove_stopwords=False, remove_punctuation=False)
+
+
+def filler(tag, n):
+    return " ".join(f"{tag}{chr(97 + i % 26)}{chr(97 + i // 26)}" for i in range(n))
+
+
+# The phrase occurs three times; the first occurrence ends up in the first 180 character block
+REPEATED = f"{filler('x', 30)} {PHRASE} {filler('y', 10)} {PHRASE} {filler('z', 10)} {PHRASE} end"
+
+
+@pytest.fixture
+def processor(nltk_resources):
+    from services.prompt_trimmer import get_text_processor
+
+    return get_text_processor()
+
+
+def stream(processor, text, **options):
+    return "".join(processor.trim_stream([text], **{**KEEP_WORDS, **options}))
+
+
+def test_block_boundary_after_leading_whitespace():
+    assert TextProcessor._block_boundary(" " + "a" * 99, 50) == 1
+    assert TextProcessor._block_boundary("ab cd ef", 6) == 6
+    assert TextProcessor._block_boundary("a" * 99, 50) == 50
+
+
+def test_repeat_spanning_two_blocks_is_removed(processor):
+    trimmed = stream(processor, REPEATED, block_size=180, window_size=1000)
+    assert trimmed.count(PHRASE) == processor.trim(REPEATED, **KEEP_WORDS).count(PHRASE)
+    assert trimmed.count(PHRASE) < stream(processor, REPEATED, block_size=180, window_size=0).count(PHRASE)
+
+
+def test_repeats_older_than_the_window_are_kept(processor):
+    bounded = stream(processor, REPEATED, block_size=180, window_size=20)
+    assert bounded == stream(processor, REPEATED, block_size=180, window_size=0)
+
+
+def test_blocks_never_split_words(processor):
+    rng = random.Random(0)
+    words = ["".join(rng.choice("abcdefgh") for _ in range(rng.randint(1, 12))) for _ in range(2_000)]
+    text = "".join(word + rng.choice([" ", "  ", "\n", "\t"]) for word in words)
+    options = dict(remove_chunks=False, remove_stopwords=False, remove_punctuation=False, remove_spaces=False)
+
+    expected = processor.trim(text, **options)
+    pieces = [text[i:i + 97] for i in range(0, len(text), 97)]
+    assert "".join(processor.trim_stream(pieces, block_size=64, **options)) == expected
+    assert "".join(processor.trim_stream(io.StringIO(text), block_size=64, **options)) == expected
@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+
+from services.vector_index import ExactVectorIndex, IVFVectorIndex, normalize
+
+
+def clustered(rng, n, dim=32, clusters=40, spread=0.15):
+    centers = normalize(rng.standard_normal((clusters, dim)))
+    labels = rng.integers(clusters, size=n)
+    return normalize(centers[labels] + spread * rng.standard_normal((n, dim)))
+
+
+def fill(index, vectors):
+    for vector in vectors:
+        index.add(vector)
+
+
+def external(capacity, dim=32):
+    return np.zeros((capacity, dim), dtype=np.float32), np.zeros(capacity, dtype=bool)
+
+
+def test_default_training_size_fits_an_external_matrix():
+    matrix, valid = external(10_000)
+    index = IVFVectorIndex(32, matrix=matrix, valid=valid)
+    assert index.train_size <= 10_000 // 2
+
+
+def test_unreachable_training_size_fails_at_construction():
+    matrix, valid = external(1_000)
+    with pytest.raises(ValueError):
+        IVFVectorIndex(32, matrix=matrix, valid=valid, train_size=2_000)
+
+
+def test_matches_exact_index_before_training():
+    rng = np.random.default_rng(0)
+    vectors = clustered(rng, 200)
+    exact, ivf = ExactVectorIndex(32), IVFVectorIndex(32, n_lists=16, train_size=1_000)
+    fill(exact, vectors)
+    fill(ivf, vectors)
+    for query in clustered(rng, 50):
+        assert ivf.search(query, k=3) == exact.search(query, k=3)
+
+
+def test_recall_against_exact_index_once_trained():
+    rng = np.random.default_rng(1)
+    vectors = clustered(rng, 4_000)
+    matrix, valid = external(8_000)
+    ivf = IVFVectorIndex(32, matrix=matrix, valid=valid, n_lists=32, n_probe=8)
+    exact = ExactVectorIndex(32)
+    fill(ivf, vectors)
+    fill(exact, vectors)
+    assert ivf._centroids is not None  # trained with the default training size
+
+    queries = clustered(rng, 200)
+    recall = np.mean([ivf.search(query)[0][0] == exact.search(query)[0][0] for query in queries])
+    assert recall >= 0.9
+
+
+def test_removed_vectors_are_not_returned():
+    rng = np.random.default_rng(2)
+    vectors = clustered(rng, 600)
+    ivf = IVFVectorIndex(32, n_lists=8, train_size=400)
+    fill(ivf, vectors)
+    slot, _ = ivf.search(vectors[10])[0]
+    ivf.remove(slot)
+    assert all(found != slot for found, _ in ivf.search(vectors[10], k=5))
+
+
+def test_refresh_with_changed_slots_matches_a_full_refresh():
+    rng = np.random.default_rng(3)
+    matrix, valid = external(500)
+    writer, reader = ExactVectorIndex(32, matrix=matrix, valid=valid), ExactVectorIndex(32, matrix=matrix, valid=valid)
+    for round_ in range(5):
+        changed = set()
+        for vector in clustered(rng, 40):
+            changed.add(writer.add(vector))
+        for slot in rng.choice(writer.slots(), 15, replace=False).tolist():
+            writer.remove(slot)
+            changed.add(slot)
+        reader.refresh(np.array(sorted(changed)))
+
+        full = ExactVectorIndex(32, matrix=matrix, valid=valid)
+        assert len(reader) == len(full) == len(writer)
+        assert reader._size == full._size
+        slot = reader.free_slot()
+        assert not valid[slot]
+        query = clustered(rng, 1)[0]
+        assert reader.search(query, k=3) == full.search(query, k=3)
+
+
+def shared_ivf(path, matrix, valid):
+    return IVFVectorIndex(32, matrix=matrix, valid=valid, n_lists=16, train_size=400, state_dir=str(path))
+
+
+def test_shared_ivf_state_is_loaded_instead_of_retrained(tmp_path, monkeypatch):
+    rng = np.random.default_rng(4)
+    matrix, valid = external(2_000)
+    writer = shared_ivf(tmp_path, matrix, valid)
+    fill(writer, clustered(rng, 600))
+    assert writer._centroids is not None
+
+    # Another process opening the index, and picking up later writes, never trains
+    monkeypatch.setattr(IVFVectorIndex, "_train", lambda self: pytest.fail("retrained"))
+    reader = shared_ivf(tmp_path, matrix, valid)
+    np.testing.assert_array_equal(reader._centroids, writer._centroids)
+
+    changed = [writer.add(vector) for vector in clustered(rng, 50)]
+    removed, _ = writer.search(matrix[changed[0]])[0]
+    writer.remove(removed)
+    reader.refresh(np.array(changed))
+    for query in clustered(rng, 50):
+        assert reader.search(query, k=3) == writer.search(query, k=3)
+
+
+def test_retrained_centroids_reach_other_processes(tmp_path):
+    rng = np.random.default_rng(5)
+    matrix, valid = external(2_000)
+    writer = shared_ivf(tmp_path, matrix, valid)
+    fill(writer, clustered(rng, 450))
+    reader = shared_ivf(tmp_path, matrix, valid)
+
+    changed = [writer.add(vector) for vector in clustered(rng, 500)]  # doubles the data: retrains
+    assert writer._trained_at > 450
+    reader.refresh(np.array(changed))
+    np.testing.assert_array_equal(reader._centroids, writer._centroids)
+    for query in clustered(rng, 50):
+        assert reader.search(query, k=3) == writer.search(query, k=3)
@@ -39,8 +39,8 @@ interface AnalyzePromptRequest {
 
 interface AnalyzeResponse {
   energySavedWatts: number;
-  similarityScoreCosine: number;
-  similarityScoreGPT: number;
+  similarityScoreCosine: number | null;
+  similarityScoreGPT: number | null;
   originalTokens: number; // Add this line
   optimizedTokens: number;
 }